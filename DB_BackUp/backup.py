@@ -1,12 +1,24 @@
 import subprocess
 import datetime
 import configparser
+import gzip
+import hashlib
+import queue
+import re
+import shlex
+import shutil
+import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
 
 import requests
 import json
 import os
 
+from catalog import FULL, INCREMENTAL, BackupCatalog
+
 
 def send_feishu_notification(message, webhook_url):
     """
@@ -26,27 +38,331 @@ def send_feishu_notification(message, webhook_url):
         print(f"发送飞书通知失败: {response.text}")
 
 
-def backup_database(db_name, user, password, host, port, webhook_url, results):
+CHUNK_SIZE = 1024 * 1024  # 流式备份每次从 mysqldump 读取的字节数
+COMPRESSION_SUFFIXES = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+TRANSFERS = ('scp', 'ssh', 'local', 'none')
+REMOTE_QUEUE_CHUNKS = 64  # 远程传输落后于本地写入时最多缓冲的块数，超过后反压 mysqldump
+HEAD_BYTES = 64 * 1024  # 在导出开头这么多字节内查找 --master-data 写入的 binlog 位置
+BINLOG_POSITION_PATTERN = re.compile(
+    rb"CHANGE (?:MASTER|REPLICATION SOURCE) TO (?:MASTER|SOURCE)_LOG_FILE='([^']+)', (?:MASTER|SOURCE)_LOG_POS=(\d+)")
+
+
+def parse_binlog_position(head):
+    """从 mysqldump --master-data=2 的输出开头解析 binlog 位置 [文件, 偏移]，找不到时返回 None"""
+    match = BINLOG_POSITION_PATTERN.search(head)
+    return [match.group(1).decode(), int(match.group(2))] if match else None
+
+
+def file_stats(path):
+    """未经流式导出的备份文件的大小和 sha256，供备份目录记录"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        head = f.read(HEAD_BYTES)
+        digest.update(head)
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    size = os.path.getsize(path)
+    return {"raw_bytes": size, "compressed_bytes": size, "compression": 'none', "sha256": digest.hexdigest(),
+            "binlog_position": parse_binlog_position(head)}
+
+
+class ProcessCompressor:
+    """外部压缩程序（zstd / pigz）：数据写入其标准输入，后台线程把压缩结果转交给 sink"""
+
+    def __init__(self, command, sink):
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE, bufsize=CHUNK_SIZE)
+        self.error = None
+        self.pump = threading.Thread(target=self._pump, args=(sink,), daemon=True)
+        self.pump.start()
+
+    def _pump(self, sink):
+        try:
+            while True:
+                chunk = self.process.stdout.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                sink.write(chunk)
+        except Exception as e:
+            # 写入失败（磁盘满、远程断开）时结束压缩程序，主线程的写入随即失败而不是一直阻塞
+            self.error = e
+            self.process.kill()
+            self.process.stdout.close()
+
+    def write(self, chunk):
+        if self.error is not None:
+            raise self.error
+        try:
+            self.process.stdin.write(chunk)
+        except OSError:
+            if self.error is not None:
+                raise self.error
+            raise
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            if self.error is None:
+                raise
+        self.pump.join()
+        stderr = self.process.stderr.read()
+        self.process.wait()
+        if self.error is not None:
+            raise self.error
+        if self.process.returncode != 0:
+            raise RuntimeError(f"{self.process.args[0]} 压缩失败: {stderr.decode('utf-8', 'replace')}")
+
+
+class RemoteSink:
+    """
+    把数据写入远程命令（ssh 或本地替代命令）的标准输入。
+    由后台线程写入，本地写盘不必等待网络；缓冲满时才反压。
+    远程命令在接收完成后输出文件的 sha256，用于和本地校验和比对
     """
-    备份数据库
+
+    def __init__(self, command):
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE)
+        self.queue = queue.Queue(maxsize=REMOTE_QUEUE_CHUNKS)
+        self.error = None
+        self.output = b''
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                break
+            if self.error is None:
+                try:
+                    self.process.stdin.write(chunk)
+                except OSError as e:  # 远程命令已退出，继续取出剩余数据，避免阻塞本地写入
+                    self.error = str(e)
+        self.output, stderr = self.process.communicate()  # 关闭标准输入并等待远程命令结束
+        if self.process.returncode != 0:
+            self.error = stderr.decode('utf-8', 'replace').strip() or self.error or f"退出码 {self.process.returncode}"
+
+    def write(self, chunk):
+        self.queue.put(chunk)
+
+    def close(self):
+        """等待传输完成，返回 (远程 sha256, 错误信息)"""
+        self.queue.put(None)
+        self.thread.join()
+        digest = self.output.decode('utf-8', 'replace').split()
+        return (digest[0] if digest else None), self.error
+
+
+class TeeSink:
+    """把（压缩后的）备份数据同时写入本地文件和远程目标，并在写入时计算 sha256"""
+
+    def __init__(self, path, remote=None):
+        self.file = open(path, 'wb', buffering=CHUNK_SIZE)
+        self.remote = remote
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk):
+        self.digest.update(chunk)
+        self.size += len(chunk)
+        self.file.write(chunk)
+        if self.remote is not None:
+            self.remote.write(chunk)
+
+    def close(self):
+        self.file.close()
+
+
+def remote_shell(transfer, remote, script):
+    """在远程 (ssh user@host) 或本机 (local) 执行 shell 脚本的命令行"""
+    if transfer == 'ssh':
+        return ['ssh', '-o', 'BatchMode=yes', remote, script]
+    return ['sh', '-c', script]
+
+
+def remote_command(transfer, remote, remote_file):
+    """
+    接收流式备份的远程命令：写入 .part 并输出其 sha256。
+    导出成功且校验和一致后才由 finish_remote 改名为正式文件，中断或失败的传输不会留下看似完整的文件。
+    transfer 为 ssh 时在 remote (user@host) 上执行；为 local 时在本机执行（remote_file 为本地路径，用于测试或挂载的备份盘）
+    """
+    part = remote_file + '.part'
+    script = (f"mkdir -p {shlex.quote(os.path.dirname(remote_file))} && cat > {shlex.quote(part)} && "
+              f"sha256sum {shlex.quote(part)}")
+    return remote_shell(transfer, remote, script)
+
+
+def finish_remote(transfer, remote, remote_file, commit):
+    """commit 为 True 时把 .part 改名为正式文件，否则删除 .part；返回错误信息，成功时为 None"""
+    part = shlex.quote(remote_file + '.part')
+    script = f"mv {part} {shlex.quote(remote_file)}" if commit else f"rm -f {part}"
+    result = subprocess.run(remote_shell(transfer, remote, script), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=True)
+    if result.returncode != 0:
+        return result.stderr.strip() or f"退出码 {result.returncode}"
+    return None
+
+
+def resolve_compression(compression):
+    """实际可用的压缩方式：未安装 zstd 命令时改用 gzip。文件后缀和记录的压缩方式都应以它为准"""
+    if compression == 'zstd' and not shutil.which('zstd'):
+        print("未找到 zstd 命令，改用 gzip 压缩")
+        return 'gzip'
+    return compression
+
+
+def open_compressor(sink, compression, level=None, threads=0):
+    """
+    打开压缩写入器，压缩结果写入 sink，返回 (writer, 实际使用的压缩方式)。
+    zstd / gzip 优先使用多线程的 zstd -T / pigz 命令，未安装时使用 Python 标准库 gzip（单线程）
+    """
+    threads = threads or os.cpu_count() or 1
+    if compression == 'zstd':
+        if shutil.which('zstd'):
+            return ProcessCompressor(['zstd', '-q', f'-{level or 3}', f'-T{threads}', '-c'], sink), 'zstd'
+        compression = 'gzip'
+    if compression == 'gzip':
+        if shutil.which('pigz'):
+            return ProcessCompressor(['pigz', f'-{level or 6}', '-p', str(threads), '-c'], sink), 'gzip'
+        return gzip.GzipFile(fileobj=sink, mode='wb', compresslevel=level or 6), 'gzip'
+    return sink, 'none'
+
+
+def stream_dump(command, backup_file, compression, level=None, threads=0, transfer='none', remote=None,
+                remote_dir=None):
+    """
+    从 mysqldump 的标准输出按块读取，经压缩后直接写入备份文件，不产生未压缩的中间文件；
+    transfer 为 ssh / local 时同时把压缩后的数据流式传到远程，传输与导出重叠进行。
+    返回 (returncode, stderr, 统计信息)
+    """
+    start = time.perf_counter()
+    raw_bytes = 0
+    head = bytearray()
+    # zstd 不可用时改用 gzip，文件后缀随之改变
+    actual = resolve_compression(compression)
+    if actual != compression:
+        backup_file = backup_file[:-len(COMPRESSION_SUFFIXES[compression])] + COMPRESSION_SUFFIXES[actual]
+    remote_file = None
+    remote_sink = None
+    if transfer in ('ssh', 'local'):
+        remote_file = os.path.join(remote_dir, os.path.basename(backup_file))
+        remote_sink = RemoteSink(remote_command(transfer, remote, remote_file))
+    sink = TeeSink(backup_file, remote_sink)
+
+    try:
+        with tempfile.TemporaryFile() as stderr_file:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file, bufsize=CHUNK_SIZE)
+            writer, compression = open_compressor(sink, compression, level, threads)
+            try:
+                while True:
+                    chunk = process.stdout.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    raw_bytes += len(chunk)
+                    if len(head) < HEAD_BYTES:
+                        head += chunk[:HEAD_BYTES - len(head)]
+                    writer.write(chunk)
+            finally:
+                try:
+                    if writer is not sink:
+                        writer.close()
+                finally:
+                    sink.close()
+                    process.stdout.close()
+                    returncode = process.wait()
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode('utf-8', 'replace')
+    except BaseException:
+        # 本地写入失败（如磁盘已满）时删除远程的 .part
+        if remote_sink is not None:
+            remote_sink.close()
+            finish_remote(transfer, remote, remote_file, commit=False)
+        raise
+    dumped = time.perf_counter()
+
+    stats = {
+        "backup_file": backup_file,
+        "compression": compression,
+        "raw_bytes": raw_bytes,
+        "compressed_bytes": sink.size,
+        "ratio": round(sink.size / raw_bytes, 3) if raw_bytes else None,
+        "sha256": sink.digest.hexdigest(),
+        "dump_seconds": round(dumped - start, 3),
+        "throughput_mb_s": round(raw_bytes / 1024 / 1024 / (dumped - start), 2) if dumped > start else None,
+        "binlog_position": parse_binlog_position(bytes(head)),
+    }
+    if remote_sink is not None:
+        remote_digest, error = remote_sink.close()
+        stats["remote_file"] = remote_file
+        # 导出结束后还需等待传输的时间，理想情况下接近 0
+        stats["transfer_tail_seconds"] = round(time.perf_counter() - dumped, 3)
+        if error is None and returncode != 0:
+            error = f"导出失败（退出码 {returncode}），远程文件未提交"
+        if error is None and remote_digest != stats["sha256"]:
+            error = f"远程校验和不一致: {remote_digest}"
+        # 导出和校验都通过后才提交远程文件，否则删除 .part
+        if error is None:
+            error = finish_remote(transfer, remote, remote_file, commit=True)
+        else:
+            finish_remote(transfer, remote, remote_file, commit=False)
+        stats["transfer_error" if error else "transfer_verified"] = error or True
+    return returncode, stderr, stats
+
+
+def scp_to_remote(backup_file, remote_dir):
+    """备份完成后用 scp 整体传输到远程服务器，返回 (是否成功, 错误输出)"""
+    scp_command = ['scp', backup_file, f"{server_user}@{remote_server}:{remote_dir}"]
+    scp_result = subprocess.run(scp_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    return scp_result.returncode == 0, scp_result.stderr
+
+
+def backup_database(db_name, user, password, host, port, webhook_url, results, compression='none',
+                    compress_level=None, compress_threads=0, transfer='scp', remote_dir="/opt/backup",
+                    binlog_position=False, cleanup=True):
+    """
+    备份数据库。
+    compression 为 gzip / zstd 时流式压缩为 .sql.gz / .sql.zst，并在结果中记录原始大小、压缩后大小和吞吐 (MB/s)。
+    transfer 为远程备份方式：scp 为备份完成后整体传输；ssh / local 为导出的同时流式传输并校验 sha256；none 不传输。
+    既不压缩也不流式传输时由 mysqldump 直接写入 .sql 文件。
+    binlog_position 为 True 时（增量模式）在一致性快照中导出并记录对应的 binlog 位置；
+    cleanup 为 True 时只保留最新的一个备份文件，增量模式改由备份目录的保留策略清理
     """
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     backup_dir = "/opt/backup"  # 指定备份目录
     os.makedirs(backup_dir, exist_ok=True)  # 确保目录存在
-    backup_file = os.path.join(backup_dir, f"{db_name}_backup_{timestamp}.sql")
+    backup_file = os.path.join(backup_dir, f"{backup_prefix(db_name, host, port)}{timestamp}.sql"
+                                           f"{COMPRESSION_SUFFIXES[compression]}")
 
     # 整合消息
     results[db_name] = {"backup_file": backup_file}
     print(f"备份文件路径: {backup_file}")
 
-    command = ['mysqldump', '-h', host, '-P', str(port), '-u', user, '-p' + password, db_name,
-               '--result-file=' + backup_file]
+    command = ['mysqldump', '-h', host, '-P', str(port), '-u', user, '-p' + password, db_name]
+    if binlog_position:
+        # 导出开头以注释写入 CHANGE MASTER TO ... 位置，增量备份从这里开始
+        command += ['--single-transaction', '--master-data=2']
+    results[db_name]["started_at"] = round(time.time(), 3)
 
     try:
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-
-        if result.returncode != 0:
-            error_message = f"备份数据库 {db_name} 时发生错误:\n{result.stderr}"
+        if compression == 'none' and transfer not in ('ssh', 'local'):
+            result = subprocess.run(command + ['--result-file=' + backup_file], stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, text=True)
+            returncode, stderr = result.returncode, result.stderr
+            if binlog_position and returncode == 0:
+                results[db_name].update(file_stats(backup_file))
+        else:
+            returncode, stderr, stats = stream_dump(command, backup_file, compression, compress_level,
+                                                    compress_threads, transfer, f"{server_user}@{remote_server}",
+                                                    remote_dir)
+            backup_file = stats["backup_file"]
+            results[db_name].update(stats)
+            print(f"数据库 {db_name} 导出 {round(stats['raw_bytes'] / 1024 / 1024, 1)} MB，"
+                  f"压缩后 {round(stats['compressed_bytes'] / 1024 / 1024, 1)} MB，{stats['throughput_mb_s']} MB/s")
+
+        if returncode != 0:
+            error_message = f"备份数据库 {db_name} 时发生错误:\n{stderr}"
             print(error_message)
             results[db_name]["error"] = error_message
             send_feishu_notification(error_message, webhook_url)
@@ -55,30 +371,43 @@ def backup_database(db_name, user, password, host, port, webhook_url, results):
         success_message = f"数据库 {db_name} 备份成功，备份文件: {backup_file}"
         print(success_message)
         results[db_name]["success"] = success_message
+        results[db_name]["finished_at"] = round(time.time(), 3)
 
         if os.path.exists(backup_file):
             results[db_name]["file_created"] = f"备份文件已创建: {backup_file}"
         else:
             results[db_name]["file_created"] = "备份文件未创建。"
 
-        # 传输备份文件到远程服务器
-        remote_backup_dir = "/opt/backup"  # 目标服务器的备份目录
-        scp_command = ['scp', backup_file, f"{server_user}@{remote_server}:{remote_backup_dir}"]
-        scp_result = subprocess.run(scp_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-
-        if scp_result.returncode != 0:
-            error_message = f"SCP传输 {db_name} 备份文件时发生错误:\n{scp_result.stderr}"
-            print(error_message)
-            results[db_name]["scp_error"] = error_message
-            # send_feishu_notification(error_message, webhook_url)
-        else:
-            success_message = f"数据库 {db_name} 备份文件已成功传输至远程服务器。"
-            print(success_message)
-            results[db_name]["scp_success"] = success_message
-            # send_feishu_notification(success_message, webhook_url)
+        if transfer in ('ssh', 'local'):
+            # 已在导出的同时传输完成
+            if results[db_name].get("transfer_error"):
+                error_message = f"流式传输 {db_name} 备份文件时发生错误:\n{results[db_name]['transfer_error']}"
+                print(error_message)
+                results[db_name]["scp_error"] = error_message
+            else:
+                success_message = f"数据库 {db_name} 备份文件已流式传输至远程服务器并通过校验。"
+                print(success_message)
+                results[db_name]["scp_success"] = success_message
+        elif transfer == 'scp':
+            # 传输备份文件到远程服务器
+            scp_ok, scp_stderr = scp_to_remote(backup_file, remote_dir)
+
+            if not scp_ok:
+                error_message = f"SCP传输 {db_name} 备份文件时发生错误:\n{scp_stderr}"
+                print(error_message)
+                results[db_name]["scp_error"] = error_message
+                # send_feishu_notification(error_message, webhook_url)
+            else:
+                success_message = f"数据库 {db_name} 备份文件已成功传输至远程服务器。"
+                print(success_message)
+                results[db_name]["scp_success"] = success_message
+                # 记入备份目录，保留策略删除过期备份时一并删除远程副本
+                results[db_name]["remote_file"] = os.path.join(remote_dir, os.path.basename(backup_file))
+                # send_feishu_notification(success_message, webhook_url)
 
         # 删除旧的备份文件，只保留最新的一个
-        cleanup_old_backups(backup_dir, db_name)
+        if cleanup:
+            cleanup_old_backups(backup_dir, backup_prefix(db_name, host, port))
         # send_feishu_notification(success_message, webhook_url)
         return True
 
@@ -90,9 +419,19 @@ def backup_database(db_name, user, password, host, port, webhook_url, results):
         return False
 
 
-def cleanup_old_backups(backup_dir, db_name):
+def backup_prefix(db_name, host, port):
+    """备份文件名前缀，带上主机和端口，不同主机上的同名库互不覆盖"""
+    return f"{db_name}_{host}_{port}_backup_"
+
+
+def job_key(db_name, host, port):
+    """运维报告中一个库的键：db_name@host:port"""
+    return f"{db_name}@{host}:{port}"
+
+
+def cleanup_old_backups(backup_dir, prefix):
     """
-    删除旧的备份文件，只保留最新的一个
+    删除旧的备份文件，只保留最新的一个（prefix 为 backup_prefix 的返回值）
     """
     # 获取当前时间
     now = time.time()
@@ -100,7 +439,7 @@ def cleanup_old_backups(backup_dir, db_name):
 
     # 遍历备份目录
     for file in os.listdir(backup_dir):
-        if file.startswith(f"{db_name}_backup_"):
+        if file.startswith(prefix):
             file_path = os.path.join(backup_dir, file)
             # 检查文件的最后修改时间
             if os.path.isfile(file_path):
@@ -110,7 +449,7 @@ def cleanup_old_backups(backup_dir, db_name):
 
     # 删除旧的备份文件，只保留最新的一个
     for file in os.listdir(backup_dir):
-        if file.startswith(f"{db_name}_backup_"):
+        if file.startswith(prefix):
             file_path = os.path.join(backup_dir, file)
             if file_path != latest_backup:  # 只删除不是最新的备份文件
                 os.remove(file_path)
@@ -160,6 +499,207 @@ def check_mysql_database(db_name, user, password, host, port, webhook_url, resul
         # send_feishu_notification(error_message, webhook_url)
 
 
+def parse_database_entry(value, host, port):
+    """
+    解析 [databases] 中的一项：db_name 使用 [database] 的主机，
+    db_name@host 或 db_name@host:port 指定该库所在的主机
+    """
+    db_name, _, address = value.strip().partition('@')
+    if address:
+        host, _, port_text = address.partition(':')
+        port = int(port_text) if port_text else port
+    return db_name.strip(), host.strip(), port
+
+
+def run_backup_job(db_name, user, password, host, port, webhook_url, host_slot, **dump_options):
+    """
+    备份单个数据库，完成后立即执行 mysqlcheck。
+    host_slot 为该主机的信号量，限制同一主机上同时运行的任务数；dump_options 传给 backup_database。返回该库的结果
+    """
+    job_results = {}
+    start = time.perf_counter()
+    with host_slot:
+        waited = time.perf_counter() - start
+        backed_up = backup_database(db_name, user, password, host, port, webhook_url, job_results, **dump_options)
+        dumped = time.perf_counter()
+        if backed_up:
+            check_mysql_database(db_name, user, password, host, port, webhook_url, job_results)
+        checked = time.perf_counter()
+
+    entry = job_results.get(db_name, {})
+    entry["host"] = f"{host}:{port}"
+    entry["timing"] = {
+        "wait_seconds": round(waited, 3),
+        "backup_seconds": round(dumped - start - waited, 3),
+        "check_seconds": round(checked - dumped, 3),
+        "total_seconds": round(checked - start, 3),
+    }
+    return entry
+
+
+def interleave_by_host(jobs):
+    """
+    按 host:port 轮转排列任务（a1, b1, a2, b2, a3 ...）。线程池按顺序取任务，
+    同一主机的任务连在一起时，占满主机名额的线程会阻塞在主机信号量上，其他主机的任务只能排队
+    """
+    groups = {}
+    for job in jobs:
+        groups.setdefault((job[1], job[2]), []).append(job)
+    ordered = []
+    for round_jobs in zip_longest(*groups.values()):
+        ordered.extend(job for job in round_jobs if job is not None)
+    return ordered
+
+
+def run_backups(jobs, user, password, webhook_url, results, concurrency=4, per_host_concurrency=2,
+                **dump_options):
+    """
+    并行备份多个数据库。jobs 为 [(db_name, host, port)]；
+    concurrency 为全局并发数，per_host_concurrency 为同一主机的并发数，避免压垮单台数据库服务器。
+    各库的结果以 db_name@host:port 为键在加锁后合并进 results，返回总耗时(秒)
+    """
+    results_lock = threading.Lock()
+    # 按 host:port 限流，同一台机器上的不同实例各自计数
+    host_slots = {(host, port): threading.BoundedSemaphore(per_host_concurrency) for _, host, port in jobs}
+
+    def run(job):
+        db_name, host, port = job
+        try:
+            entry = run_backup_job(db_name, user, password, host, port, webhook_url, host_slots[(host, port)],
+                                   **dump_options)
+        except Exception as e:
+            entry = {"error": f"发生错误: {e}"}
+        with results_lock:
+            results[job_key(db_name, host, port)] = entry
+        print(f"数据库 {job_key(db_name, host, port)} 处理完成，耗时 {entry.get('timing', {}).get('total_seconds')}s")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(jobs))), thread_name_prefix='backup') as executor:
+        list(executor.map(run, interleave_by_host(jobs)))
+    return round(time.perf_counter() - start, 3)
+
+
+def mysql_query(host, port, user, password, sql):
+    """用 mysql 客户端执行一条查询，返回各行的列值列表"""
+    command = ['mysql', '-h', host, '-P', str(port), '-u', user, '-p' + password, '-N', '-B', '-e', sql]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"执行 {sql} 时发生错误:\n{result.stderr}")
+    return [line.split('\t') for line in result.stdout.splitlines() if line.strip()]
+
+
+def backup_binlogs(host, port, user, password, start, compression='none', compress_level=None, compress_threads=0,
+                   transfer='scp', remote_dir="/opt/backup"):
+    """
+    增量备份：用 mysqlbinlog 从远程读取 start (文件, 偏移) 到当前位置之间的 binlog，
+    与全量备份一样流式压缩、传输并计算 sha256。binlog 是整台主机共用的，增量按主机备份。
+    返回 (结果, 统计信息, 结束位置)；没有新的变更时统计信息为 None
+    """
+    started_at = time.time()
+    # MySQL 8.2 起该语句更名为 SHOW BINARY LOG STATUS
+    status = mysql_query(host, port, user, password, 'SHOW MASTER STATUS')
+    if not status:
+        raise RuntimeError(f"主机 {host}:{port} 未开启 binlog，无法进行增量备份")
+    end = [status[0][0], int(status[0][1])]
+    entry = {"start_position": list(start), "end_position": end}
+    if list(start) == end:
+        entry["success"] = f"主机 {host}:{port} 自上次备份以来没有新的变更"
+        return entry, None, end
+
+    logs = [row[0] for row in mysql_query(host, port, user, password, 'SHOW BINARY LOGS')]
+    if start[0] not in logs:
+        raise RuntimeError(f"binlog {start[0]} 已被清理，增量链断开，请先做一次全量备份")
+    files = logs[logs.index(start[0]):logs.index(end[0]) + 1]
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    backup_dir = "/opt/backup"
+    os.makedirs(backup_dir, exist_ok=True)
+    backup_file = os.path.join(backup_dir, f"binlog_{host}_{port}_{timestamp}.sql{COMPRESSION_SUFFIXES[compression]}")
+    # --start-position 作用于第一个文件，--stop-position 作用于最后一个文件
+    command = ['mysqlbinlog', '--read-from-remote-server', '-h', host, '-P', str(port), '-u', user, '-p' + password,
+               f'--start-position={start[1]}', f'--stop-position={end[1]}', *files]
+    returncode, stderr, stats = stream_dump(command, backup_file, compression, compress_level, compress_threads,
+                                            transfer, f"{server_user}@{remote_server}", remote_dir)
+    if returncode != 0:
+        raise RuntimeError(f"读取 {host}:{port} 的 binlog 时发生错误:\n{stderr}")
+    if transfer == 'scp':
+        scp_ok, scp_stderr = scp_to_remote(stats["backup_file"], remote_dir)
+        stats["transfer_verified" if scp_ok else "transfer_error"] = True if scp_ok else scp_stderr
+        if scp_ok:
+            stats["remote_file"] = os.path.join(remote_dir, os.path.basename(stats["backup_file"]))
+    stats["started_at"] = round(started_at, 3)
+    entry.update(stats)
+    entry["success"] = (f"主机 {host}:{port} 增量备份完成: {len(files)} 个 binlog，"
+                        f"{round(stats['raw_bytes'] / 1024 / 1024, 1)} MB")
+    print(entry["success"])
+    return entry, stats, end
+
+
+def remove_backup_file(row, transfer):
+    """删除备份目录中过期的一份备份：本地文件以及传输到远程的副本"""
+    if os.path.exists(row['backup_file']):
+        os.remove(row['backup_file'])
+    if row['remote_file']:
+        if transfer == 'local':
+            if os.path.exists(row['remote_file']):
+                os.remove(row['remote_file'])
+        elif transfer in ('ssh', 'scp'):
+            subprocess.run(['ssh', '-o', 'BatchMode=yes', f"{server_user}@{remote_server}",
+                            f"rm -f {shlex.quote(row['remote_file'])}"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def run_incremental(jobs, user, password, webhook_url, results, catalog, full_interval_days, keep_fulls,
+                    incremental_days, concurrency=4, per_host_concurrency=2, **dump_options):
+    """
+    增量模式：到期的库（从未全量或超过 full_interval_days 天）做全量备份，
+    再对每台主机备份上次位置以来的 binlog，结果记入备份目录，最后按保留策略删除过期的备份。
+    返回总耗时(秒)
+    """
+    start = time.perf_counter()
+    due_jobs = [job for job in jobs if catalog.full_due(f"{job[1]}:{job[2]}", job[0], full_interval_days)]
+    if due_jobs:
+        run_backups(due_jobs, user, password, webhook_url, results, concurrency, per_host_concurrency,
+                    binlog_position=True, cleanup=False, **dump_options)
+    for db_name, host, port in due_jobs:
+        entry = results.get(job_key(db_name, host, port), {})
+        if "success" not in entry:
+            continue
+        if not entry.get("binlog_position"):
+            entry["catalog_warning"] = "未在导出中找到 binlog 位置（主机未开启 binlog？），增量备份无法从该全量开始"
+        catalog.add(FULL, f"{host}:{port}", db_name, entry["started_at"], entry["finished_at"], entry,
+                    start=entry.get("binlog_position") or (None, None), end=entry.get("binlog_position") or (None, None))
+
+    hosts = {}
+    for db_name, host, port in jobs:
+        hosts.setdefault((host, port), []).append(db_name)
+    for (host, port), db_names in hosts.items():
+        host_key = f"{host}:{port}"
+        position = catalog.last_position(host_key, db_names)
+        if position is None:
+            results[f"binlog@{host_key}"] = {"skipped": "还没有带 binlog 位置的全量备份"}
+            continue
+        try:
+            entry, stats, end = backup_binlogs(host, port, user, password, position, **dump_options)
+            if stats is not None:
+                catalog.add(INCREMENTAL, host_key, None, stats["started_at"], time.time(), stats,
+                            start=position, end=end)
+        except Exception as e:
+            entry = {"error": f"增量备份发生错误: {e}"}
+            print(entry["error"])
+            send_feishu_notification(entry["error"], webhook_url)
+        results[f"binlog@{host_key}"] = entry
+
+    removed = []
+    for row in catalog.expired(keep_fulls, incremental_days):
+        remove_backup_file(row, dump_options.get('transfer'))
+        catalog.remove(row['id'])
+        removed.append(os.path.basename(row['backup_file']))
+    if removed:
+        print(f"按保留策略删除 {len(removed)} 份备份: {', '.join(removed)}")
+    results["catalog"] = {"removed": removed, "sets": catalog.summary()}
+    return round(time.perf_counter() - start, 3)
+
+
 def read_db_config(filename):
     """
     读取数据库配置
@@ -186,14 +726,41 @@ if __name__ == "__main__":
 
         # 动态获取所有数据库名称（兼容两种配置格式）
         if 'databases' in config:
-            # 方案1：直接读取 [databases] 下的所有值（适合键名无意义的情况）
-            db_names = [v.strip() for _, v in config.items('databases')]
+            # 方案1：直接读取 [databases] 下的所有值（适合键名无意义的情况），值可写为 db_name@host:port
+            jobs = [parse_database_entry(v, host, port) for _, v in config.items('databases')]
 
             # 方案2：兼容逗号分隔的列表（适合 names = db1,db2 格式）
             # db_names = [name.strip() for name in config.get('databases',  'names').split(',')]
         else:
             raise KeyError("缺少 [databases] 配置节")
 
+        # 并发配置（可选）：全局并发数和同一主机的并发数
+        backup_options = config['backup'] if 'backup' in config else {}
+        concurrency = int(backup_options.get('concurrency', 4))
+        per_host_concurrency = int(backup_options.get('per_host_concurrency', 2))
+        # 流式压缩（可选）：none / gzip / zstd，压缩级别和线程数（0 为 CPU 核数）
+        dump_options = {
+            'compression': backup_options.get('compression', 'none'),
+            'compress_level': int(backup_options.get('compress_level', 0)) or None,
+            'compress_threads': int(backup_options.get('compress_threads', 0)),
+        }
+        if dump_options['compression'] not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"未知的压缩方式: {dump_options['compression']}")
+        # 远程备份方式：scp（备份后整体传输）/ ssh（导出时流式传输）/ local（流式写入本机目录）/ none
+        dump_options['transfer'] = backup_options.get('transfer', 'scp')
+        dump_options['remote_dir'] = backup_options.get('remote_dir', '/opt/backup')
+        if dump_options['transfer'] not in TRANSFERS:
+            raise ValueError(f"未知的远程备份方式: {dump_options['transfer']}")
+        # 备份模式：full（每次全量）/ incremental（定期全量 + binlog 增量，记录在备份目录中）
+        mode = backup_options.get('mode', 'full')
+        if mode not in ('full', 'incremental'):
+            raise ValueError(f"未知的备份模式: {mode}")
+        retention = {
+            'full_interval_days': float(backup_options.get('full_interval_days', 7)),
+            'keep_fulls': int(backup_options.get('keep_fulls', 2)),
+            'incremental_days': float(backup_options.get('incremental_days', 14)),
+        }
+
     except (KeyError, configparser.NoSectionError) as e:
         print(f"配置错误: {e}")
         exit(1)
@@ -203,14 +770,21 @@ if __name__ == "__main__":
 
     results = {}
 
-    # 统一处理所有数据库
-    for db_name in db_names:
-        if backup_database(db_name, user, password, host, port, webhook_url, results):
-            check_mysql_database(db_name, user, password, host, port, webhook_url, results)
+    if mode == 'incremental':
+        catalog = BackupCatalog(backup_options.get('catalog', '/opt/backup/catalog.db'))
+        total_seconds = run_incremental(jobs, user, password, webhook_url, results, catalog,
+                                        concurrency=concurrency, per_host_concurrency=per_host_concurrency,
+                                        **retention, **dump_options)
+    else:
+        # 并行处理所有数据库：每个库备份完成后立即检查
+        total_seconds = run_backups(jobs, user, password, webhook_url, results, concurrency, per_host_concurrency,
+                                    **dump_options)
+    print(f"全部数据库处理完成，共 {len(jobs)} 个，总耗时 {total_seconds}s")
 
     # 推送结果（含空结果检查）
     if results:
         results_message = json.dumps(results, ensure_ascii=False, indent=4)
-        send_feishu_notification(f"🔧 数据库运维报告\n{results_message}", webhook_url)
+        send_feishu_notification(f"🔧 数据库运维报告（{len(jobs)} 个数据库，并发 {concurrency}，"
+                                 f"总耗时 {total_seconds}s）\n{results_message}", webhook_url)
     else:
         send_feishu_notification("⚠️ 未执行任何数据库操作，请检查配置", webhook_url)
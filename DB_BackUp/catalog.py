@@ -0,0 +1,134 @@
+import os
+import sqlite3
+import threading
+import time
+
+# --- 备份目录（catalog） ---
+# 记录每一次备份：全量备份（每个数据库一份 mysqldump）和增量备份（每台主机一段 binlog），
+# 包括文件、大小、sha256 以及 binlog 位置。增量备份从上一次记录的位置继续，
+# 恢复时按 全量 → 之后的增量 依次应用；保留策略也按这里的记录删除文件。
+
+FULL = 'full'
+INCREMENTAL = 'incremental'
+
+
+def position_key(binlog_file, binlog_pos):
+    """binlog 位置的比较键：文件名带递增序号（mysql-bin.000012），按 (文件名, 偏移) 比较即可"""
+    return binlog_file or '', int(binlog_pos or 0)
+
+
+class BackupCatalog:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS backup_sets (
+                                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                kind TEXT NOT NULL,
+                                host TEXT NOT NULL,
+                                db_name TEXT,
+                                started_at REAL NOT NULL,
+                                finished_at REAL NOT NULL,
+                                backup_file TEXT NOT NULL,
+                                remote_file TEXT,
+                                compression TEXT,
+                                raw_bytes INTEGER,
+                                size_bytes INTEGER,
+                                sha256 TEXT,
+                                start_file TEXT,
+                                start_pos INTEGER,
+                                end_file TEXT,
+                                end_pos INTEGER)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_backup_sets_host ON backup_sets (host, kind, finished_at)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def add(self, kind, host, db_name, started_at, finished_at, stats, start=(None, None), end=(None, None)):
+        """
+        记录一次备份。stats 为 stream_dump 的统计信息（backup_file / remote_file / compression /
+        raw_bytes / compressed_bytes / sha256）；全量备份的 start 与 end 相同，为导出时的 binlog 位置
+        """
+        row = (kind, host, db_name, started_at, finished_at, stats['backup_file'], stats.get('remote_file'),
+               stats.get('compression'), stats.get('raw_bytes'), stats.get('compressed_bytes'), stats.get('sha256'),
+               start[0], start[1], end[0], end[1])
+        with self.lock, self._connect() as conn:
+            cursor = conn.execute('''INSERT INTO backup_sets (kind, host, db_name, started_at, finished_at,
+                                         backup_file, remote_file, compression, raw_bytes, size_bytes, sha256,
+                                         start_file, start_pos, end_file, end_pos)
+                                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', row)
+            return cursor.lastrowid
+
+    def latest_full(self, host, db_name):
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            return conn.execute('SELECT * FROM backup_sets WHERE kind = ? AND host = ? AND db_name = ? '
+                                'ORDER BY finished_at DESC LIMIT 1', (FULL, host, db_name)).fetchone()
+
+    def full_due(self, host, db_name, interval_days, now=None):
+        """该库是否需要做全量备份：从未做过，或距上次全量已超过 interval_days 天"""
+        latest = self.latest_full(host, db_name)
+        now = now or time.time()
+        return latest is None or latest['end_file'] is None or now - latest['finished_at'] >= interval_days * 86400
+
+    def last_position(self, host, db_names):
+        """
+        该主机下一次增量备份的起始 binlog 位置 (文件, 偏移)：
+        上一次增量的结束位置；还没有增量时为各库最近一次全量中最早的位置，没有可用的全量时返回 None
+        """
+        with self._connect() as conn:
+            row = conn.execute('SELECT end_file, end_pos FROM backup_sets WHERE kind = ? AND host = ? '
+                               'ORDER BY finished_at DESC LIMIT 1', (INCREMENTAL, host)).fetchone()
+        if row is not None:
+            return row
+        positions = []
+        for db_name in db_names:
+            full = self.latest_full(host, db_name)
+            if full is not None and full['end_file']:
+                positions.append((full['end_file'], full['end_pos']))
+        return min(positions, key=lambda p: position_key(*p)) if positions else None
+
+    def expired(self, keep_fulls, incremental_days, now=None):
+        """
+        按保留策略应删除的备份：每个库只保留最近 keep_fulls 份全量；
+        增量保留 incremental_days 天，且早于该主机所有保留全量中最早一份的增量也一并删除（已无法用于恢复）
+        """
+        now = now or time.time()
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute('SELECT * FROM backup_sets ORDER BY finished_at DESC').fetchall()
+        expired = []
+        kept_fulls = {}  # {(host, db_name): 已保留份数}
+        oldest_kept = {}  # {host: 保留的全量中最早的开始时间}
+        for row in rows:
+            if row['kind'] != FULL:
+                continue
+            key = (row['host'], row['db_name'])
+            if kept_fulls.get(key, 0) < keep_fulls:
+                kept_fulls[key] = kept_fulls.get(key, 0) + 1
+                oldest_kept[row['host']] = min(oldest_kept.get(row['host'], row['started_at']), row['started_at'])
+            else:
+                expired.append(row)
+        for row in rows:
+            if row['kind'] != INCREMENTAL:
+                continue
+            too_old = now - row['finished_at'] > incremental_days * 86400
+            before_fulls = row['host'] in oldest_kept and row['finished_at'] < oldest_kept[row['host']]
+            if too_old or before_fulls:
+                expired.append(row)
+        return expired
+
+    def remove(self, set_id):
+        with self.lock, self._connect() as conn:
+            conn.execute('DELETE FROM backup_sets WHERE id = ?', (set_id,))
+
+    def summary(self):
+        """各主机 / 库的备份份数和总大小，用于运维报告"""
+        with self._connect() as conn:
+            rows = conn.execute('SELECT kind, host, db_name, COUNT(*), SUM(size_bytes) FROM backup_sets '
+                                'GROUP BY kind, host, db_name ORDER BY host, db_name').fetchall()
+        return {f"{kind}:{host}/{db_name or '*'}": {"count": count, "size_bytes": size or 0}
+                for kind, host, db_name, count, size in rows}
@@ -0,0 +1,496 @@
+import argparse
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import queue
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+from backup import (COMPRESSION_SUFFIXES, TeeSink, job_key, open_compressor, parse_database_entry,
+                    read_db_config, resolve_compression, send_feishu_notification)
+
+# --- 按表并行导出 / 并行恢复 ---
+# 单个大库用一个 mysqldump 进程只能单线程串行导出。这里按表拆分任务，多个连接在同一个一致性快照中并行导出，
+# 数据量大的表按整数主键范围再拆成多个分块；导出目录中的 manifest.json 记录表结构、分块、行数和 sha256，
+# 以及视图、存储过程/函数和触发器的定义，restore 命令按 manifest 并行导入后再创建这些对象。
+# 使用 config.ini 的 [database] / [databases] / [backup] 配置，需要 pymysql：
+#   python parallel_dump.py dump production_orders --workers 8
+#   python parallel_dump.py restore /opt/backup/production_orders_parallel_20250101_020000 --database orders_copy
+
+MANIFEST = 'manifest.json'
+INSERT_ROWS = 1000  # 每条 INSERT 语句最多包含的行数
+INSERT_BYTES = 1024 * 1024  # 每条 INSERT 语句的最大长度，需小于 max_allowed_packet
+INTEGER_TYPES = {'tinyint', 'smallint', 'mediumint', 'int', 'bigint'}
+
+
+def connect(host, port, user, password, database=None):
+    try:
+        import pymysql
+    except ImportError:
+        raise RuntimeError("按表并行导出需要 pymysql: pip install pymysql")
+    return pymysql.connect(host=host, port=port, user=user, password=password, database=database,
+                           charset='utf8mb4', autocommit=True)
+
+
+def quote_name(name):
+    return '`' + name.replace('`', '``') + '`'
+
+
+def query(conn, sql, args=None):
+    with conn.cursor() as cursor:
+        cursor.execute(sql, args)
+        return cursor.fetchall()
+
+
+def start_snapshot(conn):
+    """在该连接上开启一致性快照事务"""
+    query(conn, 'SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+    query(conn, 'START TRANSACTION WITH CONSISTENT SNAPSHOT')
+
+
+def open_snapshots(host, port, user, password, db_name, workers):
+    """
+    打开 1 个控制连接和 workers 个导出连接，并让所有导出连接处于同一时刻的快照中：
+    FLUSH TABLES WITH READ LOCK 期间各连接开启快照、读取 binlog 位置，随后立即释放锁。
+    没有 RELOAD 权限时退化为各连接各自的快照（表内一致，表间不保证），manifest 中 consistent 为 false。
+    返回 (控制连接, 导出连接列表, 是否一致, binlog 位置)
+    """
+    control = connect(host, port, user, password, db_name)
+    connections = [connect(host, port, user, password, db_name) for _ in range(workers)]
+    try:
+        query(control, 'FLUSH TABLES WITH READ LOCK')
+        locked = True
+    except Exception as e:
+        print(f"无法获取全局读锁（{e}），各连接的快照不保证一致")
+        locked = False
+    try:
+        for conn in connections:
+            start_snapshot(conn)
+        try:
+            status = query(control, 'SHOW MASTER STATUS')
+            position = [status[0][0], int(status[0][1])] if status else None
+        except Exception:
+            position = None
+    finally:
+        if locked:
+            query(control, 'UNLOCK TABLES')
+    return control, connections, locked, position
+
+
+def list_tables(conn, db_name):
+    """库中的表和视图：[{name, type, rows_estimate, data_length}]"""
+    rows = query(conn, 'SELECT TABLE_NAME, TABLE_TYPE, TABLE_ROWS, DATA_LENGTH FROM information_schema.TABLES '
+                       'WHERE TABLE_SCHEMA = %s ORDER BY TABLE_NAME', (db_name,))
+    return [{'name': name, 'type': kind, 'rows_estimate': int(rows_estimate or 0), 'data_length': int(length or 0)}
+            for name, kind, rows_estimate, length in rows]
+
+
+def table_columns(conn, db_name, table):
+    """可插入的列（去掉生成列）"""
+    rows = query(conn, 'SELECT COLUMN_NAME, EXTRA FROM information_schema.COLUMNS '
+                       'WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s ORDER BY ORDINAL_POSITION', (db_name, table))
+    return [name for name, extra in rows if 'GENERATED' not in (extra or '').upper()]
+
+
+def chunk_key(conn, db_name, table):
+    """可用于分块的单列整数主键，没有时返回 None"""
+    rows = query(conn, 'SELECT k.COLUMN_NAME, c.DATA_TYPE FROM information_schema.KEY_COLUMN_USAGE k '
+                       'JOIN information_schema.COLUMNS c ON c.TABLE_SCHEMA = k.TABLE_SCHEMA '
+                       'AND c.TABLE_NAME = k.TABLE_NAME AND c.COLUMN_NAME = k.COLUMN_NAME '
+                       'WHERE k.TABLE_SCHEMA = %s AND k.TABLE_NAME = %s AND k.CONSTRAINT_NAME = %s',
+                 (db_name, table, 'PRIMARY'))
+    if len(rows) == 1 and rows[0][1].lower() in INTEGER_TYPES:
+        return rows[0][0]
+    return None
+
+
+def strip_schema(create, db_name):
+    """去掉 SHOW CREATE VIEW / TRIGGER / PROCEDURE 中的库名限定（`db`.`t`），恢复到其他库名时引用的是新库中的表"""
+    return create.replace(quote_name(db_name) + '.', '')
+
+
+def show_create(conn, kind, name, db_name):
+    """SHOW CREATE TRIGGER / PROCEDURE / FUNCTION 的定义和创建时的 sql_mode（结果第 2、3 列）"""
+    row = query(conn, f'SHOW CREATE {kind} {quote_name(name)}')[0]
+    if row[2] is None:
+        raise RuntimeError(f"没有权限读取 {kind} {name} 的定义")
+    return {'name': name, 'type': kind, 'sql_mode': row[1], 'create': strip_schema(row[2], db_name)}
+
+
+def list_routines(conn, db_name):
+    """存储过程和函数的定义"""
+    rows = query(conn, 'SELECT ROUTINE_NAME, ROUTINE_TYPE FROM information_schema.ROUTINES '
+                       'WHERE ROUTINE_SCHEMA = %s ORDER BY ROUTINE_NAME', (db_name,))
+    return [show_create(conn, kind, name, db_name) for name, kind in rows]
+
+
+def list_triggers(conn, db_name):
+    """触发器的定义，按表和 ACTION_ORDER 排列，依次创建即可还原同一时机多个触发器的执行顺序"""
+    rows = query(conn, 'SELECT TRIGGER_NAME FROM information_schema.TRIGGERS WHERE TRIGGER_SCHEMA = %s '
+                       'ORDER BY EVENT_OBJECT_TABLE, ACTION_TIMING, EVENT_MANIPULATION, ACTION_ORDER', (db_name,))
+    return [show_create(conn, 'TRIGGER', name, db_name) for name, in rows]
+
+
+def chunk_ranges(conn, table, key, rows_estimate, chunk_rows):
+    """
+    按主键范围把表拆成约 chunk_rows 行一块，返回 WHERE 条件列表。
+    首尾两块不设下限 / 上限，快照中主键范围与估算有出入时也不会漏行
+    """
+    if not key or rows_estimate <= chunk_rows:
+        return [None]
+    low, high = query(conn, f'SELECT MIN({quote_name(key)}), MAX({quote_name(key)}) FROM {quote_name(table)}')[0]
+    if low is None:
+        return [None]
+    count = min(rows_estimate // chunk_rows + 1, high - low + 1)
+    step = (high - low + 1) / count
+    bounds = sorted({low + int(step * i) for i in range(1, count)})
+    column = quote_name(key)
+    conditions = []
+    lower = None
+    for bound in bounds + [None]:
+        parts = []
+        if lower is not None:
+            parts.append(f'{column} >= {lower}')
+        if bound is not None:
+            parts.append(f'{column} < {bound}')
+        conditions.append(' AND '.join(parts) or None)
+        lower = bound
+    return conditions
+
+
+def dump_chunk(conn, table, columns, where, path, compression, level=None, threads=0):
+    """
+    在快照连接上流式读取一个分块（无缓冲游标），写成多行 INSERT 语句（每条语句占一行），
+    经压缩写入文件，返回分块信息
+    """
+    import pymysql.cursors
+
+    start = time.perf_counter()
+    column_list = ', '.join(quote_name(c) for c in columns)
+    prefix = f"INSERT INTO {quote_name(table)} ({column_list}) VALUES "
+    sql = f"SELECT {column_list} FROM {quote_name(table)}" + (f" WHERE {where}" if where else '')
+    sink = TeeSink(path)
+    writer, compression = open_compressor(sink, compression, level, threads)
+    rows = 0
+    try:
+        with conn.cursor(pymysql.cursors.SSCursor) as cursor:
+            cursor.execute(sql)
+            values, size = [], 0
+            for row in cursor:
+                value = '(' + ','.join(conn.escape(v) for v in row) + ')'
+                values.append(value)
+                size += len(value) + 1
+                rows += 1
+                if len(values) >= INSERT_ROWS or size >= INSERT_BYTES:
+                    writer.write((prefix + ','.join(values) + ';\n').encode('utf-8'))
+                    values, size = [], 0
+            if values:
+                writer.write((prefix + ','.join(values) + ';\n').encode('utf-8'))
+    finally:
+        if writer is not sink:
+            writer.close()
+        sink.close()
+    return {'file': os.path.basename(path), 'where': where, 'rows': rows, 'bytes': sink.size,
+            'sha256': sink.digest.hexdigest(), 'seconds': round(time.perf_counter() - start, 3)}
+
+
+def run_workers(connections, tasks, handler):
+    """每个连接一个线程，从任务队列中取任务执行；返回 [(任务, 结果或异常)]"""
+    pending = queue.Queue()
+    for task in tasks:
+        pending.put(task)
+    outcomes = []
+    lock = threading.Lock()
+
+    def work(conn):
+        while True:
+            try:
+                task = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                outcome = handler(conn, task)
+            except Exception as e:
+                outcome = e
+            with lock:
+                outcomes.append((task, outcome))
+
+    threads = [threading.Thread(target=work, args=(conn,), daemon=True) for conn in connections]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def dump_database(db_name, host, port, user, password, output_dir, workers=8, chunk_rows=1000000,
+                  compression='zstd', compress_level=None, compress_threads=0):
+    """按表并行导出一个库到 output_dir，返回 manifest"""
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    # 文件后缀和 manifest 按实际使用的压缩方式（zstd 不可用时为 gzip），恢复时据此解压
+    compression = resolve_compression(compression)
+    control, connections, consistent, position = open_snapshots(host, port, user, password, db_name, workers)
+    try:
+        # 表结构、列、分块键和分块边界都在快照连接中读取，与导出的数据对应同一时刻
+        snapshot = connections[0]
+        objects = list_tables(snapshot, db_name)
+        tables, views, tasks = [], [], []
+        for item in objects:
+            name = item['name']
+            if item['type'] == 'VIEW':
+                create = query(snapshot, f'SHOW CREATE VIEW {quote_name(name)}')[0][1]
+                views.append({'name': name, 'create': strip_schema(create, db_name)})
+                continue
+            create = query(snapshot, f'SHOW CREATE TABLE {quote_name(name)}')[0][1]
+            columns = table_columns(snapshot, db_name, name)
+            key = chunk_key(snapshot, db_name, name)
+            conditions = chunk_ranges(snapshot, name, key, item['rows_estimate'], chunk_rows)
+            table = {'name': name, 'create': create, 'columns': columns, 'chunk_key': key,
+                     'rows_estimate': item['rows_estimate'], 'chunks': []}
+            tables.append(table)
+            for index, where in enumerate(conditions):
+                path = os.path.join(output_dir, f"{name}.{index:05d}.sql{COMPRESSION_SUFFIXES[compression]}")
+                # 估算每块的数据量，大块先导出，避免最后只剩一个大表在跑
+                tasks.append((item['data_length'] / len(conditions), table, index, where, path))
+        tasks.sort(key=lambda task: task[0], reverse=True)
+        routines = list_routines(snapshot, db_name)
+        triggers = list_triggers(snapshot, db_name)
+
+        def handle(conn, task):
+            _, table, index, where, path = task
+            return dump_chunk(conn, table['name'], table['columns'], where, path, compression, compress_level,
+                              compress_threads)
+
+        errors = []
+        for (_, table, index, where, path), outcome in run_workers(connections, tasks, handle):
+            if isinstance(outcome, Exception):
+                errors.append(f"{table['name']}#{index}: {outcome}")
+            else:
+                outcome['index'] = index
+                table['chunks'].append(outcome)
+    finally:
+        for conn in [control] + connections:
+            conn.close()
+
+    for table in tables:
+        table['chunks'].sort(key=lambda chunk: chunk.pop('index'))
+        table['rows'] = sum(chunk['rows'] for chunk in table['chunks'])
+    manifest = {
+        'database': db_name,
+        'host': f"{host}:{port}",
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'consistent': consistent,
+        'binlog_position': position,
+        'compression': compression,
+        'tables': tables,
+        'views': views,
+        'routines': routines,
+        'triggers': triggers,
+        'errors': errors,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+    with open(os.path.join(output_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+@contextmanager
+def open_chunk(path):
+    """按后缀流式解压分块文件，得到二进制文件对象，逐行读取时不会把整个分块读入内存"""
+    if path.endswith('.zst'):
+        process = subprocess.Popen(['zstd', '-dc', path], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   bufsize=1024 * 1024)
+        try:
+            yield process.stdout
+        except BaseException:
+            process.kill()
+            raise
+        finally:
+            process.stdout.close()
+            stderr = process.communicate()[1]
+        if process.returncode != 0:
+            raise RuntimeError(f"解压 {os.path.basename(path)} 失败: {stderr.decode('utf-8', 'replace')}")
+        return
+    with (gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')) as f:
+        yield f
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def create_programs(conn, programs):
+    """按导出时的 sql_mode 创建存储过程/函数或触发器"""
+    for program in programs:
+        query(conn, f"DROP {program['type']} IF EXISTS {quote_name(program['name'])}")
+        query(conn, 'SET SESSION sql_mode = %s', (program['sql_mode'],))
+        query(conn, program['create'])
+
+
+def create_views(conn, views):
+    """
+    创建视图。视图可以引用其他视图，按名字顺序创建时被引用的视图可能还不存在，
+    失败的视图留到下一轮重试，直到全部创建成功或一轮中没有任何进展，返回仍然失败的错误列表
+    """
+    for view in views:
+        query(conn, f"DROP VIEW IF EXISTS {quote_name(view['name'])}")
+    pending = list(views)
+    while pending:
+        failed = []
+        for view in pending:
+            try:
+                query(conn, view['create'])
+            except Exception as e:
+                failed.append((view, e))
+        if len(failed) == len(pending):
+            return [f"视图 {view['name']}: {e}" for view, e in failed]
+        pending = [view for view, _ in failed]
+    return []
+
+
+def restore_database(input_dir, host, port, user, password, database=None, workers=8):
+    """
+    按 manifest 恢复：先建库建表，再用 workers 个连接并行导入各分块（导入前校验 sha256），
+    最后依次创建存储过程/函数、视图和触发器（触发器在数据导入之后创建，导入时不会被触发）。
+    database 为目标库名，默认与导出时相同。返回 (导入行数, 错误列表, 耗时)
+    """
+    start = time.perf_counter()
+    with open(os.path.join(input_dir, MANIFEST), encoding='utf-8') as f:
+        manifest = json.load(f)
+    database = database or manifest['database']
+    if manifest.get('errors'):
+        raise RuntimeError(f"导出不完整，不能恢复: {manifest['errors']}")
+
+    admin = connect(host, port, user, password)
+    try:
+        query(admin, f'CREATE DATABASE IF NOT EXISTS {quote_name(database)}')
+        query(admin, f'USE {quote_name(database)}')
+        query(admin, 'SET FOREIGN_KEY_CHECKS = 0')
+        for table in manifest['tables']:
+            query(admin, f"DROP TABLE IF EXISTS {quote_name(table['name'])}")
+            query(admin, table['create'])
+    finally:
+        admin.close()
+
+    tasks = [(table['name'], chunk) for table in manifest['tables'] for chunk in table['chunks']]
+    tasks.sort(key=lambda task: task[1]['bytes'], reverse=True)
+    connections = [connect(host, port, user, password, database) for _ in range(max(1, min(workers, len(tasks))))]
+    for conn in connections:
+        query(conn, 'SET FOREIGN_KEY_CHECKS = 0')
+        query(conn, 'SET UNIQUE_CHECKS = 0')
+
+    def handle(conn, task):
+        table, chunk = task
+        path = os.path.join(input_dir, chunk['file'])
+        if file_sha256(path) != chunk['sha256']:
+            raise RuntimeError(f"{chunk['file']} 校验和不一致")
+        conn.begin()
+        try:
+            with conn.cursor() as cursor:
+                with open_chunk(path) as f:
+                    # 二进制按行读取只在 \n 处分行，与导出时每条语句一行一致
+                    for line in f:
+                        statement = line.rstrip(b'\n')
+                        if statement:
+                            cursor.execute(statement.decode('utf-8'))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return chunk['rows']
+
+    try:
+        outcomes = run_workers(connections, tasks, handle) if tasks else []
+    finally:
+        for conn in connections:
+            conn.close()
+    errors = [f"{table}/{chunk['file']}: {outcome}" for (table, chunk), outcome in outcomes
+              if isinstance(outcome, Exception)]
+    rows = sum(outcome for _, outcome in outcomes if not isinstance(outcome, Exception))
+
+    # 视图可能调用存储函数，先建存储过程/函数再建视图
+    if not errors and (manifest['views'] or manifest.get('routines') or manifest.get('triggers')):
+        admin = connect(host, port, user, password, database)
+        try:
+            create_programs(admin, manifest.get('routines', []))
+            errors = create_views(admin, manifest['views'])
+            if not errors:
+                create_programs(admin, manifest.get('triggers', []))
+        finally:
+            admin.close()
+    return rows, errors, round(time.perf_counter() - start, 3)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='按表并行导出 / 恢复 MySQL 数据库')
+    parser.add_argument('--config', default='./config.ini')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    dump_parser = subparsers.add_parser('dump', help='按表并行导出，默认导出 [databases] 中的所有库')
+    dump_parser.add_argument('databases', nargs='*')
+    dump_parser.add_argument('--workers', type=int, help='并行连接数，默认 [backup] parallel_workers')
+    dump_parser.add_argument('--chunk-rows', type=int, help='大表按主键拆分的每块行数，默认 [backup] chunk_rows')
+    dump_parser.add_argument('--output-dir', default='/opt/backup')
+    restore_parser = subparsers.add_parser('restore', help='按 manifest.json 并行恢复')
+    restore_parser.add_argument('input_dir')
+    restore_parser.add_argument('--database', help='恢复到的库名，默认与导出时相同')
+    restore_parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+
+    config = read_db_config(args.config)
+    db_common = config['database']
+    host, port = db_common['host'], db_common.getint('port')
+    user, password = db_common['user'], db_common['password']
+    webhook_url = db_common.get('webhook_url', '')
+    backup_options = config['backup'] if 'backup' in config else {}
+    workers = args.workers or int(backup_options.get('parallel_workers', 8))
+
+    if args.command == 'restore':
+        rows, errors, seconds = restore_database(args.input_dir, host, port, user, password, args.database, workers)
+        message = f"恢复 {args.input_dir} 完成，导入 {rows} 行，耗时 {seconds}s"
+        if errors:
+            message += "，以下分块或视图失败:\n" + "\n".join(errors)
+        print(message)
+        exit(1 if errors else 0)
+
+    entries = [parse_database_entry(v, host, port) for _, v in config.items('databases')]
+    if args.databases:
+        entries = [entry for entry in entries if entry[0] in args.databases] or \
+                  [(name, host, port) for name in args.databases]
+    chunk_rows = args.chunk_rows or int(backup_options.get('chunk_rows', 1000000))
+    compression = backup_options.get('compression', 'zstd')
+    results = {}
+    for db_name, db_host, db_port in entries:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_dir = os.path.join(args.output_dir, f"{db_name}_{db_host}_{db_port}_parallel_{timestamp}")
+        key = job_key(db_name, db_host, db_port)
+        try:
+            manifest = dump_database(db_name, db_host, db_port, user, password, output_dir, workers, chunk_rows,
+                                     compression, int(backup_options.get('compress_level', 0)) or None,
+                                     int(backup_options.get('compress_threads', 0)))
+            results[key] = {
+                'output_dir': output_dir,
+                'consistent': manifest['consistent'],
+                'tables': len(manifest['tables']),
+                'chunks': sum(len(table['chunks']) for table in manifest['tables']),
+                'rows': sum(table['rows'] for table in manifest['tables']),
+                'bytes': sum(chunk['bytes'] for table in manifest['tables'] for chunk in table['chunks']),
+                'seconds': manifest['seconds'],
+            }
+            if manifest['errors']:
+                results[key]['errors'] = manifest['errors']
+        except Exception as e:
+            results[key] = {'error': f"发生错误: {e}"}
+        print(f"数据库 {db_name}: {results[key]}")
+
+    if webhook_url:
+        send_feishu_notification(f"🔧 按表并行导出报告\n{json.dumps(results, ensure_ascii=False, indent=4)}",
+                                 webhook_url)
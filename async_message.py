@@ -0,0 +1,332 @@
+import asyncio
+import os
+import time
+from datetime import date
+
+try:
+    import httpx
+except ImportError:  # 异步模式需要 httpx: pip install httpx
+    httpx = None
+
+import daily_message as dm
+import http_client
+from daily_message import WeChatMessage, load_profiles, default_profile, is_future_day, local_quote
+from horoscope_corpus import local_horoscope
+from message_template import JSON_HEADERS, dumps
+
+# --- 异步推送 ---
+# 与 WeChatMessage 共用缓存、熔断器、解析和渲染逻辑，网络请求改为 httpx.AsyncClient，
+# 推送同样先写入发件箱再投递（幂等、失败重试、token 失效刷新），由信号量限制并发、
+# 共享 HTTP 层的令牌桶限速，单进程即可以限速上限发送上千条模板消息。
+# ASYNC_SEND_CONCURRENCY: 同时在途的推送请求数，默认 50
+
+
+class AsyncWeChatMessage:
+    def __init__(self, concurrency=None):
+        if httpx is None:
+            raise RuntimeError("异步模式需要安装 httpx: pip install httpx")
+        # 复用同步版本的缓存、熔断器、本地备用数据和渲染逻辑
+        self.base = WeChatMessage()
+        self.concurrency = concurrency or int(os.getenv('ASYNC_SEND_CONCURRENCY', '50'))
+        self.client = None
+        self.fetch_timings = {}
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self):
+        """创建共享的异步客户端（连接池大小与并发数一致）"""
+        if self.client is None:
+            limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+            transport = httpx.AsyncHTTPTransport(retries=int(os.getenv('HTTP_RETRIES', '2')), limits=limits)
+            self.client = httpx.AsyncClient(transport=transport,
+                                            timeout=float(os.getenv('HTTP_TIMEOUT', '10')))
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def _get_json(self, url, params=None):
+        response = await self.client.get(url, params=params)
+        return response.json()
+
+    async def get_access_token(self, force_refresh=False):
+        """
+        获取 access_token。token 有效时直接返回；需要刷新时在线程中走同步的单飞刷新，
+        与其他进程共享同一个 token 存储和锁
+        """
+        manager = self.base.token_manager
+        entry = manager.cache.get(dm.APPID)
+        if not force_refresh and manager._fresh(entry):
+            return entry['access_token']
+        return await asyncio.to_thread(self.base.get_access_token, force_refresh)
+
+    async def get_weather(self, city=None, day=None):
+        """获取天气信息 - 高德天气 API 的异步版本，day 为以后的日期时使用天气预报，失败时使用本地天气数据"""
+        base = self.base
+        city = city or dm.CITY
+        if not dm.AMAP_KEY:
+            return base._get_local_weather()
+        try:
+            adcode = base.geocode_cache.get(city)
+            if not adcode:
+                adcode = await base.breakers.acall('amap_geocode', lambda: self._geocode(city))
+                if adcode:
+                    base.geocode_cache.put(city, adcode)
+            if adcode:
+                if day and day != date.today():
+                    result = await base.content_cache.aget_or_fetch(
+                        'forecast', {'adcode': adcode, 'date': day.isoformat()},
+                        lambda: base.breakers.acall('amap_weather', lambda: self._fetch_forecast(adcode, day)))
+                else:
+                    result = await base.content_cache.aget_or_fetch(
+                        'weather', {'adcode': adcode},
+                        lambda: base.breakers.acall('amap_weather', lambda: self._fetch_weather(adcode)))
+                if result:
+                    return result
+        except Exception as e:
+            print(f"❌ 获取天气信息异常: {e}")
+        return base._get_local_weather()
+
+    async def _geocode(self, city):
+        data = await self._get_json(dm.AMAP_GEOCODE_URL, {'address': city, 'key': dm.AMAP_KEY})
+        return self.base._parse_geocode(city, data)
+
+    async def _fetch_weather(self, adcode):
+        data = await self._get_json(dm.AMAP_WEATHER_URL, self.base._weather_params(adcode))
+        return self.base._parse_weather(data)
+
+    async def _fetch_forecast(self, adcode, day):
+        data = await self._get_json(dm.AMAP_WEATHER_URL, dict(self.base._weather_params(adcode), extensions='all'))
+        return self.base._parse_forecast(data, day)
+
+    async def get_horoscope(self, constellation=None, day=None):
+        """获取星座运势 - 天行数据 API 的异步版本，day 为以后的日期或请求失败时使用本地语料"""
+        base = self.base
+        constellation = constellation or dm.CONSTELLATION
+        if is_future_day(day):
+            return local_horoscope(constellation, day)
+        if dm.TIANAPI_KEY:
+            summary = await base.content_cache.aget_or_fetch(
+                'horoscope', {'astro': constellation},
+                lambda: base.breakers.acall('tianapi_star', lambda: self._fetch_horoscope(constellation)))
+            if summary:
+                return summary
+        return base._get_local_horoscope_summary(constellation, day)
+
+    async def _fetch_horoscope(self, constellation):
+        data = await self._get_json(dm.TIANAPI_STAR_URL, {'key': dm.TIANAPI_KEY, 'astro': constellation})
+        return self.base._parse_horoscope(data)
+
+    async def get_daily_quote(self, day=None):
+        """获取每日一句 - 天行数据 → 一言 → 本地句子；day 为以后的日期时使用按日期选取的本地句子"""
+        base = self.base
+        if is_future_day(day):
+            return local_quote(day)
+        if dm.TIANAPI_KEY:
+            quote = await base.content_cache.aget_or_fetch(
+                'dialogue', {},
+                lambda: base.breakers.acall('tianapi_dialogue', self._fetch_daily_quote))
+            if quote:
+                return quote
+        quote = await base.content_cache.aget_or_fetch(
+            'hitokoto', {}, lambda: base.breakers.acall('hitokoto', self._fetch_hitokoto_quote))
+        return quote or base._get_fallback_quote()
+
+    async def _fetch_daily_quote(self):
+        data = await self._get_json(dm.TIANAPI_DIALOGUE_URL, {'key': dm.TIANAPI_KEY})
+        return self.base._parse_daily_quote(data)
+
+    async def _fetch_hitokoto_quote(self):
+        return self.base._parse_hitokoto(await self._get_json(dm.HITOKOTO_URL))
+
+    async def _timed(self, name, coro):
+        """记录数据源耗时；超过期限被取消时不写记录，fetch_contents 已记为 timeout"""
+        start = time.perf_counter()
+        try:
+            value = await coro
+        except Exception:
+            self.fetch_timings[name] = {'seconds': round(time.perf_counter() - start, 3), 'status': 'error'}
+            raise
+        self.fetch_timings[name] = {'seconds': round(time.perf_counter() - start, 3), 'status': 'ok'}
+        return value
+
+    async def fetch_contents(self, cities=None, constellations=None, deadline=None, day=None):
+        """
+        并发获取所有不同城市的天气、不同星座的运势和每日一句，超过整体期限的使用本地备用数据。
+        day 为内容对应的日期，默认今天（与 WeChatMessage.fetch_contents 相同）
+        """
+        base = self.base
+        deadline = dm.FETCH_DEADLINE if deadline is None else deadline
+        cities = list(dict.fromkeys(cities or [dm.CITY]))
+        constellations = list(dict.fromkeys(constellations or [dm.CONSTELLATION]))
+        self.fetch_timings = {}
+
+        tasks = {}
+        for city in cities:
+            tasks[('weather', city)] = asyncio.create_task(
+                self._timed(f"weather:{city}", self.get_weather(city, day)))
+        for sign in constellations:
+            tasks[('horoscope', sign)] = asyncio.create_task(
+                self._timed(f"horoscope:{sign}", self.get_horoscope(sign, day)))
+        tasks[('daily_quote', None)] = asyncio.create_task(self._timed('daily_quote', self.get_daily_quote(day)))
+
+        start = time.perf_counter()
+        await asyncio.wait(tasks.values(), timeout=deadline)
+        contents = {'weather': {}, 'horoscope': {}, 'daily_quote': None}
+        for (kind, param), task in tasks.items():
+            name = f"{kind}:{param}" if param else kind
+            if task.done() and task.exception() is None:
+                value = task.result()
+            else:
+                if not task.done():
+                    task.cancel()
+                    print(f"⚠️ {name} 超过整体期限 {deadline}s 未返回，使用本地备用数据")
+                    self.fetch_timings[name] = {'seconds': round(time.perf_counter() - start, 3), 'status': 'timeout'}
+                else:
+                    print(f"❌ {name} 获取异常: {task.exception()}，使用本地备用数据")
+                    timing = self.fetch_timings.setdefault(name, {'seconds': round(time.perf_counter() - start, 3)})
+                    timing['status'] = 'error'
+                if kind == 'weather':
+                    value = base._get_local_weather()
+                elif kind == 'horoscope':
+                    value = base._get_local_horoscope_summary(param, day)
+                else:
+                    value = base._get_fallback_quote()
+            if kind == 'daily_quote':
+                contents[kind] = value
+            else:
+                contents[kind][param] = value
+        print(f"⏱️ 内容获取完成，总耗时 {round(time.perf_counter() - start, 3)}s")
+        return contents
+
+    async def _post_template(self, token, payload):
+        """推送单条模板消息，先从共享的令牌桶取令牌（与同步推送共用配额）"""
+        bucket = http_client.get_limits().match(dm.WECHAT_SEND_URL)
+        if bucket is not None:
+            await bucket.aacquire()
+        start = time.perf_counter()
+        result = {'success': False, 'errcode': None, 'errmsg': '', 'seconds': 0}
+        try:
+            response = await self.client.post(dm.WECHAT_SEND_URL, params={'access_token': token},
+                                              content=dumps(payload), headers=JSON_HEADERS)
+            if response.status_code == 429:
+                http_client.report_throttled(dm.WECHAT_SEND_URL)
+            elif bucket is not None and response.status_code < 400:
+                bucket.on_success()
+            res_data = response.json()
+            result['errcode'] = res_data.get('errcode')
+            result['errmsg'] = res_data.get('errmsg', '')
+            result['success'] = res_data.get('errcode') == 0
+        except Exception as e:
+            result['errmsg'] = str(e)
+        result['seconds'] = round(time.perf_counter() - start, 3)
+        return result
+
+    async def send_message(self, user_ids=None, profiles=None, send_date=None):
+        """
+        异步发送模板消息：与 WeChatMessage.send_message 一样写入发件箱再投递，
+        当天已推送成功的接收者跳过，返回每个接收者的结果表（格式相同）
+        """
+        base = self.base
+        if profiles is None:
+            profiles = [default_profile(uid) for uid in user_ids] if user_ids is not None else load_profiles()
+        if not dm.TEMPLATE_ID or not profiles:
+            print("❌ 未配置 WECHAT_TEMPLATE_ID 或 WECHAT_USER_ID")
+            return {}
+
+        send_date = send_date or date.today()
+        day = send_date.isoformat()
+        expired = base.outbox.expire_before(day)
+        if expired:
+            print(f"⚠️ 发件箱中 {expired} 条往日未发送的消息已过期")
+        openids = [p['openid'] for p in profiles]
+        already_sent = base.outbox.sent_openids(day, openids)
+        if already_sent:
+            print(f"⏭️ 今天已推送成功的接收者 {len(already_sent)} 个，跳过")
+        profiles = [p for p in profiles if p['openid'] not in already_sent]
+
+        if profiles:
+            await self.open()
+            token = await self.get_access_token()
+            if not token:
+                print("❌ 无法获取有效的 access_token")
+                return {openid: {'success': openid in already_sent, 'status': 'sent' if openid in already_sent
+                                 else 'pending', 'errcode': None, 'errmsg': '无法获取 access_token',
+                                 'attempts': 0, 'seconds': 0}
+                        for openid in openids}
+
+            contents = await self.fetch_contents(cities=[p['city'] for p in profiles],
+                                                 constellations=[p['constellation'] for p in profiles],
+                                                 day=send_date)
+            payloads = base.render_payloads(profiles, contents, today=send_date)
+            base.outbox.enqueue(day, payloads)
+            await self.deliver_outbox(day)
+
+        results = base._collect_results(day, openids)
+        succeeded = sum(1 for r in results.values() if r['success'])
+        print(f"📊 推送结果: 成功 {succeeded} / 共 {len(results)}")
+        return results
+
+    async def deliver_outbox(self, send_date, timeout=None):
+        """
+        WeChatMessage.deliver_outbox 的异步版本：按信号量并发投递发件箱中当天待发送的消息，
+        结果由同一个 _handle_delivery 处理（失败退避重试、token 失效刷新、限流降速）
+        """
+        base = self.base
+        deadline = time.monotonic() + (dm.OUTBOX_DRAIN_TIMEOUT if timeout is None else timeout)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send_one(token, payload):
+            async with semaphore:
+                return await self._post_template(token, payload)
+
+        while True:
+            batch = base.outbox.due(send_date)
+            if not batch:
+                next_at = base.outbox.next_due_at(send_date)
+                if next_at is None:
+                    break
+                wait_time = max(0, next_at - time.time())
+                if time.monotonic() + wait_time > deadline:
+                    print("⚠️ 仍有消息等待重试，超过投递时限，留在发件箱中下次运行继续投递")
+                    break
+                await asyncio.sleep(wait_time)
+                continue
+
+            token = await self.get_access_token()
+            if not token:
+                print("❌ 无法获取有效的 access_token，停止投递")
+                break
+            outcomes = await asyncio.gather(*(send_one(token, payload) for _, _, payload in batch))
+            token_expired = False
+            for (row_id, attempts, payload), result in zip(batch, outcomes):
+                token_expired |= base._handle_delivery(row_id, attempts, payload['touser'], result)
+            if token_expired:
+                print("🔄 access_token 已失效，刷新后重试")
+                await self.get_access_token(force_refresh=True)
+
+    async def run_async(self):
+        async with self:
+            return await self.send_message()
+
+    def run(self):
+        """同步入口，内部运行事件循环"""
+        print("--- 开始执行推送任务（异步模式） ---")
+        results = asyncio.run(self.run_async())
+        if results and all(r['success'] for r in results.values()):
+            print("--- 消息推送任务完成 ---")
+        else:
+            print("--- 消息推送任务失败 ---")
+        return results
+
+
+if __name__ == "__main__":
+    if dm.load_env_file():
+        dm.configure()
+    AsyncWeChatMessage().run()
@@ -0,0 +1,248 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+from fake_providers import FakeProviders, add_fault_arguments, parse_errcodes
+
+# --- 端到端压测 ---
+# 启动本地模拟数据源（fake_providers.py），分别以以下模式推送 N 条模板消息，不访问任何真实接口：
+#   sync      逐条推送 (SEND_CONCURRENCY=1)
+#   batch     有限并发批量推送 (WeChatMessage.send_message)
+#   prefetch  先预取并渲染（不计时），再只做投递
+#   async     异步推送 (AsyncWeChatMessage)
+# 输出每种模式的吞吐 (msgs/s)、端到端延迟 p50/p95/p99（从开始推送到该条消息送达）以及各数据源的耗时分布：
+#   python benchmark.py --recipients 1000 --latency 0.05 --errcode 45009:0.01
+#   python benchmark.py --modes batch,async --json bench.json
+# 冷启动（python -X importtime，每次都是新进程）：
+#   python benchmark.py --cold-start --runs 10
+
+MODES = ('sync', 'batch', 'prefetch', 'async')
+CITIES = ('广州', '深圳', '北京', '上海', '杭州', '成都', '武汉', '南京', '西安', '重庆')
+
+
+def percentile(values, pct):
+    """最近秩法百分位数，values 为空时返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(values):
+    values = list(values)
+    return {
+        'count': len(values),
+        'total': round(sum(values), 3),
+        'p50': _ms(percentile(values, 50)),
+        'p95': _ms(percentile(values, 95)),
+        'p99': _ms(percentile(values, 99)),
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def make_profiles(dm, count, cities):
+    from horoscope_corpus import CONSTELLATIONS
+
+    return [dm.default_profile(f"bench_{i:06d}", city=CITIES[i % cities] if cities <= len(CITIES)
+                               else f"城市{i % cities}", constellation=CONSTELLATIONS[i % len(CONSTELLATIONS)])
+            for i in range(count)]
+
+
+def configure(dm, args):
+    """把 daily_message 的配置指向模拟服务和压测参数"""
+    dm.APPID = dm.APPID or 'bench_appid'
+    dm.APPSECRET = dm.APPSECRET or 'bench_secret'
+    dm.TEMPLATE_ID = 'bench_template'
+    dm.AMAP_KEY = 'bench_amap_key'
+    dm.TIANAPI_KEY = 'bench_tianapi_key'
+    dm.SEND_RATE = args.rate
+    dm.FETCH_DEADLINE = args.deadline
+    dm.OUTBOX_RETRY_DELAY = 0.05
+    dm.OUTBOX_RATE_LIMIT_DELAY = 0.2
+
+
+def run_mode(mode, dm, fake, args):
+    """运行一种模式，返回该模式的统计结果"""
+    cache_dir = tempfile.mkdtemp(prefix=f'bench_{mode}_')
+    # 每种模式使用全新的缓存目录，各模式都从冷缓存开始
+    os.environ['DAILY_MESSAGE_CACHE_DIR'] = cache_dir
+    os.environ['TOKEN_STORE'] = 'memory'
+    dm.SEND_CONCURRENCY = 1 if mode == 'sync' else args.concurrency
+    profiles = make_profiles(dm, args.recipients, args.cities)
+    output = sys.stdout if args.verbose else StringIO()
+
+    try:
+        with redirect_stdout(output):
+            if mode == 'async':
+                from async_message import AsyncWeChatMessage
+
+                sender = AsyncWeChatMessage(concurrency=args.concurrency)
+                fake.reset()
+                start = time.perf_counter()
+
+                async def send():
+                    async with sender:
+                        return await sender.send_message(profiles=profiles)
+
+                results = asyncio.run(send())
+            else:
+                sender = dm.WeChatMessage()
+                if mode == 'prefetch':
+                    sender.prefetch(profiles)
+                fake.reset()
+                start = time.perf_counter()
+                results = sender.send_message(profiles=profiles)
+            elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    records = fake.snapshot()
+    # 每条消息最后一次成功送达的时间，相对开始推送的时刻
+    delivered = {}
+    for provider, _, end, openid in records:
+        if provider == 'wechat_send' and openid and results.get(openid, {}).get('success'):
+            delivered[openid] = end - start
+    providers = {}
+    for provider, begin, end, _ in records:
+        providers.setdefault(provider, []).append(end - begin)
+
+    succeeded = sum(1 for r in results.values() if r['success'])
+    return {
+        'mode': mode,
+        'recipients': len(profiles),
+        'succeeded': succeeded,
+        'seconds': round(elapsed, 3),
+        'msgs_per_sec': round(succeeded / elapsed, 1) if elapsed else None,
+        'latency_ms': summarize(delivered.values()),
+        'providers': {name: summarize(values) for name, values in sorted(providers.items())},
+    }
+
+
+def print_report(report):
+    print(f"\n=== {report['mode']} ===")
+    latency = report['latency_ms']
+    print(f"成功 {report['succeeded']} / {report['recipients']}，耗时 {report['seconds']}s，"
+          f"吞吐 {report['msgs_per_sec']} msgs/s")
+    print(f"端到端延迟(ms): p50={latency['p50']} p95={latency['p95']} p99={latency['p99']}")
+    print(f"{'数据源':<18}{'请求数':>8}{'累计(s)':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for name, stats in report['providers'].items():
+        print(f"{name:<18}{stats['count']:>8}{stats['total']:>10}{stats['p50']:>10}{stats['p95']:>10}"
+              f"{stats['p99']:>10}")
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 的输出，返回 [(模块, 自身耗时us, 累计耗时us)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def cold_start(runs, module='daily_message', top=10):
+    """多次在新进程中导入模块，统计导入耗时、进程总耗时和最慢的模块"""
+    root = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, '-X', 'importtime', '-c', f'import {module}']
+    imports, walls, slowest = [], [], {}
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run(command, cwd=root, capture_output=True, text=True, check=True)
+        walls.append(time.perf_counter() - start)
+        rows = parse_importtime(proc.stderr)
+        imports.extend(cumulative / 1e6 for name, _, cumulative in rows if name == module)
+        for name, self_us, _ in rows:
+            slowest.setdefault(name, []).append(self_us / 1e6)
+    modules = sorted(((name, percentile(values, 50)) for name, values in slowest.items()),
+                     key=lambda item: item[1], reverse=True)[:top]
+    return {
+        'module': module,
+        'runs': runs,
+        'import_ms': summarize(imports),
+        'process_ms': summarize(walls),
+        'slowest_modules_ms': {name: _ms(seconds) for name, seconds in modules},
+    }
+
+
+def print_cold_start(report):
+    print(f"=== 冷启动: import {report['module']}（{report['runs']} 次） ===")
+    for label, key in (('导入耗时', 'import_ms'), ('进程总耗时', 'process_ms')):
+        stats = report[key]
+        print(f"{label}(ms): p50={stats['p50']} p95={stats['p95']} p99={stats['p99']}")
+    print("自身导入耗时最多的模块(ms, 中位数):")
+    for name, ms in report['slowest_modules_ms'].items():
+        print(f"  {name:<40}{ms:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='daily_message 端到端压测（使用本地模拟数据源）')
+    parser.add_argument('--recipients', type=int, default=200, help='接收者数量')
+    parser.add_argument('--cities', type=int, default=5, help='接收者分布的不同城市数')
+    parser.add_argument('--modes', default=','.join(MODES), help=f"逗号分隔，可选 {', '.join(MODES)}")
+    parser.add_argument('--concurrency', type=int, default=16, help='batch / async 模式的推送并发数')
+    parser.add_argument('--rate', type=float, default=0, help='每秒推送上限，0 表示不限速')
+    parser.add_argument('--deadline', type=float, default=15, help='内容获取的整体期限(秒)')
+    parser.add_argument('--json', dest='json_path', help='把结果写入 JSON 文件')
+    parser.add_argument('--verbose', action='store_true', help='显示推送过程的输出')
+    parser.add_argument('--cold-start', action='store_true', help='只测量冷启动的导入耗时 (-X importtime)')
+    parser.add_argument('--runs', type=int, default=5, help='冷启动测量的次数')
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    if args.cold_start:
+        report = cold_start(args.runs)
+        print_cold_start(report)
+        if args.json_path:
+            with open(args.json_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        return
+
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"未知的模式: {', '.join(sorted(unknown))}")
+
+    fake = FakeProviders(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                         wechat_errcodes=parse_errcodes(args.errcode), seed=args.seed).start()
+    # 接口地址在 daily_message 导入时读取，必须先设置环境变量再导入
+    os.environ.update(fake.env())
+    with redirect_stdout(StringIO()):
+        import daily_message as dm
+    configure(dm, args)
+    print(f"模拟数据源: {fake.base_url}，接收者 {args.recipients} 个，延迟 {args.latency}s (+0~{args.jitter}s)，"
+          f"错误率 {args.error_rate}")
+
+    reports = []
+    try:
+        for mode in modes:
+            try:
+                report = run_mode(mode, dm, fake, args)
+            except RuntimeError as e:  # 如未安装 httpx 时的异步模式
+                print(f"⚠️ 跳过 {mode} 模式: {e}")
+                continue
+            reports.append(report)
+            print_report(report)
+    finally:
+        fake.stop()
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
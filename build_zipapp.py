@@ -0,0 +1,59 @@
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import zipapp
+
+# --- 单文件打包 ---
+# 把根目录下的模块和 requirements.txt 中的依赖打成一个可直接运行的 zipapp：
+#   python build_zipapp.py                 # 生成 dist/daily_message.pyz
+#   python dist/daily_message.pyz          # 等同于 python daily_message.py，参数也相同
+# 运行环境不需要再 pip install；依赖中的 C 扩展无法从 zip 中加载，打包时会给出提示
+# （requests 的依赖均有纯 Python 实现，可正常运行）。
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# 只用于开发和压测的模块不打包
+EXCLUDE = {'build_zipapp.py', 'benchmark.py', 'fake_providers.py'}
+
+
+def build(output, with_deps=True):
+    build_dir = tempfile.mkdtemp(prefix='daily_message_pyz_')
+    try:
+        for path in glob.glob(os.path.join(ROOT, '*.py')):
+            if os.path.basename(path) not in EXCLUDE:
+                shutil.copy2(path, build_dir)
+
+        if with_deps:
+            subprocess.run([sys.executable, '-m', 'pip', 'install', '--quiet', '--disable-pip-version-check',
+                            '--no-compile', '--target', build_dir, '-r', os.path.join(ROOT, 'requirements.txt')],
+                           check=True)
+            # 去掉运行时用不到的文件，减小体积
+            for pattern in ('*.dist-info', 'bin'):
+                for path in glob.glob(os.path.join(build_dir, pattern)):
+                    shutil.rmtree(path, ignore_errors=True)
+            extensions = glob.glob(os.path.join(build_dir, '**', '*.so'), recursive=True)
+            extensions += glob.glob(os.path.join(build_dir, '**', '*.pyd'), recursive=True)
+            if extensions:
+                print(f"⚠️ 以下 C 扩展无法从 zip 中加载，将使用对应的纯 Python 实现: "
+                      f"{', '.join(os.path.relpath(p, build_dir) for p in extensions)}")
+
+        directory = os.path.dirname(output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        zipapp.create_archive(build_dir, output, interpreter='/usr/bin/env python3', main='daily_message:main',
+                              compressed=True)
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+    print(f"✅ 已生成 {output} ({round(os.path.getsize(output) / 1024)} KB)")
+    return output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='把 daily_message 打包为单文件 zipapp')
+    parser.add_argument('--output', default=os.path.join(ROOT, 'dist', 'daily_message.pyz'))
+    parser.add_argument('--no-deps', action='store_true', help='不打包依赖（运行环境已安装 requirements.txt）')
+    args = parser.parse_args()
+    build(args.output, with_deps=not args.no_deps)
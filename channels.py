@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import http_client
+import metrics
+from rate_limit import RateLimiter
+
+# --- 推送渠道 ---
+# 内容只获取、渲染一次（微信模板消息的 payload），再由各渠道并行投递。
+# 微信模板消息走发件箱（见 WeChatMessage.deliver_outbox），其余渠道在这里实现，
+# 每个渠道有自己的连接池、并发数和限速器，一个渠道变慢不会拖住其他渠道。
+# 默认接收者为 WECHAT_USER_ID，未配置时为接收者列表中的第一个。
+# SERVERCHAN_SEND_KEY: Server酱 SendKey，逗号分隔可配置多个，收到默认接收者的消息
+# FEISHU_WEBHOOK_URL: 飞书自定义机器人 webhook，逗号分隔可配置多个，收到默认接收者的消息
+# 接收者档案中也可以填写 serverchan_key / feishu_webhook 字段，把该接收者自己的消息同时发到这些渠道。
+# <渠道>_CONCURRENCY / <渠道>_RATE: 各渠道的并发数和每秒条数，如 FEISHU_RATE=5
+
+# SERVERCHAN_BASE_URL: 可指向本地模拟服务（见 fake_providers.py）
+
+
+def serverchan_url(key):
+    base_url = os.getenv('SERVERCHAN_BASE_URL', 'https://sctapi.ftqq.com').rstrip('/')
+    return f"{base_url}/{key}.send"
+
+
+def payload_fields(payload):
+    """模板消息 payload 中各字段的值"""
+    return {name: field['value'] for name, field in payload['data'].items()}
+
+
+def payload_title(payload):
+    return f"🌞 早安推送 - {payload_fields(payload)['date']}"
+
+
+def payload_text(payload):
+    """把模板消息转成纯文本，文本类渠道共用"""
+    fields = payload_fields(payload)
+    return "\n".join([
+        f"🌞 早安{fields['girlfriend_name']}！",
+        f"📅 {fields['date']}",
+        "",
+        f"🌤️ 今日天气 ({fields['city']})",
+        fields['weather'],
+        "",
+        fields['love_days'],
+        fields['birthday_left'],
+        "",
+        f"✨ 星座运势 ({fields['constellation']})",
+        fields['horoscope'],
+        "",
+        "💌 每日一句",
+        fields['daily_quote'],
+    ])
+
+
+def _split(value):
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+class Channel:
+    """文本类推送渠道的基类，子类实现 send(target, title, text)"""
+
+    name = 'channel'
+    profile_field = None  # 接收者档案中指定该渠道目标的字段
+    default_concurrency = 4
+    default_rate = 1.0
+
+    def __init__(self, targets=(), concurrency=None, rate=None):
+        prefix = self.name.upper()
+        self.targets = list(targets)
+        self.concurrency = concurrency or int(os.getenv(f'{prefix}_CONCURRENCY', str(self.default_concurrency)))
+        if rate is None:
+            rate = float(os.getenv(f'{prefix}_RATE', str(self.default_rate)))
+        self.limiter = RateLimiter(rate)
+        # 独立的连接池，不占用模板消息推送的连接；第一次发送时才创建（同时才导入 requests）
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = http_client.create_session(pool_size=self.concurrency)
+        return self._session
+
+    def messages(self, default_payload, recipients):
+        """
+        本渠道要发送的 [(目标, payload)]：全局配置的目标收到默认接收者的消息 default_payload（为 None 时不发送），
+        档案中填写了目标的接收者收到自己的消息。recipients 为 [(接收者档案, payload)]
+        """
+        items = {}
+        if default_payload is not None:
+            for target in self.targets:
+                items[target] = default_payload
+        if self.profile_field:
+            for profile, payload in recipients:
+                target = profile.get(self.profile_field)
+                if target:
+                    items[target] = payload
+        return list(items.items())
+
+    def deliver(self, messages):
+        """以本渠道的并发数和限速发送，返回 {目标: 结果}"""
+        if not messages:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(messages)),
+                                thread_name_prefix=self.name) as executor:
+            outcomes = list(executor.map(self._send_one, messages))
+        return {target: result for (target, _), result in zip(messages, outcomes)}
+
+    def _send_one(self, message):
+        target, payload = message
+        self.limiter.acquire()
+        start = time.perf_counter()
+        result = {'success': False, 'errcode': None, 'errmsg': '', 'seconds': 0}
+        try:
+            result.update(self.send(target, payload_title(payload), payload_text(payload)))
+        except Exception as e:
+            result['errmsg'] = str(e)
+        result['seconds'] = round(time.perf_counter() - start, 3)
+        metrics.inc('channel_send_total', channel=self.name, result='sent' if result['success'] else 'failed')
+        metrics.observe('channel_send_seconds', result['seconds'], channel=self.name)
+        return result
+
+    def post(self, url, **kwargs):
+        return http_client.post(url, session=self.session, **kwargs)
+
+    def send(self, target, title, text):
+        raise NotImplementedError
+
+
+class ServerChanChannel(Channel):
+    """Server酱 (sctapi.ftqq.com)，目标为 SendKey"""
+
+    name = 'serverchan'
+    profile_field = 'serverchan_key'
+
+    def send(self, target, title, text):
+        # desp 为 Markdown，单个换行不会分段
+        response = self.post(serverchan_url(target),
+                             data={'title': title, 'desp': text.replace('\n', '\n\n')})
+        data = response.json()
+        return {'success': data.get('code') == 0, 'errcode': data.get('code'), 'errmsg': data.get('message', '')}
+
+
+class FeishuChannel(Channel):
+    """飞书自定义机器人，目标为 webhook 地址"""
+
+    name = 'feishu'
+    profile_field = 'feishu_webhook'
+    default_rate = 5.0  # 自定义机器人限制每秒 5 次
+
+    def send(self, target, title, text):
+        payload = {"msg_type": "text", "content": {"text": f"{title}\n\n{text}"}}
+        response = self.post(target, json=payload)
+        data = response.json()
+        # 新版接口返回 code，旧版返回 StatusCode
+        code = data.get('code', data.get('StatusCode'))
+        return {'success': response.status_code == 200 and code == 0, 'errcode': code,
+                'errmsg': data.get('msg', data.get('StatusMessage', ''))}
+
+
+# 接收者档案中可选的渠道目标字段
+PROFILE_FIELDS = (ServerChanChannel.profile_field, FeishuChannel.profile_field)
+
+
+def default_channels():
+    """除微信模板消息外的推送渠道，目标来自环境变量和接收者档案，没有目标的渠道不会发送"""
+    return [ServerChanChannel(_split(os.getenv('SERVERCHAN_SEND_KEY'))),
+            FeishuChannel(_split(os.getenv('FEISHU_WEBHOOK_URL')))]
@@ -0,0 +1,184 @@
+import json
+import os
+import threading
+import time
+
+import metrics
+from storage import atomic_write, cache_path
+
+# --- 数据源熔断器 ---
+# 某个数据源连续失败达到阈值后熔断 (open)，熔断期间直接使用备用数据，不再等待超时；
+# 冷却时间过后放行一次试探请求 (half_open)，成功则恢复 (closed)，失败则继续熔断。
+# 状态和失败统计持久化到本地文件，多次运行之间共享。
+# BREAKER_FAILURE_THRESHOLD: 连续失败多少次后熔断，默认 3
+# BREAKER_RESET_TIMEOUT: 熔断后多少秒放行试探请求，默认 300
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """单个数据源的熔断器，线程安全"""
+
+    def __init__(self, name, registry, failure_threshold, reset_timeout, state=None):
+        self.name = name
+        self.registry = registry
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.trial_in_flight = False
+        self.stats = {
+            'state': CLOSED,
+            'consecutive_failures': 0,
+            'total_failures': 0,
+            'total_successes': 0,
+            'opened_at': 0,
+            'last_error': '',
+        }
+        self.stats.update(state or {})
+
+    @property
+    def state(self):
+        return self.stats['state']
+
+    def allow(self):
+        """是否放行本次请求"""
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.time() - self.stats['opened_at'] >= self.reset_timeout:
+                self.stats['state'] = HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == HALF_OPEN and not self.trial_in_flight:
+                # 半开状态只放行一个试探请求
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            changed = self.state != CLOSED
+            self.stats['state'] = CLOSED
+            self.stats['consecutive_failures'] = 0
+            self.stats['total_successes'] += 1
+            self.trial_in_flight = False
+        if changed:
+            print(f"✅ 数据源 {self.name} 已恢复，熔断关闭")
+        self.registry.save()
+
+    def record_failure(self, error=''):
+        with self.lock:
+            self.stats['consecutive_failures'] += 1
+            self.stats['total_failures'] += 1
+            self.stats['last_error'] = str(error)[:200]
+            opened = (self.state == HALF_OPEN
+                      or (self.state == CLOSED and self.stats['consecutive_failures'] >= self.failure_threshold))
+            if opened:
+                self.stats['state'] = OPEN
+                self.stats['opened_at'] = time.time()
+            self.trial_in_flight = False
+        if opened:
+            print(f"⚡ 数据源 {self.name} 连续失败 {self.stats['consecutive_failures']} 次，"
+                  f"熔断 {self.reset_timeout}s")
+        self.registry.save()
+
+    def call(self, fetcher):
+        """
+        通过熔断器调用 fetcher()。fetcher 返回 None 或抛出异常都记为失败；
+        熔断期间不调用 fetcher，直接返回 None 由调用方使用备用数据
+        """
+        if not self.allow():
+            print(f"⚡ 数据源 {self.name} 熔断中，直接使用备用数据")
+            self._observe('rejected', 0)
+            return None
+        start = time.perf_counter()
+        try:
+            value = fetcher()
+        except Exception as e:
+            print(f"❌ 数据源 {self.name} 请求异常: {e}")
+            self._observe('error', time.perf_counter() - start)
+            self.record_failure(e)
+            return None
+        self._observe('ok' if value is not None else 'invalid', time.perf_counter() - start)
+        return self._record(value)
+
+    async def acall(self, fetcher):
+        """call 的异步版本，fetcher 为返回协程的函数"""
+        if not self.allow():
+            print(f"⚡ 数据源 {self.name} 熔断中，直接使用备用数据")
+            self._observe('rejected', 0)
+            return None
+        start = time.perf_counter()
+        try:
+            value = await fetcher()
+        except Exception as e:
+            print(f"❌ 数据源 {self.name} 请求异常: {e}")
+            self._observe('error', time.perf_counter() - start)
+            self.record_failure(e)
+            return None
+        self._observe('ok' if value is not None else 'invalid', time.perf_counter() - start)
+        return self._record(value)
+
+    def _observe(self, result, seconds):
+        metrics.inc('provider_calls_total', provider=self.name, result=result)
+        if result != 'rejected':
+            metrics.observe('provider_call_seconds', seconds, provider=self.name)
+        metrics.event('provider_call', provider=self.name, result=result, seconds=round(seconds, 4))
+
+    def _record(self, value):
+        if value is None:
+            self.record_failure('返回无效数据')
+        else:
+            self.record_success()
+        return value
+
+
+class BreakerRegistry:
+    """按数据源名称管理熔断器，并把状态持久化到 JSON 文件"""
+
+    def __init__(self, path=None, failure_threshold=None, reset_timeout=None):
+        self.path = path or cache_path('breakers.json')
+        self.failure_threshold = failure_threshold or int(os.getenv('BREAKER_FAILURE_THRESHOLD', '3'))
+        self.reset_timeout = reset_timeout or float(os.getenv('BREAKER_RESET_TIMEOUT', '300'))
+        self.lock = threading.Lock()
+        self.saved = self._load()
+        self.breakers = {}
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, name):
+        with self.lock:
+            if name not in self.breakers:
+                self.breakers[name] = CircuitBreaker(name, self, self.failure_threshold, self.reset_timeout,
+                                                     self.saved.get(name))
+            return self.breakers[name]
+
+    def call(self, name, fetcher):
+        return self.get(name).call(fetcher)
+
+    async def acall(self, name, fetcher):
+        return await self.get(name).acall(fetcher)
+
+    def snapshot(self):
+        """各数据源当前的状态和统计"""
+        with self.lock:
+            breakers = list(self.breakers.values())
+        data = dict(self.saved)
+        for breaker in breakers:
+            with breaker.lock:
+                data[breaker.name] = dict(breaker.stats)
+        return data
+
+    def save(self):
+        data = self.snapshot()
+        with self.lock:
+            try:
+                atomic_write(self.path, json.dumps(data, ensure_ascii=False, indent=2))
+            except OSError as e:
+                print(f"⚠️ 保存熔断器状态失败: {e}")
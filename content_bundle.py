@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+from storage import atomic_write, cache_path
+
+# --- 预取内容包 ---
+# 发送窗口之前（如前一天晚上或推送前几分钟）运行 `python daily_message.py --prefetch`，
+# 把各城市天气、各星座运势、每日一句以及渲染好的模板消息保存为按发送日期命名的 JSON 文件；
+# 发送时直接读取这些消息写入发件箱并投递，数据源的延迟不再落在推送的关键路径上。
+# 接收者档案或模板在预取之后发生变化的，发送时会改为实时获取并给出提示。
+# PREFETCH_BUNDLE_DIR: 内容包目录，默认 DAILY_MESSAGE_CACHE_DIR/bundles
+# PREFETCH_BUNDLE_MAX_AGE: 内容包的最长使用时间(秒)，默认 86400
+# PREFETCH_BUNDLE_KEEP_DAYS: 保留最近多少天的内容包，默认 7
+
+
+def profile_fingerprint(profile):
+    """接收者档案的指纹，档案任何字段变化后预取的消息不再使用"""
+    text = json.dumps(profile, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class BundleStore:
+    """按发送日期保存预取内容和已渲染消息，线程安全"""
+
+    def __init__(self, directory=None, max_age=None, keep_days=None):
+        self.directory = directory or os.getenv('PREFETCH_BUNDLE_DIR') or cache_path('bundles')
+        self.max_age = max_age or int(os.getenv('PREFETCH_BUNDLE_MAX_AGE', '86400'))
+        self.keep_days = keep_days or int(os.getenv('PREFETCH_BUNDLE_KEEP_DAYS', '7'))
+        self.lock = threading.Lock()
+
+    def path_for(self, send_date):
+        return os.path.join(self.directory, f"{send_date.isoformat()}.json")
+
+    def load(self, send_date):
+        """读取某个发送日期的内容包，不存在或损坏时返回 None"""
+        try:
+            with open(self.path_for(send_date), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, send_date, profiles, payloads, contents):
+        """
+        保存预取结果。同一日期已有内容包时按 openid 合并（常驻模式下不同推送时段分别预取），
+        返回内容包路径
+        """
+        now = time.time()
+        with self.lock:
+            bundle = self.load(send_date) or {'send_date': send_date.isoformat(), 'entries': {}}
+            bundle['contents'] = contents
+            for profile, payload in zip(profiles, payloads):
+                bundle['entries'][profile['openid']] = {
+                    'fingerprint': profile_fingerprint(profile),
+                    'created_at': now,
+                    'payload': payload,
+                }
+            bundle['updated_at'] = now
+
+            path = self.path_for(send_date)
+            atomic_write(path, json.dumps(bundle, ensure_ascii=False))
+            self._prune(send_date)
+        return path
+
+    def take(self, send_date, profiles, template_id=None):
+        """
+        取出可直接投递的预取消息。
+        返回 (payloads, missing)：missing 为没有可用预取消息的接收者（未预取、档案或模板已变化、内容包过期），
+        需要实时获取内容
+        """
+        bundle = self.load(send_date)
+        if not bundle:
+            return [], list(profiles)
+        entries = bundle.get('entries', {})
+        now = time.time()
+        payloads, missing = [], []
+        for profile in profiles:
+            entry = entries.get(profile['openid'])
+            usable = (entry is not None
+                      and now - entry['created_at'] <= self.max_age
+                      and entry['fingerprint'] == profile_fingerprint(profile)
+                      and (template_id is None or entry['payload'].get('template_id') == template_id))
+            if usable:
+                payloads.append(entry['payload'])
+            else:
+                missing.append(profile)
+        return payloads, missing
+
+    def _prune(self, send_date):
+        """删除 keep_days 天之前的内容包"""
+        oldest = (send_date - timedelta(days=self.keep_days)).isoformat()
+        for name in os.listdir(self.directory):
+            if name.endswith('.json') and name[:-5] < oldest:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+
+def parse_send_date(value):
+    """解析 --date 参数: today / tomorrow / YYYY-MM-DD"""
+    if not value or value == 'today':
+        return date.today()
+    if value == 'tomorrow':
+        return date.today() + timedelta(days=1)
+    return date.fromisoformat(value)
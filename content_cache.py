@@ -0,0 +1,180 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from storage import cache_path
+
+# --- 内容缓存（天气 / 星座运势 / 每日一句） ---
+# 同一时间段内相同参数的内容对所有接收者都一样，缓存键为 (数据源, 参数, 时间段)。
+# 两级缓存：进程内 LRU + 本地 SQLite，跨接收者、跨运行复用。
+# CONTENT_TTL_<PROVIDER>: 各数据源的时间段长度(秒)，如 CONTENT_TTL_WEATHER=3600
+# CONTENT_CACHE_SIZE: 内存 LRU 的最大条目数，默认 256
+# CONTENT_CACHE_DISK: 设为 0 可禁用磁盘缓存
+
+DEFAULT_TTLS = {
+    'weather': 3600,  # 天气按小时
+    'forecast': 3600,  # 天气预报（预取明天的内容）按小时
+    'horoscope': 86400,  # 星座运势按天
+    'dialogue': 86400,  # 每日一句按天
+    'hitokoto': 86400,
+}
+
+
+def time_bucket(ttl, now=None):
+    """按本地时间对齐的时间段编号，ttl=86400 时即为本地日期的序号"""
+    now = time.time() if now is None else now
+    local_offset = time.localtime(now).tm_gmtoff
+    return int((now + local_offset) // ttl)
+
+
+class ContentCache:
+    """带命中统计的两级内容缓存，线程安全"""
+
+    def __init__(self, path=None, max_entries=None, ttls=None, use_disk=None):
+        self.path = path or cache_path('content.db')
+        self.max_entries = max_entries or int(os.getenv('CONTENT_CACHE_SIZE', '256'))
+        self.ttls = dict(DEFAULT_TTLS)
+        for provider in DEFAULT_TTLS:
+            env_ttl = os.getenv(f'CONTENT_TTL_{provider.upper()}')
+            if env_ttl:
+                self.ttls[provider] = int(env_ttl)
+        self.ttls.update(ttls or {})
+        if use_disk is None:
+            use_disk = os.getenv('CONTENT_CACHE_DISK', '1') != '0'
+        self.use_disk = use_disk
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.async_key_locks = {}
+        # {provider: {'memory_hits': n, 'disk_hits': n, 'misses': n}}
+        self.stats = {}
+        if self.use_disk:
+            self._init_disk()
+
+    def _init_disk(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS content ('
+                         'key TEXT PRIMARY KEY, value TEXT NOT NULL, expire_at REAL NOT NULL)')
+            conn.execute('DELETE FROM content WHERE expire_at < ?', (time.time(),))
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def make_key(self, provider, params, now=None):
+        ttl = self.ttls.get(provider, 3600)
+        params_text = json.dumps(params or {}, sort_keys=True, ensure_ascii=False)
+        return f"{provider}|{params_text}|{time_bucket(ttl, now)}"
+
+    def _count(self, provider, field):
+        counters = self.stats.setdefault(provider, {'memory_hits': 0, 'disk_hits': 0, 'misses': 0})
+        counters[field] += 1
+        metrics.inc('cache_requests_total', provider=provider, result=field)
+
+    def get(self, provider, params):
+        """读取缓存，未命中返回 None"""
+        key = self.make_key(provider, params)
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self._count(provider, 'memory_hits')
+                return self.memory[key]
+
+        value = None
+        if self.use_disk:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute('SELECT value FROM content WHERE key = ? AND expire_at >= ?',
+                                       (key, time.time())).fetchone()
+                if row:
+                    value = json.loads(row[0])
+            except sqlite3.Error as e:
+                print(f"⚠️ 读取内容缓存失败: {e}")
+
+        with self.lock:
+            if value is None:
+                self._count(provider, 'misses')
+                return None
+            self._count(provider, 'disk_hits')
+            self._remember(key, value)
+        return value
+
+    def put(self, provider, params, value):
+        key = self.make_key(provider, params)
+        with self.lock:
+            self._remember(key, value)
+        if self.use_disk:
+            ttl = self.ttls.get(provider, 3600)
+            # 过期时间为所在时间段的结束
+            expire_at = (time_bucket(ttl) + 1) * ttl - time.localtime().tm_gmtoff
+            try:
+                with self._connect() as conn:
+                    conn.execute('INSERT OR REPLACE INTO content (key, value, expire_at) VALUES (?, ?, ?)',
+                                 (key, json.dumps(value, ensure_ascii=False), expire_at))
+            except sqlite3.Error as e:
+                print(f"⚠️ 写入内容缓存失败: {e}")
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def get_or_fetch(self, provider, params, fetcher):
+        """
+        命中缓存直接返回，否则调用 fetcher() 获取。
+        fetcher 返回 None 表示获取失败（走备用数据），失败结果不写入缓存
+        """
+        value = self.get(provider, params)
+        if value is not None:
+            return value
+        # 同一个键只允许一个线程去请求，其余线程等待后直接读取结果
+        key = self.make_key(provider, params)
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self.lock:
+                value = self.memory.get(key)
+            if value is not None:
+                return value
+            value = fetcher()
+            if value is not None:
+                self.put(provider, params, value)
+        with self.lock:
+            self.key_locks.pop(key, None)
+        return value
+
+    async def aget_or_fetch(self, provider, params, fetcher):
+        """get_or_fetch 的异步版本，fetcher 为返回协程的函数；同一事件循环内同一个键只请求一次"""
+        value = self.get(provider, params)
+        if value is not None:
+            return value
+        import asyncio  # 只有异步模式用到，同步推送不承担导入耗时
+
+        key = self.make_key(provider, params)
+        key_lock = self.async_key_locks.setdefault(key, asyncio.Lock())
+        async with key_lock:
+            with self.lock:
+                value = self.memory.get(key)
+            if value is not None:
+                return value
+            value = await fetcher()
+            if value is not None:
+                self.put(provider, params, value)
+        self.async_key_locks.pop(key, None)
+        return value
+
+    def summary(self):
+        """各数据源命中率的简要描述"""
+        parts = []
+        for provider, counters in self.stats.items():
+            hits = counters['memory_hits'] + counters['disk_hits']
+            total = hits + counters['misses']
+            parts.append(f"{provider} {hits}/{total} (内存{counters['memory_hits']}, 磁盘{counters['disk_hits']})")
+        return ", ".join(parts)
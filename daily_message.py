@@ -1,132 +1,330 @@
-import requests
 import os
+import csv
 import json
+import sqlite3
 from datetime import datetime, date
 import random
 import time
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import http_client
+import metrics
+from channels import PROFILE_FIELDS, default_channels
+from circuit_breaker import BreakerRegistry
+from content_bundle import BundleStore, parse_send_date
+from content_cache import ContentCache
+from date_fields import (INVALID_BIRTHDAY_TEXT, batch_birthday_texts, batch_love_day_texts, birthday_text,
+                         days_until_birthday, love_days_text)
+from geocode_cache import GeocodeCache
+from horoscope_corpus import local_horoscope
+from message_template import JSON_HEADERS, Field, TemplateSpec, dumps
+from outbox import Outbox
+from scheduler import Scheduler, local_date
+from token_store import TokenManager, create_token_store
 
 # --- 读取本地环境变量文件 ---
-# 尝试加载本地的 mess.env 文件（用于本地测试）
-env_file_path = 'mess.env'
-if os.path.exists(env_file_path):
+# 尝试加载本地的 mess.env 文件（用于本地测试）。由入口 main() 调用，导入本模块时没有任何输出或文件读取
+ENV_FILE_PATH = 'mess.env'
+
+
+def load_env_file(env_file_path=ENV_FILE_PATH):
+    """加载本地环境变量文件，返回是否加载成功。文件不存在时不导入 python-dotenv"""
+    if not os.path.exists(env_file_path):
+        print(f"⚠️ 未找到本地环境变量文件: {env_file_path}，将使用系统环境变量")
+        return False
+    from dotenv import load_dotenv
+
     load_dotenv(env_file_path)
     print(f"✅ 成功加载本地环境变量文件: {env_file_path}")
-else:
-    print(f"⚠️ 未找到本地环境变量文件: {env_file_path}，将使用系统环境变量")
+    return True
+
 
 # --- 从环境变量获取配置 ---
-APPID = os.getenv('WECHAT_APPID')
-APPSECRET = os.getenv('WECHAT_APPSECRET')
-TEMPLATE_ID = os.getenv('WECHAT_TEMPLATE_ID')
-USER_ID = os.getenv('WECHAT_USER_ID')
-CITY = os.getenv('CITY', '广州')
-BIRTHDAY = os.getenv('BIRTHDAY', '02-27')  # 格式: MM-DD
-RELATIONSHIP_DATE = os.getenv('RELATIONSHIP_DATE', '2025-08-18')  # 格式: YYYY-MM-DD
-GF_NAME = os.getenv('GF_NAME', '小睿')
-CONSTELLATION = os.getenv('CONSTELLATION', '白羊座')  # 星座名称
-# --- 新增：高德地图 API Key ---
-AMAP_KEY = os.getenv('AMAP_KEY')  # 请务必设置此环境变量
-# --- 新增：天行数据星座 API Key ---
-TIANAPI_KEY = os.getenv('TIANAPI_KEY')  # 请务必设置此环境变量
+def configure():
+    """
+    从环境变量读取配置。导入时调用一次；入口 main() 加载 mess.env 后再调用一次，
+    使本地环境变量文件中的配置生效
+    """
+    global APPID, APPSECRET, TEMPLATE_ID, USER_ID, USER_FILE, USER_IDS, SEND_CONCURRENCY, SEND_RATE
+    global PROFILE_FILE, CITY, BIRTHDAY, RELATIONSHIP_DATE, GF_NAME, CONSTELLATION, AMAP_KEY, TIANAPI_KEY
+    global FETCH_DEADLINE, FETCH_WORKERS, SEND_TIME, TIMEZONE, PREFETCH_MINUTES, PREFETCH_MAX_AGE, SCHEDULE_REFRESH
+    global AMAP_BASE_URL, TIANAPI_BASE_URL, WECHAT_BASE_URL, AMAP_GEOCODE_URL, AMAP_WEATHER_URL, TIANAPI_STAR_URL
+    global TIANAPI_DIALOGUE_URL, HITOKOTO_URL, WECHAT_TOKEN_URL, WECHAT_SEND_URL
+    global OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_DELAY, OUTBOX_RATE_LIMIT_DELAY, OUTBOX_DRAIN_TIMEOUT
+    APPID = os.getenv('WECHAT_APPID')
+    APPSECRET = os.getenv('WECHAT_APPSECRET')
+    TEMPLATE_ID = os.getenv('WECHAT_TEMPLATE_ID')
+    USER_ID = os.getenv('WECHAT_USER_ID')
+    # --- 新增：批量推送，接收者列表（文件或逗号分隔的环境变量），未配置时只推送给 USER_ID ---
+    USER_FILE = os.getenv('WECHAT_USER_FILE')
+    USER_IDS = os.getenv('WECHAT_USER_IDS')
+    SEND_CONCURRENCY = int(os.getenv('SEND_CONCURRENCY', '8'))  # 最大并发推送数
+    SEND_RATE = float(os.getenv('SEND_RATE', '20'))  # 每秒最多推送条数，0 表示不限速
+    # --- 新增：接收者档案文件（CSV/JSON/SQLite），每个接收者可配置自己的城市、生日、纪念日和星座 ---
+    PROFILE_FILE = os.getenv('PROFILE_FILE')
+    CITY = os.getenv('CITY', '广州')
+    BIRTHDAY = os.getenv('BIRTHDAY', '02-27')  # 格式: MM-DD
+    RELATIONSHIP_DATE = os.getenv('RELATIONSHIP_DATE', '2025-08-18')  # 格式: YYYY-MM-DD
+    GF_NAME = os.getenv('GF_NAME', '小睿')
+    CONSTELLATION = os.getenv('CONSTELLATION', '白羊座')  # 星座名称
+    # --- 新增：高德地图 API Key ---
+    AMAP_KEY = os.getenv('AMAP_KEY')  # 请务必设置此环境变量
+    # --- 新增：天行数据星座 API Key ---
+    TIANAPI_KEY = os.getenv('TIANAPI_KEY')  # 请务必设置此环境变量
+    # --- 新增：内容并发获取的整体超时(秒)，超时的数据源直接使用本地备用数据 ---
+    FETCH_DEADLINE = float(os.getenv('FETCH_DEADLINE', '15'))
+    FETCH_WORKERS = int(os.getenv('FETCH_WORKERS', '16'))  # 内容获取的最大并发数
+
+    # --- 新增：常驻模式（--daemon）的调度配置 ---
+    SEND_TIME = os.getenv('SEND_TIME', '08:00')  # 默认推送时间 HH:MM，接收者档案中可用 send_time 单独设置
+    TIMEZONE = os.getenv('TIMEZONE', 'Asia/Shanghai')  # 默认时区，接收者档案中可用 timezone 单独设置
+    PREFETCH_MINUTES = int(os.getenv('PREFETCH_MINUTES', '5'))  # 提前多少分钟预取内容
+    PREFETCH_MAX_AGE = PREFETCH_MINUTES * 60 + 300  # 预取内容的最长使用时间(秒)
+    SCHEDULE_REFRESH = int(os.getenv('SCHEDULE_REFRESH', '3600'))  # 重新读取接收者档案、更新推送时间表的间隔(秒)
+
+    # --- 各数据源接口地址，可用 *_BASE_URL 指向本地模拟服务（见 fake_providers.py）---
+    AMAP_BASE_URL = os.getenv('AMAP_BASE_URL', 'https://restapi.amap.com').rstrip('/')
+    TIANAPI_BASE_URL = os.getenv('TIANAPI_BASE_URL', 'https://apis.tianapi.com').rstrip('/')
+    WECHAT_BASE_URL = os.getenv('WECHAT_BASE_URL', 'https://api.weixin.qq.com').rstrip('/')
+    AMAP_GEOCODE_URL = f"{AMAP_BASE_URL}/v3/geocode/geo"
+    AMAP_WEATHER_URL = f"{AMAP_BASE_URL}/v3/weather/weatherInfo"
+    TIANAPI_STAR_URL = f"{TIANAPI_BASE_URL}/star/index"
+    TIANAPI_DIALOGUE_URL = f"{TIANAPI_BASE_URL}/dialogue/index"
+    HITOKOTO_URL = os.getenv('HITOKOTO_URL', 'https://v1.hitokoto.cn/')
+    WECHAT_TOKEN_URL = f"{WECHAT_BASE_URL}/cgi-bin/token"
+    WECHAT_SEND_URL = f"{WECHAT_BASE_URL}/cgi-bin/message/template/send"
+
+    # --- 新增：发件箱投递的重试策略 ---
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))  # 每条消息最多尝试次数
+    OUTBOX_RETRY_DELAY = float(os.getenv('OUTBOX_RETRY_DELAY', '2'))  # 指数退避的基础间隔(秒)
+    OUTBOX_RATE_LIMIT_DELAY = float(os.getenv('OUTBOX_RATE_LIMIT_DELAY', '60'))  # 被限流后的最短等待(秒)
+    OUTBOX_DRAIN_TIMEOUT = float(os.getenv('OUTBOX_DRAIN_TIMEOUT', '120'))  # 单次运行投递的最长时间(秒)
+
+
+configure()
+
+# 微信返回码分类
+TOKEN_ERRCODES = {40001, 40014, 42001}  # access_token 无效或过期：刷新后重试
+RATE_LIMIT_ERRCODES = {-1, 45009, 45011, 45047}  # 系统繁忙/调用频率或次数超限：延后重试
+PERMANENT_ERRCODES = {40003, 40036, 40037, 43004, 43101, 47003}  # openid/模板无效、未关注、拒收等：不再重试
+
+# 星座运势、每日一句接口只返回数据源“今天”（北京时间）的内容，以后日期的内容使用本地语料
+CONTENT_TIMEZONE = 'Asia/Shanghai'
+FALLBACK_QUOTES = (
+    "生活就像海洋，只有意志坚强的人，才能到达彼岸。—— 马克思",
+    "山重水复疑无路，柳暗花明又一村。—— 陆游",
+    "宝剑锋从磨砺出，梅花香自苦寒来。",
+    "世上无难事，只要肯登攀。—— 毛泽东",
+    "爱是理解的别名。—— 泰戈尔"
+)
+
+
+def is_future_day(day):
+    """day 是否晚于数据源的今天（此时接口返回的是今天的内容，不能用于 day）"""
+    return day is not None and day > local_date(CONTENT_TIMEZONE)
+
+
+def local_quote(day):
+    """按日期选取的本地句子，用于以后日期的每日一句"""
+    return FALLBACK_QUOTES[day.toordinal() % len(FALLBACK_QUOTES)]
+
+
+# 模板字段 (字段名需与微信模板一致)：数据来源为 render_payloads 中每个接收者的渲染上下文
+TEMPLATE_SPEC = TemplateSpec([
+    Field('date', 'date', '#173177', max_length=20),
+    Field('city', 'city', '#173177', max_length=20),
+    Field('weather', 'weather', '#173177', max_length=100),
+    Field('love_days', 'love_days', '#FF69B4', max_length=50),
+    Field('birthday_left', 'birthday_left', '#FF4500', max_length=50),
+    Field('constellation', 'constellation', '#9370DB', max_length=10),
+    Field('horoscope', 'horoscope', '#173177', max_length=200),  # 现在只显示 summary
+    Field('daily_quote', 'daily_quote', '#808080', max_length=200),
+    Field('girlfriend_name', 'name', '#FF1493', max_length=20),
+])
 
 
 class WeChatMessage:
     def __init__(self):
         self.access_token = None
         self.token_expire_time = 0
+        # access_token 持久化在共享存储中，多个进程/定时任务复用同一个 token
+        self.token_manager = TokenManager(create_token_store(), self._fetch_access_token)
+        # 城市 → adcode 的持久缓存，天气查询只需一次 weatherInfo 请求
+        self.geocode_cache = GeocodeCache()
+        # 天气 / 星座运势 / 每日一句的内容缓存，按 (数据源, 参数, 时间段) 在接收者和多次运行间共享
+        self.content_cache = ContentCache()
+        # 各数据源的熔断器，失效的数据源直接走备用数据，不再逐个接收者等待超时
+        self.breakers = BreakerRegistry()
+        # 模板消息发件箱：先落盘再投递，失败重试，按 (日期, openid) 幂等
+        self.outbox = Outbox()
+        self.delivery_seconds = {}
+        # 预取的内容 {(类别, 参数): (内容, 获取时间)}，常驻模式下在发送窗口前填充
+        self.prefetched = {}
+        # 预取内容包，以及本次推送中使用预取消息 / 实时获取的接收者数量
+        self.bundles = BundleStore()
+        self.content_sources = {}
+        # 微信模板消息之外的推送渠道（Server酱、飞书），与模板消息并行投递同一份渲染结果
+        self.channels = default_channels()
+        self.channel_results = {}
+        # 模板消息推送的限速由共享 HTTP 层的令牌桶执行，RATE_LIMITS 中已配置该接口时以其为准
+        if SEND_RATE > 0:
+            http_client.set_rate_limit(WECHAT_SEND_URL, SEND_RATE)
+        # 各数据源耗时统计 {name: {'seconds': 耗时, 'status': 'ok'/'timeout'/'error'}}
+        self.fetch_timings = {}
         # 初始化恋爱日期
         self.init_relationship_date()
 
     def init_relationship_date(self):
         """初始化恋爱日期"""
+        self.relationship_start = self.parse_relationship_date(RELATIONSHIP_DATE)
+
+    def parse_relationship_date(self, value):
+        """解析恋爱日期 (YYYY-MM-DD)，格式错误时使用默认值"""
         try:
-            self.relationship_start = datetime.strptime(RELATIONSHIP_DATE, '%Y-%m-%d').date()
+            return datetime.strptime(value, '%Y-%m-%d').date()
         except Exception as e:
             print(f"恋爱日期格式错误，使用默认值: {e}")
-            self.relationship_start = date(2023, 1, 1)
+            return date(2023, 1, 1)
 
-    def get_access_token(self):
-        """获取微信access_token，带重试机制"""
+    def get_access_token(self, force_refresh=False):
+        """获取微信access_token：优先读取跨进程共享的 token 存储，需要刷新时单飞请求"""
         if not APPID or not APPSECRET:
             print("❌ 未配置 WECHAT_APPID 或 WECHAT_APPSECRET")
             return None
 
-        if self.access_token and datetime.now().timestamp() < self.token_expire_time:
-            return self.access_token
+        token = self.token_manager.get(APPID, force=force_refresh)
+        if token:
+            self.access_token = token
+            self.token_expire_time = self.token_manager.expire_at(APPID)
+        return token
 
-        url = f"https://api.weixin.qq.com/cgi-bin/token?grant_type=client_credential&appid={APPID}&secret={APPSECRET}"
-        max_retries = 3
-        retry_delay = 2  # 秒
+    def _fetch_access_token(self, appid):
+        """请求 /cgi-bin/token，返回 (access_token, expires_in)；网络错误的重试由共享 HTTP 层统一处理"""
+        params = {'grant_type': 'client_credential', 'appid': appid, 'secret': APPSECRET}
+        try:
+            response = http_client.get(WECHAT_TOKEN_URL, params=params)
+            data = response.json()
 
-        for attempt in range(max_retries):
-            try:
-                response = requests.get(url, timeout=10)
-                data = response.json()
-
-                if 'access_token' in data:
-                    self.access_token = data['access_token']
-                    # 提前300秒过期，避免刚好在发送时过期
-                    self.token_expire_time = datetime.now().timestamp() + data['expires_in'] - 300
-                    print("✅ 获取access_token成功")
-                    return self.access_token
-                else:
-                    print(f"❌ 获取access_token失败: {data}")
+            if 'access_token' in data:
+                print("✅ 获取access_token成功")
+                metrics.inc('token_refresh_total', result='ok')
+                metrics.event('token_refresh', result='ok', expires_in=data['expires_in'])
+                return data['access_token'], data['expires_in']
+            else:
+                print(f"❌ 获取access_token失败: {data}")
+                metrics.inc('token_refresh_total', result='error')
+                metrics.event('token_refresh', result='error', errcode=data.get('errcode'))
 
-            except Exception as e:
-                print(f"❌ 获取access_token异常 (尝试 {attempt + 1}/{max_retries}): {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
+        except Exception as e:
+            print(f"❌ 获取access_token异常: {e}")
+            metrics.inc('token_refresh_total', result='error')
+            metrics.event('token_refresh', result='error', error=str(e))
 
         return None
 
-    def get_weather(self):
-        """获取天气信息 - 使用高德天气 API"""
+    @metrics.timed('get_weather')
+    def get_weather(self, city=None, day=None):
+        """获取天气信息 - 使用高德天气 API。day 为以后的日期时（预取明天的内容）使用天气预报"""
+        city = city or CITY
         print("正在获取天气信息...")
         if not AMAP_KEY:
             print("⚠️ 未配置高德地图 API Key (AMAP_KEY)，使用本地天气数据")
             return self._get_local_weather()
 
         try:
-            # 1. 通过城市名获取 adcode (区域编码)
-            geo_url = f"https://restapi.amap.com/v3/geocode/geo?address={CITY}&key={AMAP_KEY}"
-            geo_response = requests.get(geo_url, timeout=10)
-            geo_data = geo_response.json()
-
-            if geo_data.get('status') == '1' and geo_data.get('geocodes'):
-                adcode = geo_data['geocodes'][0]['adcode']
-                print(f"✅ 城市 {CITY} 对应的 adcode: {adcode}")
-            else:
-                print(f"❌ 获取城市 {CITY} 的 adcode 失败: {geo_data}")
+            # 1. 城市名 → adcode (区域编码)，优先使用离线表和本地缓存，命中时不发起网络请求
+            adcode = self.resolve_adcode(city)
+            if not adcode:
                 return self._get_local_weather()
 
-            # 2. 通过 adcode 获取天气信息
-            weather_url = f"https://restapi.amap.com/v3/weather/weatherInfo?city={adcode}&key={AMAP_KEY}&extensions=base"
-            weather_response = requests.get(weather_url, timeout=10)
-            weather_data = weather_response.json()
-
-            if weather_data.get('status') == '1' and weather_data.get('lives'):
-                live_weather = weather_data['lives'][0]
-                weather = live_weather['weather']
-                temperature = live_weather['temperature']
-                humidity = live_weather['humidity']
-                wind_direction = live_weather['winddirection']
-                wind_power = live_weather['windpower']
-
-                tip = self._get_weather_tip(weather)
-                result = f"🌤️ {weather}, {temperature}°C (湿度{humidity}%, {wind_direction}风{wind_power}级) | {tip}"
-                print(f"✅ 天气获取成功: {result}")
-                return result
+            # 2. 通过 adcode 获取天气信息，同一小时内的结果直接读取内容缓存
+            if day and day != date.today():
+                result = self.content_cache.get_or_fetch(
+                    'forecast', {'adcode': adcode, 'date': day.isoformat()},
+                    lambda: self.breakers.call('amap_weather', lambda: self._fetch_forecast(adcode, day)))
             else:
-                print(f"❌ 获取天气信息失败: {weather_data}")
-                return self._get_local_weather()
+                result = self.content_cache.get_or_fetch(
+                    'weather', {'adcode': adcode},
+                    lambda: self.breakers.call('amap_weather', lambda: self._fetch_weather(adcode)))
+            if result:
+                return result
 
         except Exception as e:
             print(f"❌ 获取天气信息异常: {e}")
-            return self._get_local_weather()
+
+        return self._get_local_weather()
+
+    def _fetch_weather(self, adcode):
+        """请求高德 weatherInfo 接口，失败返回 None"""
+        weather_response = http_client.get(AMAP_WEATHER_URL, params=self._weather_params(adcode))
+        return self._parse_weather(weather_response.json())
+
+    def _fetch_forecast(self, adcode, day):
+        """请求高德天气预报 (extensions=all)，返回指定日期的预报，失败返回 None"""
+        params = dict(self._weather_params(adcode), extensions='all')
+        weather_response = http_client.get(AMAP_WEATHER_URL, params=params)
+        return self._parse_forecast(weather_response.json(), day)
+
+    def _parse_forecast(self, weather_data, day):
+        """解析 weatherInfo 返回的预报，取 day 当天的白天天气"""
+        if weather_data.get('status') == '1' and weather_data.get('forecasts'):
+            for cast in weather_data['forecasts'][0].get('casts', []):
+                if cast.get('date') == day.isoformat():
+                    weather = cast['dayweather']
+                    tip = self._get_weather_tip(weather)
+                    result = (f"🌤️ {weather}, {cast['nighttemp']}°C~{cast['daytemp']}°C "
+                              f"({cast['daywind']}风{cast['daypower']}级) | {tip}")
+                    print(f"✅ 天气预报获取成功: {result}")
+                    return result
+
+        print(f"❌ 获取 {day} 的天气预报失败: {weather_data}")
+        return None
+
+    @staticmethod
+    def _weather_params(adcode):
+        return {'city': adcode, 'key': AMAP_KEY, 'extensions': 'base'}
+
+    def _parse_weather(self, weather_data):
+        """解析 weatherInfo 返回的实况天气"""
+        if weather_data.get('status') == '1' and weather_data.get('lives'):
+            live_weather = weather_data['lives'][0]
+            weather = live_weather['weather']
+            temperature = live_weather['temperature']
+            humidity = live_weather['humidity']
+            wind_direction = live_weather['winddirection']
+            wind_power = live_weather['windpower']
+
+            tip = self._get_weather_tip(weather)
+            result = f"🌤️ {weather}, {temperature}°C (湿度{humidity}%, {wind_direction}风{wind_power}级) | {tip}"
+            print(f"✅ 天气获取成功: {result}")
+            return result
+
+        print(f"❌ 获取天气信息失败: {weather_data}")
+        return None
+
+    def resolve_adcode(self, city=None):
+        """解析城市对应的 adcode（离线表 → 持久缓存 → 高德地理编码）"""
+        return self.geocode_cache.resolve(city or CITY, lambda c: self.breakers.call('amap_geocode',
+                                                                                  lambda: self._geocode(c)))
+
+    def _geocode(self, city):
+        """调用高德地理编码 API 获取 adcode"""
+        geo_response = http_client.get(AMAP_GEOCODE_URL, params={'address': city, 'key': AMAP_KEY})
+        return self._parse_geocode(city, geo_response.json())
+
+    @staticmethod
+    def _parse_geocode(city, geo_data):
+        if geo_data.get('status') == '1' and geo_data.get('geocodes'):
+            adcode = geo_data['geocodes'][0]['adcode']
+            print(f"✅ 城市 {city} 对应的 adcode: {adcode}")
+            return adcode
+        print(f"❌ 获取城市 {city} 的 adcode 失败: {geo_data}")
+        return None
 
     def _get_local_weather(self):
         """获取本地天气数据"""
+        metrics.inc('fallback_total', source='weather')
+        metrics.event('fallback', source='weather')
         # 根据月份生成合理的天气
         now = datetime.now()
         month = now.month
@@ -175,349 +373,739 @@ class WeChatMessage:
         }
         return tips.get(weather_type, "天气多变，要照顾好自己哦")
 
-    def calculate_days_until_birthday(self):
-        """计算距离生日的天数"""
+    def calculate_days_until_birthday(self, birthday=None, name=None, today=None):
+        """计算距离生日的天数（2月29日的生日在非闰年按3月1日计算）"""
         try:
-            today = date.today()
-            year = today.year
-            month, day = map(int, BIRTHDAY.split('-'))
-
-            # 处理2月29日的特殊情况
-            if month == 2 and day == 29 and not (year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)):
-                birthday_this_year = date(year, 3, 1)
-            else:
-                birthday_this_year = date(year, month, day)
-
-            if today > birthday_this_year:
-                next_year = year + 1
-                # 再次处理明年2月29日的情况
-                if month == 2 and day == 29 and not (
-                        next_year % 4 == 0 and (next_year % 100 != 0 or next_year % 400 == 0)):
-                    birthday_next_year = date(next_year, 3, 1)
-                else:
-                    birthday_next_year = date(next_year, month, day)
-                days_left = (birthday_next_year - today).days
-            else:
-                days_left = (birthday_this_year - today).days
+            today = today or date.today()
+            month, day = map(int, (birthday or BIRTHDAY).split('-'))
+            days_left = days_until_birthday(month, day, today)
 
             # 生成有趣的倒计时描述
-            if days_left == 0:
-                return "🎉 破壳啦~ 生日快乐呀小睿！"
-            elif days_left == 1:
-                return "🌟 明天生日！已经准备好惊喜啦~"
-            elif days_left < 7:
-                return f"🎂 还有{days_left}天！超级期待！"
-            elif days_left < 30:
-                return f"💝 还有{days_left}天，每天都在想你"
-            elif days_left < 100:
-                return f"📅 还有{days_left}天，期待与你庆祝"
-            else:
-                return f"🗓️ 还有{days_left}天，但对你的心动从不停止"
+            return birthday_text(days_left, name or GF_NAME)
 
         except Exception as e:
             print(f"计算生日失败: {e}")
-            return "🎁 生日总是最特别的日子"
+            return INVALID_BIRTHDAY_TEXT
 
-    def calculate_love_days(self):
+    def calculate_love_days(self, relationship_start=None, today=None):
         """计算恋爱天数"""
         try:
-            today = date.today()
-            days = (today - self.relationship_start).days
-
-            if days <= 0:
-                return "💘 今天是我们相识的第一天！"
-            elif days % 365 == 0:
-                years = days // 365
-                return f"💑 我们已经相识{years}年啦！{days}天的幸福时光~"
-            elif days % 100 == 0:
-                return f"💞 第{days}天啦！百天纪念快乐~"
-            elif days % 30 == 0:
-                return f"💖 已经{days}天了，每月都有新事物~"
-            else:
-                return f"❤️ 我们已经相识{days}天啦~"
+            today = today or date.today()
+            days = (today - (relationship_start or self.relationship_start)).days
+            return love_days_text(days)
 
         except Exception as e:
             print(f"计算天数失败: {e}")
             return "💓 每一天都值得珍惜"
 
-    def get_horoscope(self):
-        """获取星座运势 - 使用天行数据 API"""
+    @metrics.timed('get_horoscope')
+    def get_horoscope(self, constellation=None, day=None):
+        """获取星座运势 - 使用天行数据 API；day 为以后的日期时（预取明天的内容）使用该日期的本地语料"""
+        constellation = constellation or CONSTELLATION
         print("正在获取星座运势...")
+        if is_future_day(day):
+            return local_horoscope(constellation, day)
         if not TIANAPI_KEY:
             print("⚠️ 未配置天行数据 API Key (TIANAPI_KEY)，使用本地模拟数据")
-            return self._get_local_horoscope_summary()
+            return self._get_local_horoscope_summary(constellation, day)
 
+        # 同一星座当天的运势对所有接收者相同，优先读取内容缓存
+        summary = self.content_cache.get_or_fetch(
+            'horoscope', {'astro': constellation},
+            lambda: self.breakers.call('tianapi_star', lambda: self._fetch_horoscope(constellation)))
+        if summary:
+            return summary
+
+        # 回退到本地模拟
+        print("⚠️ 星座API调用失败，使用本地模拟数据...")
+        return self._get_local_horoscope_summary(constellation, day)
+
+    def _fetch_horoscope(self, constellation):
+        """请求天行数据星座运势 API，失败返回 None"""
         try:
-            # 使用天行数据提供的星座运势 API
-            url = "https://apis.tianapi.com/star/index"
             params = {
                 'key': TIANAPI_KEY,
-                'astro': CONSTELLATION
+                'astro': constellation
             }
-            response = requests.get(url, params=params, timeout=10)
-            data = response.json()
-            print(f"星座API返回原始数据: {data}")
+            response = http_client.get(TIANAPI_STAR_URL, params=params)
+            return self._parse_horoscope(response.json())
 
-            if data.get('code') == 200 and 'result' in data and 'list' in data['result']:
-                horoscope_list = data['result']['list']
+        except Exception as e:
+            print(f"❌ 获取星座运势异常: {e}")
 
-                # 查找"今日概述"的内容
-                today_summary = ""
-                for item in horoscope_list:
-                    if item.get('type') == '今日概述':
-                        today_summary = item.get('content', '')
-                        break
+        return None
 
-                # 如果没有找到"今日概述"，则组合多个条目
-                if not today_summary and horoscope_list:
-                    summary_parts = []
-                    for item in horoscope_list:
-                        item_type = item.get('type', '')
-                        content = item.get('content', '')
-                        if content and item_type != '综合指数':
-                            summary_parts.append(content)
-                    today_summary = "  ".join(summary_parts)
-
-                if today_summary:
-                    print(f"✅ 星座运势获取成功: {today_summary}")
-                    return today_summary  # ❗ 直接返回内容，不加前缀
-                else:
-                    print("⚠️ API返回数据中未包含有效的内容字段")
+    @staticmethod
+    def _parse_horoscope(data):
+        """解析星座运势 API 的返回，优先取“今日概述”"""
+        print(f"星座API返回原始数据: {data}")
 
-            else:
-                error_msg = data.get('msg', '未知错误')
-                print(f"❌ 星座API返回失败 (code: {data.get('code')}): {error_msg}")
+        if data.get('code') == 200 and 'result' in data and 'list' in data['result']:
+            horoscope_list = data['result']['list']
 
-        except Exception as e:
-            print(f"❌ 获取星座运势异常: {e}")
+            # 查找"今日概述"的内容
+            today_summary = ""
+            for item in horoscope_list:
+                if item.get('type') == '今日概述':
+                    today_summary = item.get('content', '')
+                    break
 
-        # 回退到本地模拟
-        print("⚠️ 星座API调用失败，使用本地模拟数据...")
-        return self._get_local_horoscope_summary()
+            # 如果没有找到"今日概述"，则组合多个条目
+            if not today_summary and horoscope_list:
+                summary_parts = []
+                for item in horoscope_list:
+                    item_type = item.get('type', '')
+                    content = item.get('content', '')
+                    if content and item_type != '综合指数':
+                        summary_parts.append(content)
+                today_summary = "  ".join(summary_parts)
+
+            if today_summary:
+                print(f"✅ 星座运势获取成功: {today_summary}")
+                return today_summary  # ❗ 直接返回内容，不加前缀
+            else:
+                print("⚠️ API返回数据中未包含有效的内容字段")
+
+        else:
+            error_msg = data.get('msg', '未知错误')
+            print(f"❌ 星座API返回失败 (code: {data.get('code')}): {error_msg}")
+        return None
 
-    def _get_local_horoscope_summary(self):
+    def _get_local_horoscope_summary(self, constellation=None, day=None):
         """获取本地星座运势的 summary 部分 - 作为备用方案"""
-        # 定义按运势类型分类的句子
-        love_fortunes = [
-            "单身者有机会在社交场合遇到心仪的对象，保持开放的心态。",
-            "有伴侣的人今天适合安排一次浪漫的约会，增进感情。",
-            "沟通是关键，多倾听对方的想法，避免不必要的误会。",
-            "感受到爱意的流动，一个小小的举动就能让对方感到幸福。",
-            "情感运势稳定，适合与爱人分享内心深处的想法。",
-            "可能会收到来自异性的邀请，不妨尝试接受。"
-        ]
-        work_fortunes = [
-            "工作中可能会遇到挑战，但你的创意和努力将得到认可。",
-            "团队合作非常重要，多与同事交流，集思广益。",
-            "今天适合处理积压的事务，效率会很高。",
-            "可能会有新的项目或机会出现，保持警觉。",
-            "避免在细节上过于纠结，把握大局更为重要。",
-            "学习新技能的好时机，投资自己总是值得的。"
-        ]
-        money_fortunes = [
-            "财运平稳，适合制定理财计划。",
-            "可能会有意外的小收入，比如红包或退款。",
-            "花钱要理性，避免冲动消费。",
-            "投资方面需要谨慎，多做研究再做决定。",
-            "正财稳定，偏财运也不错，有机会通过副业增收。",
-            "记账是个好习惯，能帮你更好地掌控财务状况。"
-        ]
-        health_fortunes = [
-            "注意劳逸结合，避免过度劳累。",
-            "多喝水，多吃水果蔬菜，保持身体健康。",
-            "适合进行一些轻松的运动，如散步或瑜伽。",
-            "情绪对健康影响很大，保持乐观的心态。",
-            "可能会感到有些疲惫，早点休息是不错的选择。",
-            "关注身体发出的信号，不适时及时调整。"
-        ]
-        general_fortunes = [
-            "今天你的直觉很敏锐，相信第一感觉。",
-            "整体运势不错，保持积极的心态会带来更多好运。",
-            "可能会遇到需要做决定的时刻，深思熟虑后行动。",
-            "学习能力增强，适合给自己充电。",
-            "出门走走，接触新环境会带来灵感。",
-            "今天适合反思和规划，为未来做好准备。"
-        ]
-
-        # 根据当前日期生成一个"伪随机"种子
-        today_seed = date.today().toordinal()
-        constellation_id = sum(ord(char) for char in CONSTELLATION)
-        random.seed(today_seed + constellation_id)
-
-        # 为每个类别随机选择1条
-        selected_love = random.choice(love_fortunes)
-        selected_work = random.choice(work_fortunes)
-        selected_money = random.choice(money_fortunes)
-        selected_health = random.choice(health_fortunes)
-        selected_general = random.choice(general_fortunes)
-
-        # 组合运势信息
-        horoscope_summary = f"{selected_general} {selected_love} {selected_work} {selected_money} {selected_health}"
-
-        # 添加结尾
-        endings = [
-            "愿你今天被幸福填满！",
-            "带着微笑开启新的一天吧！",
-            "宇宙与你同在，加油！",
-            "每一天都是限量版，好好珍惜！",
-            "你的存在就是最好的礼物！"
-        ]
-        horoscope_summary += " " + random.choice(endings)
-
-        result = horoscope_summary  # ❗ 不加前缀
-        random.seed()  # 重置种子
-        return result
+        metrics.inc('fallback_total', source='horoscope')
+        metrics.event('fallback', source='horoscope', constellation=constellation)
+        return local_horoscope(constellation or CONSTELLATION, day or date.today())  # ❗ 不加前缀
 
-    def get_daily_quote(self):
-        """获取每日一句 - 使用天行数据对话 API"""
+    @metrics.timed('get_daily_quote')
+    def get_daily_quote(self, day=None):
+        """获取每日一句 - 使用天行数据对话 API；day 为以后的日期时使用按日期选取的本地句子"""
         print("正在获取每日一句...")
+        if is_future_day(day):
+            return local_quote(day)
         if not TIANAPI_KEY:
             print("⚠️ 未配置天行数据 API Key (TIANAPI_KEY)，使用一言API")
             return self._get_hitokoto_quote()
 
+        quote = self.content_cache.get_or_fetch(
+            'dialogue', {}, lambda: self.breakers.call('tianapi_dialogue', self._fetch_daily_quote))
+        if quote:
+            return quote
+
+        # 如果API调用失败或出错，回退到一言API
+        print("⚠️ 每日一句API调用失败，使用一言API...")
+        return self._get_hitokoto_quote()
+
+    def _fetch_daily_quote(self):
+        """请求天行数据对话 API，失败返回 None"""
         try:
-            # 使用天行数据提供的对话 API
-            url = "https://apis.tianapi.com/dialogue/index"
             params = {
                 'key': TIANAPI_KEY  # API Key
             }
-            response = requests.get(url, params=params, timeout=10)
-            data = response.json()
-            print(f"每日一句API返回原始数据: {data}")  # 调试信息
-
-            # 检查API返回是否成功
-            if data.get('code') == 200 and 'result' in data:
-                quote_data = data['result']
-
-                # 提取对话内容和来源
-                dialogue = quote_data.get('dialogue', '')
-                source = quote_data.get('source', '')
-
-                if dialogue:
-                    # 如果有来源信息，也一并显示
-                    if source:
-                        result = f"❝ {dialogue} ❞\n—— {source}"
-                    else:
-                        result = f"❝ {dialogue} ❞"
-                    print(f"✅ 每日一句获取成功: {result}")
-                    return result
-                else:
-                    print("⚠️ API返回数据中未包含对话内容")
-
-            else:
-                error_msg = data.get('msg', '未知错误')
-                print(f"❌ 每日一句API返回失败 (code: {data.get('code')}): {error_msg}")
+            response = http_client.get(TIANAPI_DIALOGUE_URL, params=params)
+            return self._parse_daily_quote(response.json())
 
         except Exception as e:
             print(f"❌ 获取每日一句异常: {e}")
 
-        # 如果API调用失败或出错，回退到一言API
-        print("⚠️ 每日一句API调用失败，使用一言API...")
-        return self._get_hitokoto_quote()
+        return None
+
+    @staticmethod
+    def _parse_daily_quote(data):
+        """解析对话 API 的返回"""
+        print(f"每日一句API返回原始数据: {data}")  # 调试信息
+
+        # 检查API返回是否成功
+        if data.get('code') == 200 and 'result' in data:
+            quote_data = data['result']
+
+            # 提取对话内容和来源
+            dialogue = quote_data.get('dialogue', '')
+            source = quote_data.get('source', '')
+
+            if dialogue:
+                # 如果有来源信息，也一并显示
+                if source:
+                    result = f"❝ {dialogue} ❞\n—— {source}"
+                else:
+                    result = f"❝ {dialogue} ❞"
+                print(f"✅ 每日一句获取成功: {result}")
+                return result
+            else:
+                print("⚠️ API返回数据中未包含对话内容")
+
+        else:
+            error_msg = data.get('msg', '未知错误')
+            print(f"❌ 每日一句API返回失败 (code: {data.get('code')}): {error_msg}")
+        return None
 
     def _get_hitokoto_quote(self):
         """获取一言API的句子作为备选方案"""
-        try:
-            url = "https://v1.hitokoto.cn/"
-            response = requests.get(url, timeout=10)
-            data = response.json()
+        quote = self.content_cache.get_or_fetch(
+            'hitokoto', {}, lambda: self.breakers.call('hitokoto', self._fetch_hitokoto_quote))
+        if quote:
+            return quote
+        # 失败时使用备用句子
+        return self._get_fallback_quote()
 
-            if 'hitokoto' in data:
-                quote = data['hitokoto']
-                # from字段可能为空
-                source = data.get('from', '') or data.get('from_who', '') or '佚名'
-                result = f"❝ {quote} ❞\n—— {source}"
-                print(f"✅ 一言API获取成功: {result}")
-                return result
+    def _fetch_hitokoto_quote(self):
+        """请求一言 API，失败返回 None"""
+        try:
+            response = http_client.get(HITOKOTO_URL)
+            return self._parse_hitokoto(response.json())
         except Exception as e:
             print(f"❌ 获取一言API异常: {e}")
+        return None
 
-        # 失败时使用备用句子
-        fallback_quotes = [
-            "生活就像海洋，只有意志坚强的人，才能到达彼岸。—— 马克思",
-            "山重水复疑无路，柳暗花明又一村。—— 陆游",
-            "宝剑锋从磨砺出，梅花香自苦寒来。",
-            "世上无难事，只要肯登攀。—— 毛泽东",
-            "爱是理解的别名。—— 泰戈尔"
-        ]
-        chosen_quote = random.choice(fallback_quotes)
-        print(f"⚠️ 一言API失败，使用备用句子: {chosen_quote}")
-        return chosen_quote
+    @staticmethod
+    def _parse_hitokoto(data):
+        if 'hitokoto' in data:
+            quote = data['hitokoto']
+            # from字段可能为空
+            source = data.get('from', '') or data.get('from_who', '') or '佚名'
+            result = f"❝ {quote} ❞\n—— {source}"
+            print(f"✅ 一言API获取成功: {result}")
+            return result
+        return None
 
-    def send_message(self):
-        """发送模板消息"""
-        if not TEMPLATE_ID or not USER_ID:
-            print("❌ 未配置 WECHAT_TEMPLATE_ID 或 WECHAT_USER_ID")
-            return False
+    def _get_fallback_quote(self):
+        """本地备用句子，不依赖网络"""
+        metrics.inc('fallback_total', source='daily_quote')
+        metrics.event('fallback', source='daily_quote')
+        chosen_quote = random.choice(FALLBACK_QUOTES)
+        print(f"⚠️ 使用备用句子: {chosen_quote}")
+        return chosen_quote
 
-        token = self.get_access_token()
-        if not token:
-            print("❌ 无法获取有效的 access_token")
-            return False
+    def _timed_fetch(self, name, fetcher):
+        """执行单个数据源的获取，并记录耗时"""
+        start = time.perf_counter()
+        try:
+            return fetcher()
+        finally:
+            # 已被判定超时的数据源不再覆盖记录
+            self.fetch_timings.setdefault(name, {'seconds': round(time.perf_counter() - start, 3), 'status': 'ok'})
+
+    @metrics.timed('fetch_contents')
+    def fetch_contents(self, cities=None, constellations=None, deadline=None, day=None):
+        """
+        并发获取天气、星座运势、每日一句。
+        每个不同的城市只查一次天气、每个不同的星座只查一次运势，请求数与城市/星座的种类数相关，与接收者人数无关。
+        各数据源保留自身的回退链，整体耗时约为最慢的一个而不是全部之和；
+        超过整体期限仍未返回的数据源直接使用本地备用数据。
+        day 为内容对应的日期（预取明天的内容时传入），默认今天。
+        返回 {'weather': {城市: 天气}, 'horoscope': {星座: 运势}, 'daily_quote': 每日一句}
+        """
+        deadline = FETCH_DEADLINE if deadline is None else deadline
+        cities = list(dict.fromkeys(cities or [CITY]))
+        constellations = list(dict.fromkeys(constellations or [CONSTELLATION]))
+        # (类别, 参数) → (获取函数, 本地备用函数)
+        sources = {}
+        for city in cities:
+            sources[('weather', city)] = (lambda c=city: self.get_weather(c, day), self._get_local_weather)
+        for sign in constellations:
+            sources[('horoscope', sign)] = (lambda c=sign: self.get_horoscope(c, day),
+                                            lambda c=sign: self._get_local_horoscope_summary(c, day))
+        sources[('daily_quote', None)] = (lambda: self.get_daily_quote(day), self._get_fallback_quote)
+
+        self.fetch_timings = {}
+        contents = {'weather': {}, 'horoscope': {}, 'daily_quote': None}
+        # 发送窗口前已预取的今天的内容直接使用
+        for key in (list(sources) if day in (None, date.today()) else []):
+            value = self._get_prefetched(key)
+            if value is not None:
+                self._store_content(contents, key, value)
+                self.fetch_timings[self._timing_name(key)] = {'seconds': 0, 'status': 'prefetched'}
+                del sources[key]
+        if not sources:
+            print("⏱️ 内容均已预取，无需请求")
+            return contents
+        start = time.perf_counter()
+
+        executor = ThreadPoolExecutor(max_workers=min(len(sources), FETCH_WORKERS), thread_name_prefix='fetch')
+        futures = {key: executor.submit(self._timed_fetch, self._timing_name(key), fetcher)
+                   for key, (fetcher, _) in sources.items()}
+        wait(futures.values(), timeout=deadline)
+        # 不等待超时的线程，它们在后台自然结束
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        for key, future in futures.items():
+            name = self._timing_name(key)
+            fallback = sources[key][1]
+            if not future.done():
+                print(f"⚠️ {name} 超过整体期限 {deadline}s 未返回，使用本地备用数据")
+                self.fetch_timings[name] = {'seconds': round(time.perf_counter() - start, 3), 'status': 'timeout'}
+                value = fallback()
+            else:
+                try:
+                    value = future.result()
+                except Exception as e:
+                    print(f"❌ {name} 获取异常: {e}，使用本地备用数据")
+                    self.fetch_timings[name]['status'] = 'error'
+                    value = fallback()
+            self._store_content(contents, key, value)
+
+        total = round(time.perf_counter() - start, 3)
+        detail = ", ".join(f"{name}={t['seconds']}s({t['status']})" for name, t in self.fetch_timings.items())
+        print(f"⏱️ 内容获取完成，总耗时 {total}s: {detail}")
+        return contents
+
+    @staticmethod
+    def _store_content(contents, key, value):
+        kind, param = key
+        if kind == 'daily_quote':
+            contents[kind] = value
+        else:
+            contents[kind][param] = value
 
-        url = f"https://api.weixin.qq.com/cgi-bin/message/template/send?access_token={token}"
-
-        # 1. 获取数据
-        weather_info = self.get_weather()
-        birthday_info = self.calculate_days_until_birthday()
-        love_days_info = self.calculate_love_days()
-        horoscope_info = self.get_horoscope()  # 调用已修改的方法，现在只返回 summary
-        daily_quote = self.get_daily_quote()
-        current_date = datetime.now().strftime("%Y年%m月%d日")
-
-        # 2. 构造消息数据 (字段名需与微信模板一致)
-        payload = {
-            "touser": USER_ID,
-            "template_id": TEMPLATE_ID,
-            "data": {
-                "date": {"value": current_date, "color": "#173177"},
-                "city": {"value": CITY, "color": "#173177"},
-                "weather": {"value": weather_info, "color": "#173177"},
-                "love_days": {"value": love_days_info, "color": "#FF69B4"},
-                "birthday_left": {"value": birthday_info, "color": "#FF4500"},
-                "constellation": {"value": CONSTELLATION, "color": "#9370DB"},
-                "horoscope": {"value": horoscope_info, "color": "#173177"},  # 现在只显示 summary
-                "daily_quote": {"value": daily_quote, "color": "#808080"},
-                "girlfriend_name": {"value": GF_NAME, "color": "#FF1493"}
-            }
-        }
+    def _get_prefetched(self, key):
+        """未过期的预取内容，没有则返回 None"""
+        entry = self.prefetched.get(key)
+        if entry and time.time() - entry[1] <= PREFETCH_MAX_AGE:
+            return entry[0]
+        return None
 
+    @metrics.timed('prefetch')
+    def prefetch(self, profiles=None, send_date=None):
+        """
+        在发送窗口前预取内容：刷新 access_token，获取这些接收者涉及的所有城市天气、星座运势和每日一句，
+        渲染好模板消息后保存到预取内容包（见 content_bundle.py），发送时直接读取并投递，推送本身不再等待数据源。
+        send_date 为推送日期，默认今天；预取以后的日期时天气使用高德天气预报，
+        星座运势和每日一句接口只有今天的内容，改用该日期的本地语料
+        """
+        profiles = load_profiles() if profiles is None else profiles
+        send_date = send_date or date.today()
+        if not profiles:
+            return None
+        print(f"--- 预取 {send_date} 的推送内容，共 {len(profiles)} 个接收者 ---")
+        self.get_access_token()
+        contents = self.fetch_contents(cities=[p['city'] for p in profiles],
+                                       constellations=[p['constellation'] for p in profiles], day=send_date)
+        if send_date == date.today():
+            now = time.time()
+            for city, value in contents['weather'].items():
+                self.prefetched[('weather', city)] = (value, now)
+            for sign, value in contents['horoscope'].items():
+                self.prefetched[('horoscope', sign)] = (value, now)
+            self.prefetched[('daily_quote', None)] = (contents['daily_quote'], now)
+
+        payloads = self.render_payloads(profiles, contents, today=send_date)
+        path = self.bundles.save(send_date, profiles, payloads, contents)
+        print(f"📦 已预取 {len(payloads)} 条模板消息: {path}")
+        return contents
+
+    @staticmethod
+    def _timing_name(key):
+        kind, param = key
+        return f"{kind}:{param}" if param else kind
+
+    @metrics.timed('render_payloads')
+    def render_payloads(self, profiles, contents, current_date=None, today=None):
+        """
+        批量渲染模板消息，生日倒计时和恋爱天数对所有接收者一次性批量计算。
+        today 为推送日期（预取明天的消息时传入），默认今天。
+        返回与 profiles 顺序一致的 payload 列表
+        """
+        today = today or date.today()
+        current_date = current_date or today.strftime("%Y年%m月%d日")
+        # 日期相关字段一次性批量计算（安装 numpy 时向量化）
+        birthday_texts = batch_birthday_texts([p['birthday'] for p in profiles], [p['name'] for p in profiles],
+                                              today)
+        start_dates = {value: self.parse_relationship_date(value)
+                       for value in dict.fromkeys(p['relationship_date'] for p in profiles)}
+        love_day_texts = batch_love_day_texts([start_dates[p['relationship_date']] for p in profiles], today)
+
+        weather, horoscope, daily_quote = contents['weather'], contents['horoscope'], contents['daily_quote']
+        renderer = TEMPLATE_SPEC.compile(TEMPLATE_ID)
+        return renderer.render_many(
+            (profile['openid'], {
+                'date': current_date,
+                'city': profile['city'],
+                'weather': weather[profile['city']],
+                'love_days': love_days_info,
+                'birthday_left': birthday_info,
+                'constellation': profile['constellation'],
+                'horoscope': horoscope[profile['constellation']],
+                'daily_quote': daily_quote,
+                'name': profile['name'],
+            })
+            for profile, birthday_info, love_days_info in zip(profiles, birthday_texts, love_day_texts))
+
+    def _post_template(self, token, payload):
+        """推送单条模板消息，返回该接收者的结果记录"""
+        start = time.perf_counter()
+        result = {'success': False, 'errcode': None, 'errmsg': '', 'seconds': 0}
         try:
-            response = requests.post(url, json=payload, timeout=10)
+            response = http_client.post(WECHAT_SEND_URL, params={'access_token': token}, data=dumps(payload),
+                                        headers=JSON_HEADERS)
             res_data = response.json()
-            if res_data.get('errcode') == 0:
-                print("🎉 消息推送成功!")
-                return True
-            else:
-                print(f"❌ 消息推送失败: {res_data}")
-                return False
+            result['errcode'] = res_data.get('errcode')
+            result['errmsg'] = res_data.get('errmsg', '')
+            result['success'] = res_data.get('errcode') == 0
         except Exception as e:
-            print(f"❌ 发送消息时出错: {e}")
+            result['errmsg'] = str(e)
+        result['seconds'] = round(time.perf_counter() - start, 3)
+        return result
+
+    @metrics.timed('send_message')
+    def send_message(self, user_ids=None, profiles=None, send_date=None):
+        """
+        发送模板消息。
+        每个接收者可以有自己的城市、生日、纪念日和星座（见 load_profiles），
+        共享内容按不同的城市/星座各获取一次，渲染后写入发件箱，再以有限并发 + 每秒限速投递。
+        send_date 为推送日期（接收者时区的日期，见 run_daemon），默认今天；
+        当天已经推送成功的接收者会被跳过，重跑不会重复发送。
+        返回每个接收者的结果表 {openid: {'success', 'status', 'errcode', 'errmsg', 'attempts', 'seconds'}}
+        """
+        if profiles is None:
+            profiles = [default_profile(uid) for uid in user_ids] if user_ids is not None else load_profiles()
+        if not TEMPLATE_ID or not profiles:
+            print("❌ 未配置 WECHAT_TEMPLATE_ID 或 WECHAT_USER_ID")
+            return {}
+
+        send_date = send_date or date.today()
+        day = send_date.isoformat()
+        expired = self.outbox.expire_before(day)
+        if expired:
+            print(f"⚠️ 发件箱中 {expired} 条往日未发送的消息已过期")
+        openids = [p['openid'] for p in profiles]
+        already_sent = self.outbox.sent_openids(day, openids)
+        if already_sent:
+            print(f"⏭️ 今天已推送成功的接收者 {len(already_sent)} 个，跳过")
+        profiles = [p for p in profiles if p['openid'] not in already_sent]
+
+        if profiles:
+            token = self.get_access_token()
+            if not token:
+                print("❌ 无法获取有效的 access_token")
+                return {openid: {'success': openid in already_sent, 'status': 'sent' if openid in already_sent
+                                 else 'pending', 'errcode': None, 'errmsg': '无法获取 access_token',
+                                 'attempts': 0, 'seconds': 0}
+                        for openid in openids}
+
+            # 1. 优先使用预取内容包中已渲染好的消息
+            payloads, live_profiles = self.bundles.take(send_date, profiles, TEMPLATE_ID)
+            # 预取之后字段长度上限收紧（TEMPLATE_FIELD_LIMITS）的消息按新的上限重新渲染
+            over_limit = {payload['touser'] for payload in payloads if TEMPLATE_SPEC.validate(payload)}
+            if over_limit:
+                payloads = [payload for payload in payloads if payload['touser'] not in over_limit]
+                live_profiles += [p for p in profiles if p['openid'] in over_limit]
+            self.content_sources = {'prefetched': len(payloads), 'live': len(live_profiles)}
+            if live_profiles:
+                if payloads:
+                    print(f"⚠️ {len(live_profiles)} 个接收者没有可用的预取内容（未预取、档案变化或已过期），改为实时获取")
+                else:
+                    print("⚠️ 没有可用的预取内容包，实时获取推送内容")
+                # 2. 实时获取数据（天气按城市、星座运势按星座去重后并发获取）并渲染
+                contents = self.fetch_contents(cities=[p['city'] for p in live_profiles],
+                                               constellations=[p['constellation'] for p in live_profiles],
+                                               day=send_date)
+                payloads += self.render_payloads(live_profiles, contents, today=send_date)
+            else:
+                print(f"📦 使用预取内容包中的 {len(payloads)} 条消息")
+            # 3. 写入发件箱，再投递
+            self.outbox.enqueue(day, payloads)
+            self.deliver_all(day, profiles, payloads)
+
+        return self._collect_results(day, openids)
+
+    @metrics.timed('deliver_outbox')
+    def deliver_outbox(self, send_date=None, timeout=None):
+        """
+        投递发件箱中当天待发送的消息：有限并发 + 每秒限速，失败按指数退避重试，
+        token 失效时刷新后重试，被限流时延后重试。超过投递时限仍未发出的消息留在发件箱中
+        """
+        send_date = send_date or date.today().isoformat()
+        deadline = time.monotonic() + (OUTBOX_DRAIN_TIMEOUT if timeout is None else timeout)
+
+        with ThreadPoolExecutor(max_workers=max(1, SEND_CONCURRENCY), thread_name_prefix='send') as executor:
+            while True:
+                batch = self.outbox.due(send_date)
+                if not batch:
+                    next_at = self.outbox.next_due_at(send_date)
+                    if next_at is None:
+                        break
+                    wait_time = max(0, next_at - time.time())
+                    if time.monotonic() + wait_time > deadline:
+                        print("⚠️ 仍有消息等待重试，超过投递时限，留在发件箱中下次运行继续投递")
+                        break
+                    time.sleep(wait_time)
+                    continue
+
+                token = self.get_access_token()
+                if not token:
+                    print("❌ 无法获取有效的 access_token，停止投递")
+                    break
+
+                def send_one(item):
+                    return self._post_template(token, item[2])
+
+                token_expired = False
+                for (row_id, attempts, payload), result in zip(batch, executor.map(send_one, batch)):
+                    token_expired |= self._handle_delivery(row_id, attempts, payload['touser'], result)
+                if token_expired:
+                    print("🔄 access_token 已失效，刷新后重试")
+                    self.get_access_token(force_refresh=True)
+
+    def deliver_all(self, send_date, profiles, payloads):
+        """模板消息（发件箱）和其他推送渠道并行投递，各渠道使用自己的连接池和限速器"""
+        payload_by_openid = {payload['touser']: payload for payload in payloads}
+        recipients = [(p, payload_by_openid[p['openid']]) for p in profiles if p['openid'] in payload_by_openid]
+        # 全局渠道目标固定收到默认接收者的消息，不随预取内容包和实时渲染的拼接顺序变化
+        default_openid = USER_ID or (profiles[0]['openid'] if profiles else None)
+        default_payload = payload_by_openid.get(default_openid)
+        channel_messages = [(channel, channel.messages(default_payload, recipients)) for channel in self.channels]
+        channel_messages = [(channel, messages) for channel, messages in channel_messages if messages]
+        if not channel_messages:
+            self.deliver_outbox(send_date)
+            return
+
+        with ThreadPoolExecutor(max_workers=1 + len(channel_messages), thread_name_prefix='channel') as executor:
+            outbox_future = executor.submit(self.deliver_outbox, send_date)
+            futures = {channel.name: executor.submit(channel.deliver, messages)
+                       for channel, messages in channel_messages}
+            outbox_future.result()
+            for name, future in futures.items():
+                try:
+                    self.channel_results[name] = future.result()
+                except Exception as e:
+                    print(f"❌ 渠道 {name} 投递异常: {e}")
+                    self.channel_results[name] = {}
+        for name, results in self.channel_results.items():
+            succeeded = sum(1 for r in results.values() if r['success'])
+            print(f"📨 渠道 {name}: 成功 {succeeded} / 共 {len(results)}")
+            for target, result in results.items():
+                if not result['success']:
+                    print(f"❌ 渠道 {name} 发送失败: {target[-8:]} ({result['errcode']}) {result['errmsg']}")
+
+    def _handle_delivery(self, row_id, attempts, user_id, result):
+        """根据推送结果更新发件箱，返回是否因 token 失效而失败"""
+        self.delivery_seconds[user_id] = result['seconds']
+        errcode = result['errcode']
+        metrics.observe('send_seconds', result['seconds'])
+        if result['success']:
+            self.outbox.mark_sent(row_id)
+            print(f"🎉 消息推送成功: {user_id}")
+            self._record_delivery('sent', user_id, attempts, result)
+            return False
+
+        print(f"❌ 消息推送失败: {user_id} ({errcode}) {result['errmsg']}")
+        if errcode in PERMANENT_ERRCODES or attempts + 1 >= OUTBOX_MAX_ATTEMPTS:
+            self.outbox.mark_failed(row_id, errcode, result['errmsg'])
+            self._record_delivery('failed', user_id, attempts, result)
             return False
+        if errcode in TOKEN_ERRCODES:
+            # 刷新 token 后立即重试
+            self.outbox.mark_retry(row_id, errcode, result['errmsg'], 0)
+            self._record_delivery('token_expired', user_id, attempts, result)
+            return True
+        delay = OUTBOX_RETRY_DELAY * (2 ** attempts)
+        if errcode in RATE_LIMIT_ERRCODES:
+            delay = max(delay, OUTBOX_RATE_LIMIT_DELAY)
+            # 共享 HTTP 层的令牌桶降速，后续消息以更低的速率发送
+            http_client.report_throttled(WECHAT_SEND_URL)
+        self.outbox.mark_retry(row_id, errcode, result['errmsg'], delay)
+        self._record_delivery('rate_limited' if errcode in RATE_LIMIT_ERRCODES else 'retry', user_id, attempts, result)
+        return False
+
+    @staticmethod
+    def _record_delivery(outcome, user_id, attempts, result):
+        metrics.inc('send_total', result=outcome)
+        metrics.event('send', result=outcome, openid=user_id, attempt=attempts + 1, errcode=result['errcode'],
+                      seconds=result['seconds'])
+
+    def _collect_results(self, send_date, openids):
+        """从发件箱汇总每个接收者的投递结果"""
+        states = self.outbox.results(send_date, openids)
+        results = {}
+        for openid in openids:
+            state = states.get(openid, {'status': 'pending', 'attempts': 0, 'errcode': None, 'errmsg': ''})
+            results[openid] = {
+                'success': state['status'] == 'sent',
+                'status': state['status'],
+                'errcode': state['errcode'],
+                'errmsg': state['errmsg'],
+                'attempts': state['attempts'],
+                'seconds': self.delivery_seconds.get(openid, 0),
+            }
+        return results
 
     def run(self):
         """执行推送任务"""
         print("--- 开始执行推送任务 ---")
 
-        # 直接发送消息
-        success = self.send_message()
-
-        if success:
+        results = self.send_message()
+        succeeded = sum(1 for r in results.values() if r['success'])
+        if results:
+            print(f"📊 推送结果: 成功 {succeeded} / 共 {len(results)}")
+        if self.content_cache.stats:
+            print(f"📦 内容缓存命中: {self.content_cache.summary()}")
+        if self.content_sources.get('live'):
+            print(f"⚠️ 预取内容: {self.content_sources['prefetched']} 条，实时获取: {self.content_sources['live']} 条")
+        self.report_metrics(results)
+
+        if results and succeeded == len(results):
             print("--- 消息推送任务完成 ---")
         else:
             print("--- 消息推送任务失败 ---")
+        return results
+
+    def report_metrics(self, results=None):
+        """打印各阶段耗时，写入 run 事件和 Prometheus 指标文件（如已配置 METRICS_PROM_FILE）"""
+        summary = metrics.method_summary()
+        if summary:
+            print("⏱️ 各阶段耗时: " + ", ".join(f"{method}={round(seconds, 3)}s×{count}"
+                                               for method, count, seconds in summary))
+        results = results or {}
+        metrics.event('run', recipients=len(results), succeeded=sum(1 for r in results.values() if r['success']),
+                      methods={method: round(seconds, 4) for method, _, seconds in summary})
+        path = metrics.registry.write_prometheus()
+        if path:
+            print(f"📈 指标已写入: {path}")
+
+
+def load_recipients():
+    """
+    读取接收者列表，优先级：
+    WECHAT_USER_FILE (每行一个 openid，# 开头为注释) > WECHAT_USER_IDS (逗号分隔) > WECHAT_USER_ID
+    """
+    user_ids = []
+    if USER_FILE:
+        try:
+            with open(USER_FILE, encoding='utf-8') as f:
+                user_ids = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        except OSError as e:
+            print(f"❌ 读取接收者文件失败: {e}")
+    elif USER_IDS:
+        user_ids = [uid.strip() for uid in USER_IDS.split(',') if uid.strip()]
+    elif USER_ID:
+        user_ids = [USER_ID]
+    # 去重并保持原有顺序
+    return list(dict.fromkeys(user_ids))
+
+
+def default_profile(openid, **overrides):
+    """用全局配置补全接收者档案，渠道目标字段（serverchan_key / feishu_webhook）只在填写时保留"""
+    profile = {
+        'openid': openid,
+        'city': CITY,
+        'birthday': BIRTHDAY,
+        'relationship_date': RELATIONSHIP_DATE,
+        'name': GF_NAME,
+        'constellation': CONSTELLATION,
+        'send_time': SEND_TIME,
+        'timezone': TIMEZONE,
+    }
+    profile.update({k: v.strip() for k, v in overrides.items()
+                    if (k in profile or k in PROFILE_FIELDS) and v and v.strip()})
+    return profile
+
+
+def load_profiles(path=None):
+    """
+    读取接收者档案 (PROFILE_FILE)，支持 .csv / .json / .db(SQLite, profiles 表)。
+    字段: openid, city, birthday, relationship_date, name, constellation, send_time, timezone，
+    缺省字段使用全局配置；可选的 serverchan_key / feishu_webhook 把该接收者的消息同时发到这些渠道。
+    未配置档案文件时，按 load_recipients() 的接收者列表生成档案
+    """
+    path = path or PROFILE_FILE
+    if not path:
+        return [default_profile(uid) for uid in load_recipients()]
+
+    try:
+        ext = os.path.splitext(path)[1].lower()
+        if ext == '.csv':
+            with open(path, encoding='utf-8-sig', newline='') as f:
+                rows = list(csv.DictReader(f))
+        elif ext == '.json':
+            with open(path, encoding='utf-8') as f:
+                rows = json.load(f)
+        elif ext in ('.db', '.sqlite', '.sqlite3'):
+            conn = sqlite3.connect(path)
+            conn.row_factory = sqlite3.Row
+            try:
+                rows = [dict(row) for row in conn.execute('SELECT * FROM profiles')]
+            finally:
+                conn.close()
+        else:
+            print(f"❌ 不支持的档案文件格式: {path}")
+            return []
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"❌ 读取接收者档案失败: {e}")
+        return []
+
+    profiles = {}
+    for row in rows:
+        openid = (row.get('openid') or '').strip()
+        if openid:
+            fields = {k: str(v) for k, v in row.items() if k != 'openid' and v is not None}
+            profiles[openid] = default_profile(openid, **fields)
+    print(f"✅ 读取接收者档案 {len(profiles)} 个: {path}")
+    return list(profiles.values())
+
+
+def run_daemon(wm=None):
+    """
+    常驻模式：按接收者的推送时间（send_time + timezone）分组定时推送，
+    每组在推送前 PREFETCH_MINUTES 分钟预取内容。推送日期按该组的时区计算，与服务器时区无关。HTTP 连接池、access_token、内容缓存在多次推送之间保持热状态
+    """
+    wm = wm or WeChatMessage()
+    scheduler = Scheduler()
+
+    def slot_profiles(slot):
+        return [p for p in load_profiles() if (p['send_time'], p['timezone']) == slot]
+
+    def refresh_schedule():
+        slots = {(p['send_time'], p['timezone']) for p in load_profiles()}
+        wanted = set()
+        for slot in slots:
+            send_time, tz_name = slot
+            # 预取在推送前执行，推送日期取 PREFETCH_MINUTES 分钟后该时区的日期
+            jobs = [
+                (f"prefetch {send_time}@{tz_name}", -PREFETCH_MINUTES, lambda s=slot: wm.prefetch(
+                    slot_profiles(s), send_date=local_date(s[1], PREFETCH_MINUTES))),
+                (f"send {send_time}@{tz_name}", 0, lambda s=slot: wm.report_metrics(
+                    wm.send_message(profiles=slot_profiles(s), send_date=local_date(s[1])))),
+            ]
+            for name, offset, action in jobs:
+                wanted.add(name)
+                # 已存在的任务保持原定的下次执行时间
+                if name not in scheduler.jobs:
+                    try:
+                        scheduler.add_daily(name, send_time, tz_name, action, offset_minutes=offset)
+                    except ValueError as e:
+                        print(f"❌ 推送时间格式错误 {send_time}: {e}")
+        scheduler.remove(lambda name: name.startswith(('prefetch ', 'send ')) and name not in wanted)
+
+    refresh_schedule()
+    metrics.registry.serve()
+    scheduler.add_interval('refresh schedule', SCHEDULE_REFRESH, refresh_schedule)
+    # access_token 在过期前由 TokenManager 提前刷新，定期调用即可保持可用
+    scheduler.add_interval('keep token warm', 600, wm.get_access_token, run_now=True)
+    print("定时任务已启动...")
+    for name, next_run in scheduler.describe():
+        print(f"  {next_run}  {name}")
+    scheduler.run_forever()
+
+
+def main(argv=None):
+    """命令行入口：先加载 mess.env 并重新读取配置，再按参数执行"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='微信每日消息推送')
+    parser.add_argument('--daemon', action='store_true', help='常驻模式，按推送时间表定时推送')
+    parser.add_argument('--prefetch', action='store_true', help='只预取内容并渲染消息，保存到预取内容包，不推送')
+    parser.add_argument('--date', default='today', help='预取的推送日期: today / tomorrow / YYYY-MM-DD')
+    args = parser.parse_args(argv)
+
+    if load_env_file():
+        configure()
+    if args.prefetch:
+        WeChatMessage().prefetch(send_date=parse_send_date(args.date))
+    elif args.daemon:
+        run_daemon()
+    else:
+        WeChatMessage().run()
 
 
 if __name__ == "__main__":
-    wm = WeChatMessage()
-    wm.run()
-    # 如果需要定时任务，可以使用 APScheduler
-    # from apscheduler.schedulers.blocking import BlockingScheduler
-    # scheduler = BlockingScheduler()
-    # scheduler.add_job(wm.run, 'cron', hour=8, minute=0) # 每天8点执行
-    # print("定时任务已启动...")
-    # try:
-    #     scheduler.start()
-    # except KeyboardInterrupt:
-    #     print("定时任务已停止。")
-    #     scheduler.shutdown()
+    main()
@@ -1,7 +1,12 @@
-import requests
 import os
+import sys
 from datetime import datetime
 
+# 复用仓库根目录下的共享 HTTP 客户端和推送渠道
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import http_client
+from channels import ServerChanChannel
+
 # 从环境变量获取配置
 SEND_KEY = os.getenv('SEND_KEY')
 CITY = os.getenv('CITY', '广州')
@@ -13,7 +18,7 @@ def get_weather():
     """获取天气信息"""
     try:
         url = f"https://api.vvhan.com/api/weather?city={CITY}"
-        response = requests.get(url, timeout=10)
+        response = http_client.get(url)
         data = response.json()
 
         if data.get('success'):
@@ -32,7 +37,7 @@ def get_horoscope():
     """获取星座运势（双鱼座）"""
     try:
         url = "https://api.vvhan.com/api/horoscope?type=pisces&time=today"
-        response = requests.get(url, timeout=10)
+        response = http_client.get(url)
         data = response.json()
 
         if data.get('success'):
@@ -134,21 +139,14 @@ def send_message():
     print("\n" + "=" * 50 + "\n")
 
     try:
-        url = f"https://sctapi.ftqq.com/{SEND_KEY}.send"
-        data = {
-            "title": f"🌞 早安推送 - {datetime.now().strftime('%m月%d日')}",
-            "desp": message
-        }
-
-        response = requests.post(url, data=data, timeout=10)
-        result = response.json()
+        title = f"🌞 早安推送 - {datetime.now().strftime('%m月%d日')}"
+        result = ServerChanChannel().send(SEND_KEY, title, message)
 
-        if result.get('code') == 0:
+        if result['success']:
             print("✅ 消息发送成功！")
-            print(f"消息ID: {result.get('data', {}).get('pushid')}")
             return True
         else:
-            print(f"❌ 消息发送失败: {result.get('message')}")
+            print(f"❌ 消息发送失败: {result['errmsg']}")
             return False
 
     except Exception as e:
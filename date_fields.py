@@ -0,0 +1,153 @@
+from datetime import date
+
+# --- 日期相关字段（生日倒计时、恋爱天数）的批量计算 ---
+# 为大量接收者渲染消息时，一次性计算所有人的天数；安装了 numpy 时使用 datetime64 向量化计算。
+# 文案与 WeChatMessage.calculate_days_until_birthday / calculate_love_days 完全一致。
+
+INVALID_BIRTHDAY_TEXT = "🎁 生日总是最特别的日子"
+MAX_DAYS_IN_MONTH = [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+# 少于这个数量时纯 Python 更快，也省去导入 numpy 的耗时（冷启动约 80ms）
+NUMPY_MIN_BATCH = 256
+_np = None
+
+
+def _numpy(size):
+    """批量足够大且安装了 numpy 时返回 numpy 模块（首次使用时才导入），否则返回 None"""
+    global _np
+    if size < NUMPY_MIN_BATCH:
+        return None
+    if _np is None:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:  # numpy 为可选依赖，未安装时使用纯 Python 逐个计算
+            _np = False
+    return _np or None
+
+
+def is_leap_year(year):
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+
+def parse_birthday(value):
+    """解析 MM-DD 格式的生日，返回 (month, day)，格式错误返回 None"""
+    try:
+        month, day = map(int, value.split('-'))
+    except (AttributeError, ValueError):
+        return None
+    if not 1 <= month <= 12 or not 1 <= day <= MAX_DAYS_IN_MONTH[month - 1]:
+        return None
+    return month, day
+
+
+def birthday_in_year(month, day, year):
+    """某年的生日日期，非闰年的 2月29日 按 3月1日 计算"""
+    if month == 2 and day == 29 and not is_leap_year(year):
+        return date(year, 3, 1)
+    return date(year, month, day)
+
+
+def days_until_birthday(month, day, today):
+    """距离下一次生日的天数，当天为 0"""
+    birthday_this_year = birthday_in_year(month, day, today.year)
+    if today > birthday_this_year:
+        return (birthday_in_year(month, day, today.year + 1) - today).days
+    return (birthday_this_year - today).days
+
+
+def birthday_text(days_left, name):
+    """生成有趣的倒计时描述"""
+    if days_left == 0:
+        return f"🎉 破壳啦~ 生日快乐呀{name}！"
+    elif days_left == 1:
+        return "🌟 明天生日！已经准备好惊喜啦~"
+    elif days_left < 7:
+        return f"🎂 还有{days_left}天！超级期待！"
+    elif days_left < 30:
+        return f"💝 还有{days_left}天，每天都在想你"
+    elif days_left < 100:
+        return f"📅 还有{days_left}天，期待与你庆祝"
+    else:
+        return f"🗓️ 还有{days_left}天，但对你的心动从不停止"
+
+
+def love_days_text(days):
+    """恋爱天数描述，整年 / 百天 / 整月有特别的文案"""
+    if days <= 0:
+        return "💘 今天是我们相识的第一天！"
+    elif days % 365 == 0:
+        years = days // 365
+        return f"💑 我们已经相识{years}年啦！{days}天的幸福时光~"
+    elif days % 100 == 0:
+        return f"💞 第{days}天啦！百天纪念快乐~"
+    elif days % 30 == 0:
+        return f"💖 已经{days}天了，每月都有新事物~"
+    else:
+        return f"❤️ 我们已经相识{days}天啦~"
+
+
+def batch_days_until_birthday(birthdays, today=None):
+    """
+    批量计算距离生日的天数。
+    birthdays 为 MM-DD 字符串序列，返回等长列表，格式错误的位置为 None
+    """
+    today = today or date.today()
+    # 相同的生日只解析一次
+    parsed = {value: parse_birthday(value) for value in dict.fromkeys(birthdays)}
+    valid = [value for value, md in parsed.items() if md]
+
+    np = _numpy(len(valid))
+    if np is None:
+        days_by_value = {value: days_until_birthday(*parsed[value], today) for value in valid}
+    else:
+        months = np.array([parsed[value][0] for value in valid])
+        days = np.array([parsed[value][1] for value in valid])
+        today64 = np.datetime64(today, 'D')
+
+        def occurrence(year):
+            # 月初 + (日 - 1) 天；非闰年的 2月29日 自然落到 3月1日
+            month_start = np.datetime64(f'{year:04d}-01', 'M') + (months - 1)
+            return month_start.astype('datetime64[D]') + (days - 1)
+
+        this_year = occurrence(today.year)
+        target = np.where(this_year < today64, occurrence(today.year + 1), this_year)
+        days_left = (target - today64).astype(int)
+        days_by_value = dict(zip(valid, days_left.tolist()))
+
+    return [days_by_value.get(value) for value in birthdays]
+
+
+def batch_love_days(start_dates, today=None):
+    """批量计算恋爱天数，start_dates 为 date 序列"""
+    today = today or date.today()
+    np = _numpy(len(start_dates))
+    if np is None:
+        return [(today - start).days for start in start_dates]
+    starts = np.array(start_dates, dtype='datetime64[D]')
+    return (np.datetime64(today, 'D') - starts).astype(int).tolist()
+
+
+def batch_birthday_texts(birthdays, names, today=None):
+    """批量生成生日倒计时文案，与 calculate_days_until_birthday 的结果一致"""
+    days_left = batch_days_until_birthday(birthdays, today)
+    texts = {}
+    result = []
+    for days, name in zip(days_left, names):
+        if days is None:
+            result.append(INVALID_BIRTHDAY_TEXT)
+            continue
+        if (days, name) not in texts:
+            texts[(days, name)] = birthday_text(days, name)
+        result.append(texts[(days, name)])
+    return result
+
+
+def batch_love_day_texts(start_dates, today=None):
+    """批量生成恋爱天数文案，与 calculate_love_days 的结果一致"""
+    texts = {}
+    result = []
+    for days in batch_love_days(start_dates, today):
+        if days not in texts:
+            texts[days] = love_days_text(days)
+        result.append(texts[days])
+    return result
@@ -0,0 +1,255 @@
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# --- 本地模拟数据源 ---
+# 模拟高德（地理编码、天气）、天行数据（星座运势、对话）、一言、微信（access_token、模板消息）、
+# Server酱和飞书机器人接口，返回与真实接口相同结构的 JSON，可注入延迟、错误率和微信 errcode，用于离线压测和回归测试。
+# 把 AMAP_BASE_URL / TIANAPI_BASE_URL / WECHAT_BASE_URL / HITOKOTO_URL / SERVERCHAN_BASE_URL 指向本服务即可：
+#   python fake_providers.py --port 8900 --latency 0.05 --error-rate 0.02 --errcode 45009:0.01
+
+PROVIDERS = ('amap_geocode', 'amap_weather', 'tianapi_star', 'tianapi_dialogue', 'hitokoto',
+             'wechat_token', 'wechat_send', 'serverchan', 'feishu')
+FEISHU_HOOK_PATH = '/open-apis/bot/v2/hook/'
+
+ROUTES = {
+    '/v3/geocode/geo': 'amap_geocode',
+    '/v3/weather/weatherInfo': 'amap_weather',
+    '/star/index': 'tianapi_star',
+    '/dialogue/index': 'tianapi_dialogue',
+    '/hitokoto/': 'hitokoto',
+    '/cgi-bin/token': 'wechat_token',
+    '/cgi-bin/message/template/send': 'wechat_send',
+}
+
+WEATHERS = ('晴', '多云', '阴', '小雨', '雷阵雨')
+
+
+class FakeProviders:
+    """
+    模拟数据源服务。
+    latency / error_rate 为全局默认值，也可传入 {数据源: 值} 单独设置；
+    wechat_errcodes 为 {errcode: 概率}，按概率让模板消息推送返回对应的 errcode
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 wechat_errcodes=None, seed=None):
+        self.latency = self._per_provider(latency)
+        self.jitter = jitter
+        self.error_rate = self._per_provider(error_rate)
+        self.wechat_errcodes = dict(wechat_errcodes or {})
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        # 每个请求的记录 (数据源, 开始时间, 结束时间, openid)，时间为 time.perf_counter()
+        self.records = []
+        self.token_count = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @staticmethod
+    def _per_provider(value):
+        if isinstance(value, dict):
+            return {provider: value.get(provider, 0.0) for provider in PROVIDERS}
+        return {provider: value for provider in PROVIDERS}
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self):
+        """让 daily_message.py 使用本服务的环境变量"""
+        return {
+            'AMAP_BASE_URL': self.base_url,
+            'TIANAPI_BASE_URL': self.base_url,
+            'WECHAT_BASE_URL': self.base_url,
+            'HITOKOTO_URL': f"{self.base_url}/hitokoto/",
+            'SERVERCHAN_BASE_URL': self.base_url,
+        }
+
+    def feishu_webhook(self, token='fake'):
+        return f"{self.base_url}{FEISHU_HOOK_PATH}{token}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-providers', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self):
+        with self.lock:
+            self.records = []
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.records)
+
+    def _record(self, provider, start, openid=None):
+        with self.lock:
+            self.records.append((provider, start, time.perf_counter(), openid))
+
+    def _delay(self, provider):
+        with self.lock:
+            delay = self.latency[provider] + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+            failed = self.random.random() < self.error_rate[provider]
+        if delay > 0:
+            time.sleep(delay)
+        return failed
+
+    def _pick_errcode(self):
+        with self.lock:
+            roll = self.random.random()
+        for errcode, probability in self.wechat_errcodes.items():
+            if roll < probability:
+                return errcode
+            roll -= probability
+        return 0
+
+    # --- 各接口的返回 ---
+
+    def respond(self, provider, params, body):
+        if provider == 'amap_geocode':
+            city = params.get('address', '')
+            adcode = str(440000 + sum(city.encode('utf-8')) % 9999)
+            return {'status': '1', 'info': 'OK', 'count': '1',
+                    'geocodes': [{'formatted_address': city, 'city': city, 'adcode': adcode}]}
+        if provider == 'amap_weather':
+            adcode = params.get('city', '')
+            weather = WEATHERS[sum(adcode.encode('utf-8')) % len(WEATHERS)]
+            if params.get('extensions') == 'all':
+                today = date.today()
+                casts = [{'date': (today + timedelta(days=n)).isoformat(), 'week': str((today.weekday() + n) % 7 + 1),
+                          'dayweather': weather, 'nightweather': '多云', 'daytemp': '26', 'nighttemp': '18',
+                          'daywind': '东', 'nightwind': '东', 'daypower': '1-3', 'nightpower': '1-3'}
+                         for n in range(4)]
+                return {'status': '1', 'info': 'OK', 'count': '1',
+                        'forecasts': [{'adcode': adcode, 'casts': casts}]}
+            return {'status': '1', 'info': 'OK', 'count': '1',
+                    'lives': [{'adcode': adcode, 'weather': weather, 'temperature': '23', 'humidity': '60',
+                               'winddirection': '东南', 'windpower': '≤3'}]}
+        if provider == 'tianapi_star':
+            astro = params.get('astro', '')
+            return {'code': 200, 'msg': 'success',
+                    'result': {'list': [{'type': '今日概述', 'content': f"{astro}今天状态不错，适合慢慢来。"}]}}
+        if provider == 'tianapi_dialogue':
+            return {'code': 200, 'msg': 'success',
+                    'result': {'dialogue': '慢慢来，比较快。', 'english': '', 'source': '模拟数据源'}}
+        if provider == 'hitokoto':
+            return {'id': 1, 'hitokoto': '愿你被这个世界温柔以待。', 'from': '模拟数据源', 'from_who': None}
+        if provider == 'wechat_token':
+            if not params.get('appid') or not params.get('secret'):
+                return {'errcode': 41002, 'errmsg': 'appid missing'}
+            with self.lock:
+                self.token_count += 1
+                token = f"FAKE_TOKEN_{self.token_count}"
+            return {'access_token': token, 'expires_in': 7200}
+        if provider == 'wechat_send':
+            if not body.get('touser') or not body.get('template_id'):
+                return {'errcode': 40003, 'errmsg': 'invalid openid'}
+            errcode = self._pick_errcode()
+            return {'errcode': errcode, 'errmsg': 'ok' if errcode == 0 else f'fake errcode {errcode}',
+                    'msgid': self.random.randint(1, 10 ** 12) if errcode == 0 else None}
+        if provider == 'serverchan':
+            return {'code': 0, 'message': '', 'data': {'pushid': str(self.random.randint(1, 10 ** 9))}}
+        if provider == 'feishu':
+            if body.get('msg_type') != 'text':
+                return {'code': 9499, 'msg': 'Bad Request'}
+            return {'code': 0, 'msg': 'success', 'data': {}}
+        return None
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # 支持 keep-alive，和真实接口一样复用连接
+
+            def _handle(self):
+                start = time.perf_counter()
+                parts = urlsplit(self.path)
+                provider = ROUTES.get(parts.path)
+                if provider is None and parts.path.endswith('.send'):
+                    provider = 'serverchan'
+                elif provider is None and parts.path.startswith(FEISHU_HOOK_PATH):
+                    provider = 'feishu'
+                params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+                body = {}
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    raw = self.rfile.read(length)
+                    try:
+                        body = json.loads(raw)
+                    except ValueError:
+                        # Server酱为表单提交
+                        body = {key: values[0] for key, values in parse_qs(raw.decode('utf-8')).items()}
+                if provider is None:
+                    self._send(404, {'error': f'unknown path {parts.path}'})
+                    return
+                if fake._delay(provider):
+                    self._send(503, {'error': 'injected failure'})
+                else:
+                    self._send(200, fake.respond(provider, params, body))
+                fake._record(provider, start, body.get('touser'))
+
+            def _send(self, status, data):
+                payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass  # 压测时不逐条打印访问日志
+
+        return Handler
+
+
+def parse_errcodes(values):
+    """解析 --errcode 45009:0.01 形式的参数"""
+    errcodes = {}
+    for value in values or []:
+        errcode, probability = value.split(':')
+        errcodes[int(errcode)] = float(probability)
+    return errcodes
+
+
+def add_fault_arguments(parser):
+    """模拟服务的故障注入参数，benchmark.py 共用"""
+    parser.add_argument('--latency', type=float, default=0.02, help='每个请求的基础延迟(秒)')
+    parser.add_argument('--jitter', type=float, default=0.01, help='在基础延迟上随机增加 0~jitter 秒')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='数据源返回 HTTP 503 的概率')
+    parser.add_argument('--errcode', action='append', metavar='CODE:P',
+                        help='模板消息推送按概率 P 返回微信 errcode，可重复，如 45009:0.01')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子，便于复现')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='本地模拟数据源（高德 / 天行 / 一言 / 微信）')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    fake = FakeProviders(args.host, args.port, args.latency, args.jitter, args.error_rate,
+                         parse_errcodes(args.errcode), args.seed)
+    print(f"✅ 模拟数据源已启动: {fake.base_url}")
+    for key, value in fake.env().items():
+        print(f"  {key}={value}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        print("模拟数据源已停止。")
+    finally:
+        fake.server.server_close()
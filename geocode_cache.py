@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+import time
+
+from storage import atomic_write, cache_path
+
+# --- 城市名 → 高德 adcode 缓存 ---
+# 城市与 adcode 的对应关系几乎不会变化，查询顺序：内置离线表 → 本地持久缓存 → 高德地理编码 API
+# GEOCODE_TTL_DAYS: 持久缓存有效期(天)，默认 90
+# GEOCODE_OFFLINE: 设为 0 可禁用内置离线表，默认启用
+
+# 主要城市的离线 adcode 表（城市级编码，可直接用于 weatherInfo 接口）
+OFFLINE_ADCODES = {
+    '北京': '110000', '天津': '120000', '上海': '310000', '重庆': '500000',
+    '石家庄': '130100', '太原': '140100', '呼和浩特': '150100', '沈阳': '210100',
+    '大连': '210200', '长春': '220100', '哈尔滨': '230100', '南京': '320100',
+    '无锡': '320200', '苏州': '320500', '杭州': '330100', '宁波': '330200',
+    '合肥': '340100', '福州': '350100', '厦门': '350200', '南昌': '360100',
+    '济南': '370100', '青岛': '370200', '郑州': '410100', '武汉': '420100',
+    '长沙': '430100', '广州': '440100', '深圳': '440300', '珠海': '440400',
+    '佛山': '440600', '东莞': '441900', '南宁': '450100', '海口': '460100',
+    '成都': '510100', '贵阳': '520100', '昆明': '530100', '拉萨': '540100',
+    '西安': '610100', '兰州': '620100', '西宁': '630100', '银川': '640100',
+    '乌鲁木齐': '650100', '香港': '810000', '澳门': '820000',
+}
+
+
+def normalize_city(city):
+    """统一城市名写法：去掉首尾空白和末尾的“市”"""
+    city = (city or '').strip()
+    if len(city) > 2 and city.endswith('市'):
+        city = city[:-1]
+    return city
+
+
+class GeocodeCache:
+    """城市名 → adcode 的持久缓存（JSON 文件），线程安全"""
+
+    def __init__(self, path=None, ttl_days=None, use_offline=None):
+        self.path = path or cache_path('geocode.json')
+        if ttl_days is None:
+            ttl_days = float(os.getenv('GEOCODE_TTL_DAYS', '90'))
+        self.ttl = ttl_days * 86400
+        if use_offline is None:
+            use_offline = os.getenv('GEOCODE_OFFLINE', '1') != '0'
+        self.use_offline = use_offline
+        self.lock = threading.Lock()
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        atomic_write(self.path, json.dumps(self.entries, ensure_ascii=False))
+
+    def get(self, city):
+        """返回缓存的 adcode，未命中或已过期返回 None"""
+        city = normalize_city(city)
+        if self.use_offline and city in OFFLINE_ADCODES:
+            return OFFLINE_ADCODES[city]
+        entry = self.entries.get(city)
+        if entry and time.time() - entry['cached_at'] < self.ttl:
+            return entry['adcode']
+        return None
+
+    def put(self, city, adcode):
+        with self.lock:
+            self.entries[normalize_city(city)] = {'adcode': adcode, 'cached_at': time.time()}
+            try:
+                self._save()
+            except OSError as e:
+                print(f"⚠️ 保存地理编码缓存失败: {e}")
+
+    def resolve(self, city, geocoder):
+        """
+        解析城市 adcode，未命中时调用 geocoder(city) 查询并写入缓存。
+        geocoder 返回 adcode 或 None
+        """
+        adcode = self.get(city)
+        if adcode:
+            return adcode
+        adcode = geocoder(city)
+        if adcode:
+            self.put(city, adcode)
+        return adcode
+
+    def resolve_many(self, cities, geocoder):
+        """批量解析多个城市，只有缓存未命中的城市才会调用 geocoder"""
+        return {city: self.resolve(city, geocoder) for city in dict.fromkeys(cities)}
@@ -0,0 +1,90 @@
+import random
+from datetime import date
+from functools import lru_cache
+
+# --- 本地星座运势语料（星座运势 API 不可用时的备用方案） ---
+# 句子表在导入时构建一次；按 (日期序号, 星座编号) 确定性地选取句子，
+# 每次查询使用独立的 random.Random 实例，不修改全局 random 的状态，线程安全。
+
+CONSTELLATIONS = ('白羊座', '金牛座', '双子座', '巨蟹座', '狮子座', '处女座',
+                  '天秤座', '天蝎座', '射手座', '摩羯座', '水瓶座', '双鱼座')
+
+# 按运势类型分类的句子
+LOVE_FORTUNES = (
+    "单身者有机会在社交场合遇到心仪的对象，保持开放的心态。",
+    "有伴侣的人今天适合安排一次浪漫的约会，增进感情。",
+    "沟通是关键，多倾听对方的想法，避免不必要的误会。",
+    "感受到爱意的流动，一个小小的举动就能让对方感到幸福。",
+    "情感运势稳定，适合与爱人分享内心深处的想法。",
+    "可能会收到来自异性的邀请，不妨尝试接受。",
+)
+WORK_FORTUNES = (
+    "工作中可能会遇到挑战，但你的创意和努力将得到认可。",
+    "团队合作非常重要，多与同事交流，集思广益。",
+    "今天适合处理积压的事务，效率会很高。",
+    "可能会有新的项目或机会出现，保持警觉。",
+    "避免在细节上过于纠结，把握大局更为重要。",
+    "学习新技能的好时机，投资自己总是值得的。",
+)
+MONEY_FORTUNES = (
+    "财运平稳，适合制定理财计划。",
+    "可能会有意外的小收入，比如红包或退款。",
+    "花钱要理性，避免冲动消费。",
+    "投资方面需要谨慎，多做研究再做决定。",
+    "正财稳定，偏财运也不错，有机会通过副业增收。",
+    "记账是个好习惯，能帮你更好地掌控财务状况。",
+)
+HEALTH_FORTUNES = (
+    "注意劳逸结合，避免过度劳累。",
+    "多喝水，多吃水果蔬菜，保持身体健康。",
+    "适合进行一些轻松的运动，如散步或瑜伽。",
+    "情绪对健康影响很大，保持乐观的心态。",
+    "可能会感到有些疲惫，早点休息是不错的选择。",
+    "关注身体发出的信号，不适时及时调整。",
+)
+GENERAL_FORTUNES = (
+    "今天你的直觉很敏锐，相信第一感觉。",
+    "整体运势不错，保持积极的心态会带来更多好运。",
+    "可能会遇到需要做决定的时刻，深思熟虑后行动。",
+    "学习能力增强，适合给自己充电。",
+    "出门走走，接触新环境会带来灵感。",
+    "今天适合反思和规划，为未来做好准备。",
+)
+# 结尾
+ENDINGS = (
+    "愿你今天被幸福填满！",
+    "带着微笑开启新的一天吧！",
+    "宇宙与你同在，加油！",
+    "每一天都是限量版，好好珍惜！",
+    "你的存在就是最好的礼物！",
+)
+
+
+def constellation_id(constellation):
+    """星座编号（各字符编码之和），与历史版本的取值保持一致，保证同一天的运势不变"""
+    return sum(ord(char) for char in constellation)
+
+
+@lru_cache(maxsize=1024)
+def _summary(day_ordinal, sign_id):
+    rng = random.Random(day_ordinal + sign_id)
+    # 选取顺序与历史版本一致：感情、工作、财运、健康、综合，最后是结尾
+    love = rng.choice(LOVE_FORTUNES)
+    work = rng.choice(WORK_FORTUNES)
+    money = rng.choice(MONEY_FORTUNES)
+    health = rng.choice(HEALTH_FORTUNES)
+    general = rng.choice(GENERAL_FORTUNES)
+    ending = rng.choice(ENDINGS)
+    return f"{general} {love} {work} {money} {health} {ending}"
+
+
+def local_horoscope(constellation, day=None):
+    """某个星座某一天的本地运势，同一天同一星座的结果固定"""
+    day = day or date.today()
+    return _summary(day.toordinal(), constellation_id(constellation))
+
+
+def local_horoscopes(constellations=CONSTELLATIONS, day=None):
+    """一次查询多个星座（默认全部 12 个）的本地运势，返回 {星座: 运势}"""
+    day = day or date.today()
+    return {constellation: local_horoscope(constellation, day) for constellation in constellations}
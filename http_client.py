@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import metrics
+from rate_limit import EndpointLimits
+
+# --- 共享 HTTP 客户端 ---
+# 所有数据源（高德、天行、一言、微信、Server酱）共用一个连接池会话，复用 TCP/TLS 连接。
+# requests 在第一次创建会话时才导入，只读取预取内容包等不发请求的路径不承担它的导入耗时。
+# 配置在首次使用时从环境变量读取：
+# HTTP_TIMEOUT: 默认超时(秒)，默认 10
+# HTTP_RETRIES: 连接错误/5xx/429 的重试次数，默认 2
+# HTTP_BACKOFF: 重试退避系数，第 n 次重试前等待 backoff * 2^(n-1) 秒，默认 0.5
+# HTTP_POOL_SIZE: 每个主机的最大连接数，默认 20
+# RATE_LIMITS: 按接口的令牌桶限速（见 rate_limit.py）
+
+_session = None
+_default_timeout = 10
+_session_lock = threading.Lock()
+_limits = None
+# 计时钩子: hook(method, url, seconds, status_code, error)，status_code/error 之一为 None
+_timing_hooks = []
+
+
+def _build_session():
+    global _default_timeout
+    _default_timeout = float(os.getenv('HTTP_TIMEOUT', '10'))
+    return create_session()
+
+
+def create_session(pool_size=None):
+    """创建带连接池和统一重试策略的会话；推送渠道等需要独立连接池时单独创建"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retries = int(os.getenv('HTTP_RETRIES', '2'))
+    pool_size = pool_size or int(os.getenv('HTTP_POOL_SIZE', '20'))
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        backoff_factor=float(os.getenv('HTTP_BACKOFF', '0.5')),
+        status_forcelist=(429, 500, 502, 503, 504),
+        # 默认只重试幂等请求，POST (如模板消息推送) 不自动重试，避免重复发送
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """获取模块级共享会话（延迟创建，线程安全）"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def get_limits():
+    """按接口的令牌桶（延迟创建，配置来自 RATE_LIMITS）"""
+    global _limits
+    if _limits is None:
+        with _session_lock:
+            if _limits is None:
+                _limits = EndpointLimits(os.getenv('RATE_LIMITS'))
+    return _limits
+
+
+def set_rate_limit(url, rate, burst=None, override=False):
+    """为某个接口（URL 前缀）设置每秒请求上限，默认不覆盖 RATE_LIMITS 中的配置"""
+    return get_limits().set(url, rate, burst, override)
+
+
+def report_throttled(url):
+    """调用方从返回内容识别出限流（如微信 errcode 45009）时调用，该接口的令牌桶速率减半"""
+    bucket = get_limits().match(url)
+    if bucket is None:
+        return
+    rate = bucket.throttle()
+    if rate is None:
+        return
+    metrics.inc('rate_limit_throttled_total', host=host_of(url))
+    metrics.event('rate_limit_throttled', url=url.split('?')[0], rate=round(rate, 3))
+    print(f"🐢 {host_of(url)} 触发限流，速率降为 {round(rate, 2)}/s")
+
+
+def add_timing_hook(hook):
+    """注册计时钩子，每次请求结束（成功或异常）后调用"""
+    _timing_hooks.append(hook)
+
+
+def remove_timing_hook(hook):
+    if hook in _timing_hooks:
+        _timing_hooks.remove(hook)
+
+
+def request(method, url, timeout=None, session=None, **kwargs):
+    """发送请求，耗时（含重试）通知到所有计时钩子。session 默认为共享会话"""
+    session = session or get_session()
+    bucket = get_limits().match(url)
+    if bucket is not None:
+        waited = bucket.acquire()
+        if waited:
+            metrics.observe('rate_limit_wait_seconds', waited, host=host_of(url))
+    start = time.perf_counter()
+    try:
+        response = session.request(method, url, timeout=timeout or _default_timeout, **kwargs)
+    except Exception as e:
+        seconds = time.perf_counter() - start
+        metrics.observe('http_request_seconds', seconds, host=host_of(url), method=method)
+        _notify(method, url, seconds, None, e)
+        raise
+    seconds = time.perf_counter() - start
+    metrics.observe('http_request_seconds', seconds, host=host_of(url), method=method)
+    # urllib3 记录了本次请求经历的自动重试
+    history = getattr(getattr(response.raw, 'retries', None), 'history', None)
+    if history:
+        metrics.inc('http_retries_total', len(history), host=host_of(url))
+        metrics.event('http_retry', host=host_of(url), method=method, retries=len(history))
+    if bucket is not None:
+        if response.status_code == 429:
+            report_throttled(url)
+        elif response.status_code < 400:
+            bucket.on_success()
+    _notify(method, url, seconds, response.status_code, None)
+    return response
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def _notify(method, url, seconds, status_code, error):
+    for hook in list(_timing_hooks):
+        try:
+            hook(method, url, seconds, status_code, error)
+        except Exception as e:
+            print(f"⚠️ HTTP 计时钩子异常: {e}")
+
+
+def host_of(url):
+    """提取 URL 的主机名，便于钩子按主机聚合"""
+    return urlsplit(url).hostname or ''
@@ -0,0 +1,165 @@
+import json
+import os
+
+import metrics
+
+# --- 模板消息渲染 ---
+# 模板用声明式的字段表描述：字段名（需与微信模板一致）→ 数据来源、颜色、最大长度，
+# 编译一次后得到渲染器，批量接收者只需逐条取值、检查长度，不再手写 payload。
+# 微信会静默截断过长的字段值，这里在渲染时就检查：
+# TEMPLATE_OVERFLOW: 字段超长时的处理，truncate（默认，截断并以 … 结尾）或 error（抛出 FieldTooLongError）
+# TEMPLATE_FIELD_LIMITS: 覆盖字段的最大长度，如 horoscope:100,daily_quote:120
+# 序列化使用 orjson（已安装时），否则为标准库 json，两者输出相同的 UTF-8 JSON。
+
+ELLIPSIS = '…'
+
+
+class FieldTooLongError(ValueError):
+    def __init__(self, field, length, max_length):
+        super().__init__(f"模板字段 {field} 长度 {length} 超过上限 {max_length}")
+        self.field = field
+        self.length = length
+        self.max_length = max_length
+
+
+class Field:
+    """
+    模板字段。
+    source 为渲染上下文中的键；format 为 str.format 模板（可引用上下文中的键，也可以是固定文本），二者取其一；
+    max_length 为字段值的最大字符数，None 表示不限制
+    """
+
+    __slots__ = ('name', 'source', 'format', 'color', 'max_length')
+
+    def __init__(self, name, source=None, color='#173177', max_length=None, format=None):
+        if (source is None) == (format is None):
+            raise ValueError(f"模板字段 {name} 需要且只能指定 source 或 format 之一")
+        self.name = name
+        self.source = source
+        self.format = format
+        self.color = color
+        self.max_length = max_length
+
+
+def parse_limits(spec):
+    """解析 horoscope:100,daily_quote:120 形式的字段长度配置"""
+    limits = {}
+    for item in (spec or '').split(','):
+        if item.strip():
+            name, value = item.split(':')
+            limits[name.strip()] = int(value)
+    return limits
+
+
+class TemplateSpec:
+    """字段表，compile() 按模板 ID 编译为渲染器并缓存"""
+
+    def __init__(self, fields, url=None):
+        self.fields = list(fields)
+        self.url = url
+        self._compiled = {}
+
+    def compile(self, template_id, overflow=None, limits=None):
+        overflow = overflow or os.getenv('TEMPLATE_OVERFLOW', 'truncate')
+        if limits is None:
+            limits = parse_limits(os.getenv('TEMPLATE_FIELD_LIMITS'))
+        key = (template_id, overflow, tuple(sorted(limits.items())))
+        renderer = self._compiled.get(key)
+        if renderer is None:
+            renderer = self._compiled[key] = CompiledTemplate(self, template_id, overflow, limits)
+        return renderer
+
+    def validate(self, payload, limits=None):
+        """检查已渲染的 payload（如预取内容包中的），返回超长的字段 [(字段, 长度, 上限)]"""
+        limits = parse_limits(os.getenv('TEMPLATE_FIELD_LIMITS')) if limits is None else limits
+        problems = []
+        for field in self.fields:
+            max_length = limits.get(field.name, field.max_length)
+            value = payload['data'].get(field.name, {}).get('value', '')
+            if max_length is not None and len(value) > max_length:
+                problems.append((field.name, len(value), max_length))
+        return problems
+
+
+class CompiledTemplate:
+    """编译后的渲染器：每个字段预先解析为取值函数、颜色和长度上限"""
+
+    def __init__(self, spec, template_id, overflow, limits):
+        if overflow not in ('truncate', 'error'):
+            raise ValueError(f"未知的 TEMPLATE_OVERFLOW: {overflow}")
+        self.template_id = template_id
+        self.url = spec.url
+        self.overflow = overflow
+        self.fields = tuple((field.name, self._getter(field), field.color, limits.get(field.name, field.max_length))
+                            for field in spec.fields)
+        self.truncated = {}  # {字段: 次数}
+
+    @staticmethod
+    def _getter(field):
+        if field.source is not None:
+            source = field.source
+            return lambda context: str(context[source])
+        if '{' not in field.format:
+            text = field.format
+            return lambda context: text
+        return field.format.format_map
+
+    def render(self, touser, context):
+        data = {}
+        for name, getter, color, max_length in self.fields:
+            value = getter(context)
+            if max_length is not None and len(value) > max_length:
+                value = self._overflow(name, value, max_length)
+            data[name] = {"value": value, "color": color}
+        payload = {"touser": touser, "template_id": self.template_id, "data": data}
+        if self.url:
+            payload["url"] = self.url
+        return payload
+
+    def render_many(self, items):
+        """批量渲染 [(openid, 上下文)]，超长字段截断时汇总提示一次"""
+        self.truncated = {}
+        payloads = [self.render(touser, context) for touser, context in items]
+        if self.truncated:
+            detail = ", ".join(f"{name}×{count}" for name, count in self.truncated.items())
+            print(f"⚠️ 以下模板字段超过长度上限，已截断: {detail}")
+        return payloads
+
+    def _overflow(self, name, value, max_length):
+        if self.overflow == 'error':
+            raise FieldTooLongError(name, len(value), max_length)
+        self.truncated[name] = self.truncated.get(name, 0) + 1
+        metrics.inc('template_truncated_total', field=name)
+        return value[:max(max_length - len(ELLIPSIS), 0)] + ELLIPSIS
+
+
+_orjson = None
+
+
+def _load_orjson():
+    global _orjson
+    if _orjson is None:
+        try:
+            import orjson
+            _orjson = orjson
+        except ImportError:
+            _orjson = False
+    return _orjson
+
+
+def dumps(obj):
+    """序列化为 UTF-8 JSON bytes（中文不转义），已安装 orjson 时使用 orjson"""
+    orjson = _load_orjson()
+    if orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data):
+    orjson = _load_orjson()
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+JSON_HEADERS = {'Content-Type': 'application/json; charset=utf-8'}
@@ -0,0 +1,217 @@
+import functools
+import json
+import os
+import threading
+import time
+
+from storage import atomic_write
+
+# --- 推送流程的指标 ---
+# 记录各数据源调用耗时直方图、内容缓存命中、HTTP 重试、备用数据启用、access_token 刷新、
+# 各阶段（get_weather / get_horoscope / get_daily_quote / send_message ...）耗时，
+# 可输出为 JSON Lines 事件日志和 Prometheus 文本格式（写文件供 node_exporter textfile 采集，或本地 HTTP 端口）。
+# 配置在首次使用时从环境变量读取：
+# METRICS_EVENT_LOG: JSON Lines 事件日志路径，未设置时不写事件
+# METRICS_PROM_FILE: 每次运行结束时写入的 Prometheus 文本文件路径
+# METRICS_PORT: 常驻模式下提供 /metrics 的本地 HTTP 端口
+
+PREFIX = 'daily_message_'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HELP = {
+    'method_seconds': '各推送阶段方法的耗时',
+    'provider_call_seconds': '各数据源请求的耗时（经过熔断器的调用）',
+    'provider_calls_total': '各数据源请求次数，按结果分类',
+    'http_request_seconds': '共享 HTTP 客户端每个请求的耗时（含重试）',
+    'http_retries_total': 'HTTP 层自动重试次数',
+    'cache_requests_total': '内容缓存查询次数，按命中层级分类',
+    'fallback_total': '启用本地备用数据的次数',
+    'token_refresh_total': 'access_token 刷新次数',
+    'send_total': '模板消息投递次数，按结果分类',
+    'send_seconds': '单条模板消息推送请求的耗时',
+    'channel_send_total': '其他推送渠道（Server酱、飞书）的发送次数，按结果分类',
+    'channel_send_seconds': '其他推送渠道单条消息的发送耗时',
+    'rate_limit_wait_seconds': '请求在令牌桶前等待的时间',
+    'rate_limit_throttled_total': '接口返回限流、令牌桶速率下调的次数',
+    'template_truncated_total': '模板字段超过长度上限被截断的次数',
+}
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + list(extra or [])
+    if not pairs:
+        return ''
+    text = ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return '{' + text + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class MetricsRegistry:
+    """计数器和直方图，线程安全"""
+
+    def __init__(self, event_log=None):
+        self.lock = threading.Lock()
+        self.counters = {}  # {name: {label_key: value}}
+        self.histograms = {}  # {name: {label_key: Histogram}}
+        self.event_log = event_log
+        self._event_file = None
+
+    def inc(self, name, value=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(seconds)
+
+    def event(self, kind, **fields):
+        """写一条 JSON Lines 事件，未配置 METRICS_EVENT_LOG 时忽略"""
+        path = self.event_log if self.event_log is not None else os.getenv('METRICS_EVENT_LOG')
+        if not path:
+            return
+        line = json.dumps({'ts': round(time.time(), 3), 'event': kind, **fields}, ensure_ascii=False, default=str)
+        with self.lock:
+            try:
+                if self._event_file is None or self._event_file.name != path:
+                    directory = os.path.dirname(path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    self._event_file = open(path, 'a', encoding='utf-8', buffering=1)
+                self._event_file.write(line + '\n')
+            except OSError as e:
+                print(f"⚠️ 写入指标事件失败: {e}")
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def totals(self, name):
+        """直方图各标签组合的 (次数, 总耗时)，{label_key: (count, sum)}"""
+        with self.lock:
+            return {key: (h.count, h.sum) for key, h in self.histograms.get(name, {}).items()}
+
+    def render_prometheus(self):
+        """Prometheus 文本格式"""
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                full_name = PREFIX + name
+                lines.append(f"# HELP {full_name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {full_name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{full_name}{_format_labels(key)} {value}")
+            for name, series in sorted(self.histograms.items()):
+                full_name = PREFIX + name
+                lines.append(f"# HELP {full_name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {full_name} histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{full_name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                    lines.append(f"{full_name}_bucket{_format_labels(key, [('le', '+Inf')])} {histogram.count}")
+                    lines.append(f"{full_name}_sum{_format_labels(key)} {round(histogram.sum, 6)}")
+                    lines.append(f"{full_name}_count{_format_labels(key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path=None):
+        """写入 Prometheus 文本文件（先写临时文件再替换，采集端不会读到半个文件）"""
+        path = path or os.getenv('METRICS_PROM_FILE')
+        if not path:
+            return None
+        try:
+            atomic_write(path, self.render_prometheus())
+        except OSError as e:
+            print(f"⚠️ 写入指标文件失败: {e}")
+            return None
+        return path
+
+    def serve(self, port=None, host='127.0.0.1'):
+        """在后台线程提供 http://host:port/metrics，未配置端口时返回 None"""
+        port = port or int(os.getenv('METRICS_PORT', '0'))
+        if not port:
+            return None
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+        print(f"📈 指标地址: http://{host}:{port}/metrics")
+        return server
+
+
+# 进程内共享的指标注册表
+registry = MetricsRegistry()
+inc = registry.inc
+observe = registry.observe
+event = registry.event
+
+
+def timed(method_name):
+    """装饰器：记录方法耗时到 method_seconds{method=...}，并写一条 method 事件"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                registry.observe('method_seconds', seconds, method=method_name)
+                registry.event('method', method=method_name, seconds=round(seconds, 4))
+        return wrapper
+    return decorator
+
+
+def method_summary():
+    """各阶段方法的调用次数和累计耗时，按累计耗时降序 [(method, count, seconds)]"""
+    rows = [(dict(key).get('method', ''), count, total) for key, (count, total)
+            in registry.totals('method_seconds').items()]
+    return sorted(rows, key=lambda row: row[2], reverse=True)
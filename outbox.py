@@ -0,0 +1,135 @@
+import os
+import sqlite3
+import threading
+import time
+
+from message_template import dumps, loads
+from storage import cache_path
+
+# --- 模板消息发件箱 ---
+# 渲染好的消息先写入本地 SQLite 发件箱，再由投递流程取出发送；发送失败的消息按指数退避重试，
+# 进程中断或重跑时未发送的消息仍在发件箱中，不会丢失。
+# 幂等键为 (发送日期, openid)：同一天重跑 GitHub Action 时，已发送成功的接收者不会重复推送。
+# OUTBOX_PATH: 发件箱数据库路径，默认 DAILY_MESSAGE_CACHE_DIR/outbox.db
+
+PENDING = 'pending'
+SENT = 'sent'
+FAILED = 'failed'
+EXPIRED = 'expired'
+
+
+def idempotency_key(send_date, openid):
+    return f"{send_date}:{openid}"
+
+
+class Outbox:
+    """基于 SQLite 的持久化发件箱，线程安全（每次操作使用独立连接）"""
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('OUTBOX_PATH') or cache_path('outbox.db')
+        self.lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idem_key TEXT NOT NULL UNIQUE,
+                openid TEXT NOT NULL,
+                send_date TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                last_errcode INTEGER,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                sent_at REAL
+            )''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def sent_openids(self, send_date, openids):
+        """返回指定日期已发送成功的 openid 集合"""
+        openids = list(openids)
+        sent = set()
+        with self._connect() as conn:
+            # 分批查询，避免超过 SQLite 的参数个数上限
+            for i in range(0, len(openids), 500):
+                chunk = openids[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = conn.execute(f'SELECT openid FROM outbox WHERE send_date = ? AND status = ? '
+                                    f'AND openid IN ({placeholders})', [send_date, SENT, *chunk])
+                sent.update(row[0] for row in rows)
+        return sent
+
+    def enqueue(self, send_date, payloads):
+        """
+        批量写入待发送消息。已发送成功的 (日期, openid) 保持不变；
+        尚未成功的用新的 payload 覆盖并重置重试次数
+        """
+        now = time.time()
+        rows = [(idempotency_key(send_date, p['touser']), p['touser'], send_date,
+                 dumps(p).decode('utf-8'), PENDING, now) for p in payloads]
+        with self.lock, self._connect() as conn:
+            conn.executemany('''INSERT INTO outbox (idem_key, openid, send_date, payload, status, created_at)
+                                VALUES (?, ?, ?, ?, ?, ?)
+                                ON CONFLICT(idem_key) DO UPDATE SET
+                                    payload = excluded.payload, status = excluded.status,
+                                    attempts = 0, next_attempt_at = 0
+                                WHERE outbox.status != 'sent' ''', rows)
+
+    def expire_before(self, send_date):
+        """把更早日期仍未发送的消息标记为过期，不再投递"""
+        with self.lock, self._connect() as conn:
+            cursor = conn.execute('UPDATE outbox SET status = ? WHERE status = ? AND send_date < ?',
+                                  (EXPIRED, PENDING, send_date))
+            return cursor.rowcount
+
+    def due(self, send_date, limit=500):
+        """取出当前到期、待发送的消息 [(id, attempts, payload)]"""
+        with self._connect() as conn:
+            rows = conn.execute('SELECT id, attempts, payload FROM outbox WHERE status = ? AND send_date = ? '
+                                'AND next_attempt_at <= ? ORDER BY id LIMIT ?',
+                                (PENDING, send_date, time.time(), limit)).fetchall()
+        return [(row_id, attempts, loads(payload)) for row_id, attempts, payload in rows]
+
+    def next_due_at(self, send_date):
+        """最早一条待重试消息的时间，没有待发送消息时返回 None"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT MIN(next_attempt_at) FROM outbox WHERE status = ? AND send_date = ?',
+                               (PENDING, send_date)).fetchone()
+        return row[0]
+
+    def mark_sent(self, row_id):
+        with self.lock, self._connect() as conn:
+            conn.execute('UPDATE outbox SET status = ?, sent_at = ?, attempts = attempts + 1, '
+                         'last_errcode = 0, last_error = NULL WHERE id = ?', (SENT, time.time(), row_id))
+
+    def mark_retry(self, row_id, errcode, error, delay):
+        with self.lock, self._connect() as conn:
+            conn.execute('UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, '
+                         'last_errcode = ?, last_error = ? WHERE id = ?',
+                         (time.time() + delay, errcode, error, row_id))
+
+    def mark_failed(self, row_id, errcode, error):
+        with self.lock, self._connect() as conn:
+            conn.execute('UPDATE outbox SET status = ?, attempts = attempts + 1, last_errcode = ?, last_error = ? '
+                         'WHERE id = ?', (FAILED, errcode, error, row_id))
+
+    def results(self, send_date, openids):
+        """指定日期各接收者的投递状态 {openid: {'status', 'attempts', 'errcode', 'errmsg'}}"""
+        openids = list(openids)
+        results = {}
+        with self._connect() as conn:
+            for i in range(0, len(openids), 500):
+                chunk = openids[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = conn.execute(f'SELECT openid, status, attempts, last_errcode, last_error FROM outbox '
+                                    f'WHERE send_date = ? AND openid IN ({placeholders})', [send_date, *chunk])
+                for openid, status, attempts, errcode, error in rows:
+                    results[openid] = {'status': status, 'attempts': attempts, 'errcode': errcode,
+                                       'errmsg': error or ''}
+        return results
@@ -0,0 +1,146 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+# --- 限速 ---
+# RateLimiter: 推送渠道使用的简单限速器；TokenBucket / EndpointLimits: 共享 HTTP 层按接口的令牌桶。
+
+
+class RateLimiter:
+    """简单的限速器：保证相邻两次放行间隔不小于 1/rate 秒，线程安全"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0
+        self.next_time = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait_time = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+# --- 按接口的令牌桶 ---
+# 共享 HTTP 层在发请求前按 URL 匹配令牌桶并等待令牌，保证每个接口不超过其配额；
+# 收到 HTTP 429 或调用方报告微信 45009/45047 一类的限流返回时速率减半（不低于配额的 1/20），
+# 之后每次成功的请求逐步恢复，直到配置的上限 —— 吞吐贴着上限运行，而不是被封后整批失败。
+# RATE_LIMITS: 逗号分隔的 <host/路径前缀>=<速率>[:突发]，速率写作 20/s 或 600/m，如
+#   RATE_LIMITS=api.weixin.qq.com/cgi-bin/message/template/send=20/s:40,apis.tianapi.com=5/s
+
+RECOVERY_STEP = 0.02  # 每次成功恢复配额的 2%
+THROTTLE_COOLDOWN = 1.0  # 同一批在途请求先后返回的限流只减速一次
+
+
+def parse_rate(value):
+    """解析 20/s、600/m、5 这样的速率，返回每秒次数"""
+    value = value.strip()
+    if value.endswith('/m'):
+        return float(value[:-2]) / 60
+    if value.endswith('/s'):
+        value = value[:-2]
+    return float(value)
+
+
+class TokenBucket:
+    """令牌桶，线程安全；速率可因限流自适应下调并逐步恢复"""
+
+    def __init__(self, rate, burst=None, min_rate=None):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.min_rate = min_rate or rate / 20
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.throttled_at = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _reserve(self):
+        """预支一个令牌，返回需要等待的秒数"""
+        with self.lock:
+            self._refill(time.monotonic())
+            # 令牌可以预支为负数，预支越多等待越久，并发请求依次排队
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def acquire(self):
+        """取一个令牌，必要时等待，返回等待的秒数"""
+        wait_time = self._reserve()
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return wait_time
+
+    async def aacquire(self):
+        """acquire 的异步版本，等待时不阻塞事件循环；与同步调用方共用同一个桶"""
+        import asyncio  # 只有异步模式用到，同步推送不承担导入耗时
+
+        wait_time = self._reserve()
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+        return wait_time
+
+    def throttle(self):
+        """被限流：速率减半并清空积攒的令牌，返回新的速率；冷却期内重复的限流不再减速，返回 None"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens = min(self.tokens, 0)
+            if now - self.throttled_at < THROTTLE_COOLDOWN:
+                return None
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.throttled_at = now
+            return self.rate
+
+    def on_success(self):
+        """请求成功：速率向配置的上限恢复一步"""
+        if self.rate >= self.max_rate:
+            return
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_STEP)
+
+
+def url_key(url):
+    """去掉协议和查询参数的 URL，用于匹配令牌桶的前缀"""
+    parts = urlsplit(url)
+    return f"{parts.netloc}{parts.path}"
+
+
+class EndpointLimits:
+    """按 URL 前缀管理令牌桶，最长前缀优先"""
+
+    def __init__(self, spec=None):
+        self.buckets = {}
+        self.lock = threading.Lock()
+        for item in (spec or '').split(','):
+            if '=' not in item:
+                continue
+            prefix, limit = item.split('=', 1)
+            rate, _, burst = limit.partition(':')
+            self.set(prefix.strip(), parse_rate(rate), float(burst) if burst else None)
+
+    def set(self, prefix, rate, burst=None, override=True):
+        """为前缀设置速率；override=False 时不覆盖已有配置（如 RATE_LIMITS 中已指定）"""
+        prefix = url_key(prefix) if '://' in prefix else prefix
+        with self.lock:
+            if override or prefix not in self.buckets:
+                self.buckets[prefix] = TokenBucket(rate, burst)
+            return self.buckets[prefix]
+
+    def match(self, url):
+        if not self.buckets:
+            return None
+        key = url_key(url)
+        best = None
+        for prefix in self.buckets:
+            if key.startswith(prefix) and (best is None or len(prefix) > len(best)):
+                best = prefix
+        return self.buckets[best] if best else None
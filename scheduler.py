@@ -0,0 +1,117 @@
+import time
+from datetime import datetime, timedelta
+
+# --- 进程内定时调度 ---
+# 常驻进程按时区执行每日任务，HTTP 连接池、access_token 和内容缓存在多次执行之间保持热状态。
+
+
+def get_zone(tz_name):
+    """时区对象，未安装 zoneinfo 或时区名无效时使用本机时区"""
+    if not tz_name:
+        return None
+    try:
+        from zoneinfo import ZoneInfo
+    except ImportError:  # Python 3.8 及以下没有 zoneinfo
+        return None
+    try:
+        return ZoneInfo(tz_name)
+    except Exception as e:
+        print(f"⚠️ 无效的时区 {tz_name}，使用本机时区: {e}")
+        return None
+
+
+def local_date(tz_name, offset_minutes=0):
+    """某时区当前时刻再偏移 offset_minutes 分钟后的日期，用作按时区定时推送的推送日期"""
+    return (datetime.now(get_zone(tz_name)) + timedelta(minutes=offset_minutes)).date()
+
+
+def parse_hhmm(value):
+    """解析 HH:MM，返回 (hour, minute)"""
+    hour, minute = map(int, value.strip().split(':'))
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"时间超出范围: {value}")
+    return hour, minute
+
+
+class Job:
+    def __init__(self, name, action, next_run, interval=None, daily=None):
+        self.name = name
+        self.action = action
+        self.next_run = next_run  # UNIX 时间戳
+        self.interval = interval  # 固定间隔任务（秒）
+        self.daily = daily  # 每日任务 (hour, minute, zone, offset_minutes)
+
+    def reschedule(self, now):
+        if self.interval:
+            self.next_run = now + self.interval
+        else:
+            self.next_run = next_daily_run(*self.daily, after=now)
+
+
+def next_daily_run(hour, minute, zone, offset_minutes=0, after=None):
+    """某时区每天 hour:minute 再偏移 offset_minutes 分钟的下一次执行时间戳"""
+    after = time.time() if after is None else after
+    now = datetime.fromtimestamp(after, zone)
+    candidate = now.replace(hour=hour, minute=minute, second=0, microsecond=0) + timedelta(minutes=offset_minutes)
+    while candidate.timestamp() <= after:
+        # 按日期加一天后重新定位，跨越夏令时切换时仍是当地的同一时刻
+        next_day = (candidate - timedelta(minutes=offset_minutes)).date() + timedelta(days=1)
+        candidate = datetime(next_day.year, next_day.month, next_day.day, hour, minute, tzinfo=zone) \
+            + timedelta(minutes=offset_minutes)
+    return candidate.timestamp()
+
+
+class Scheduler:
+    """简单的单线程调度器：按时间顺序依次执行到期任务"""
+
+    def __init__(self, max_sleep=30):
+        self.jobs = {}
+        # 单次休眠上限，系统时间调整或新增任务后能及时响应
+        self.max_sleep = max_sleep
+        self.running = False
+
+    def add_daily(self, name, hhmm, tz_name, action, offset_minutes=0):
+        hour, minute = parse_hhmm(hhmm)
+        daily = (hour, minute, get_zone(tz_name), offset_minutes)
+        self.jobs[name] = Job(name, action, next_daily_run(*daily), daily=daily)
+
+    def add_interval(self, name, seconds, action, run_now=False):
+        first_run = time.time() if run_now else time.time() + seconds
+        self.jobs[name] = Job(name, action, first_run, interval=seconds)
+
+    def remove(self, predicate):
+        """删除满足条件的任务，predicate(name) -> bool"""
+        for name in [name for name in self.jobs if predicate(name)]:
+            del self.jobs[name]
+
+    def describe(self):
+        return [(job.name, datetime.fromtimestamp(job.next_run).strftime('%Y-%m-%d %H:%M:%S'))
+                for job in sorted(self.jobs.values(), key=lambda j: j.next_run)]
+
+    def run_pending(self):
+        """执行所有已到期的任务，返回下一个任务的等待秒数"""
+        now = time.time()
+        for job in sorted(self.jobs.values(), key=lambda j: j.next_run):
+            if job.next_run > now:
+                break
+            if self.jobs.get(job.name) is not job:
+                continue  # 已被前面执行的任务移除或替换
+            try:
+                job.action()
+            except Exception as e:
+                print(f"❌ 定时任务 {job.name} 执行异常: {e}")
+            now = time.time()
+            job.reschedule(now)
+        if not self.jobs:
+            return self.max_sleep
+        return max(0, min(job.next_run for job in self.jobs.values()) - time.time())
+
+    def run_forever(self):
+        self.running = True
+        try:
+            while self.running:
+                time.sleep(min(self.run_pending(), self.max_sleep))
+        except KeyboardInterrupt:
+            print("定时任务已停止。")
+        finally:
+            self.running = False
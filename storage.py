@@ -0,0 +1,21 @@
+import os
+
+# --- 本地缓存目录 ---
+# access_token、城市编码、内容缓存、熔断器状态、发件箱、预取内容包等都保存在同一个目录下。
+# DAILY_MESSAGE_CACHE_DIR: 缓存目录，默认 .cache。各模块在创建对象时读取，调用方可以先加载 .env
+
+
+def cache_path(*names):
+    """缓存目录下的路径"""
+    return os.path.join(os.getenv('DAILY_MESSAGE_CACHE_DIR', '.cache'), *names)
+
+
+def atomic_write(path, text):
+    """先写临时文件再替换，其他进程不会读到写了一半的内容；目录不存在时自动创建"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
@@ -0,0 +1,45 @@
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+from io import StringIO
+
+import pytest
+
+import date_fields
+from daily_message import WeChatMessage
+
+# 批量计算（numpy / 纯 Python）与 WeChatMessage 的逐个计算在多年的日期窗口内每一天都完全一致，
+# 覆盖全年每一个生日（含 2月29日，窗口内有闰年和平年）和若干非法输入
+
+START = date(2023, 1, 1)
+END = date(2029, 12, 31)
+BIRTHDAYS = [f"{m:02d}-{d:02d}" for m in range(1, 13) for d in range(1, date_fields.MAX_DAYS_IN_MONTH[m - 1] + 1)]
+BIRTHDAYS += ['02-30', '13-01', 'abc', '3-1']
+NAMES = ['小睿'] * len(BIRTHDAYS)
+STARTS = [START - timedelta(days=n) for n in range(0, 3000, 7)]
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def backend(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+        assert date_fields._numpy(len(BIRTHDAYS)) is not None
+    else:
+        monkeypatch.setattr(date_fields, 'NUMPY_MIN_BATCH', float('inf'))
+    return request.param
+
+
+def days(start, end):
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+def test_batch_matches_scalar(backend):
+    wm = WeChatMessage.__new__(WeChatMessage)
+    for today in days(START, END):
+        with redirect_stdout(StringIO()):  # 非法输入时逐个计算会打印错误信息
+            scalar_birthdays = [wm.calculate_days_until_birthday(b, '小睿', today=today) for b in BIRTHDAYS]
+        assert date_fields.batch_birthday_texts(BIRTHDAYS, NAMES, today) == scalar_birthdays, today
+        scalar_love = [wm.calculate_love_days(s, today=today) for s in STARTS]
+        assert date_fields.batch_love_day_texts(STARTS, today) == scalar_love, today
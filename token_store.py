@@ -0,0 +1,195 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+
+from storage import atomic_write, cache_path
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，使用 msvcrt 加锁
+    fcntl = None
+    import msvcrt
+
+# --- 跨进程共享 access_token 的存储配置（在创建时读取环境变量） ---
+# TOKEN_STORE: file (默认，JSON 文件 + 文件锁) / sqlite / memory (仅进程内缓存，即原来的行为)
+# TOKEN_STORE_PATH: 存储文件路径，默认放在 DAILY_MESSAGE_CACHE_DIR (默认 .cache) 下
+# TOKEN_REFRESH_AHEAD: 距离过期不足该秒数时主动刷新（微信 token 有效期 7200 秒），默认 600
+
+
+class MemoryTokenStore:
+    """进程内存储，不跨进程共享"""
+
+    def __init__(self):
+        self.tokens = {}
+        self.lock_obj = threading.Lock()
+
+    def load(self, key):
+        return self.tokens.get(key)
+
+    def save(self, key, token, expire_at):
+        self.tokens[key] = {'access_token': token, 'expire_at': expire_at}
+
+    @contextmanager
+    def lock(self, key):
+        with self.lock_obj:
+            yield
+
+
+class FileTokenStore:
+    """JSON 文件存储，使用独立的 .lock 文件做跨进程互斥"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + '.lock'
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _read_all(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def load(self, key):
+        return self._read_all().get(key)
+
+    def save(self, key, token, expire_at):
+        data = self._read_all()
+        data[key] = {'access_token': token, 'expire_at': expire_at}
+        atomic_write(self.path, json.dumps(data))
+
+    @contextmanager
+    def lock(self, key):
+        with open(self.lock_path, 'a+') as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class SQLiteTokenStore:
+    """SQLite 存储，lock 期间持有 BEGIN IMMEDIATE 写锁实现跨进程互斥"""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS access_token ('
+                         'key TEXT PRIMARY KEY, token TEXT NOT NULL, expire_at REAL NOT NULL)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    @contextmanager
+    def _conn(self):
+        # lock 期间复用持有写锁的连接（由 lock 提交并关闭），否则新建连接，用完即提交并关闭
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        with closing(self._connect()) as conn, conn:
+            yield conn
+
+    def load(self, key):
+        with self._conn() as conn:
+            row = conn.execute('SELECT token, expire_at FROM access_token WHERE key = ?', (key,)).fetchone()
+        if row:
+            return {'access_token': row[0], 'expire_at': row[1]}
+        return None
+
+    def save(self, key, token, expire_at):
+        with self._conn() as conn:
+            conn.execute('INSERT OR REPLACE INTO access_token (key, token, expire_at) VALUES (?, ?, ?)',
+                         (key, token, expire_at))
+
+    @contextmanager
+    def lock(self, key):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        self.local.conn = conn
+        try:
+            yield
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            self.local.conn = None
+            conn.close()
+
+
+class TokenManager:
+    """
+    access_token 管理：进程内缓存 + 可插拔的持久化存储。
+    刷新是单飞的：进程内用线程锁、跨进程用存储锁，拿到锁后再检查一次存储，
+    只有确实需要刷新的那一个调用方才会请求 /cgi-bin/token。
+    """
+
+    def __init__(self, store, fetcher, refresh_ahead=None):
+        self.store = store
+        # fetcher(key) -> (access_token, expires_in) 或 None
+        self.fetcher = fetcher
+        if refresh_ahead is None:
+            refresh_ahead = int(os.getenv('TOKEN_REFRESH_AHEAD', '600'))
+        self.refresh_ahead = refresh_ahead
+        self.cache = {}
+        self.thread_lock = threading.Lock()
+
+    def _fresh(self, entry):
+        return entry and time.time() < entry['expire_at'] - self.refresh_ahead
+
+    def get(self, key, force=False):
+        """获取 access_token，force=True 时强制刷新（如收到 40001 token 失效）"""
+        entry = self.cache.get(key)
+        if not force and self._fresh(entry):
+            return entry['access_token']
+
+        with self.thread_lock:
+            stale_token = entry['access_token'] if entry else None
+            with self.store.lock(key):
+                entry = self.store.load(key)
+                # 其他线程/进程已经刷新过（强制刷新时要求 token 与失效的不同）
+                if self._fresh(entry) and not (force and entry['access_token'] == stale_token):
+                    self.cache[key] = entry
+                    return entry['access_token']
+
+                fetched = self.fetcher(key)
+                if not fetched:
+                    return None
+                token, expires_in = fetched
+                expire_at = time.time() + expires_in
+                self.store.save(key, token, expire_at)
+                self.cache[key] = {'access_token': token, 'expire_at': expire_at}
+                return token
+
+    def expire_at(self, key):
+        entry = self.cache.get(key)
+        return entry['expire_at'] if entry else 0
+
+
+def create_token_store(kind=None, path=None):
+    """按配置创建 token 存储"""
+    kind = (kind or os.getenv('TOKEN_STORE', 'file')).lower()
+    path = path or os.getenv('TOKEN_STORE_PATH')
+    if kind == 'sqlite':
+        return SQLiteTokenStore(path or cache_path('wechat_token.db'))
+    if kind == 'file':
+        return FileTokenStore(path or cache_path('wechat_token.json'))
+    return MemoryTokenStore()
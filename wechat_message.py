@@ -1,8 +1,11 @@
-import requests
 import os
 import json
 from datetime import datetime
 
+import http_client
+from message_template import JSON_HEADERS, Field, TemplateSpec, dumps
+from token_store import TokenManager, create_token_store
+
 # 从环境变量获取配置
 APPID = os.getenv('WECHAT_APPID')
 APPSECRET = os.getenv('WECHAT_APPSECRET')
@@ -12,26 +15,41 @@ CITY = os.getenv('CITY', '广州')
 BIRTHDAY = os.getenv('BIRTHDAY', '02-16')
 GF_NAME = os.getenv('GF_NAME', '小睿')
 
+# 模板字段，与 daily_message.py 共用同一套渲染（见 message_template.py）
+TEMPLATE_SPEC = TemplateSpec([
+    Field('first', format='🌞 早安{name}！', color='#FF6699', max_length=20),
+    Field('date', 'date', '#666666', max_length=20),
+    Field('week', format='星期{weekday}', color='#666666', max_length=10),
+    Field('birthday', 'birthday', '#FF9900', max_length=20),
+    Field('weather', 'weather', '#3399FF', max_length=50),
+    Field('horoscope', 'horoscope', '#9933CC', max_length=50),  # 超过 50 字时截断
+    Field('sweetWords', 'sweet_words', '#FF6666', max_length=50),
+    Field('remark', format='💖 永远爱你的我', color='#999999'),
+], url="https://github.com")  # 可点击跳转的链接
+
 class WeChatMessage:
     def __init__(self):
         self.access_token = None
         self.token_expire_time = 0
+        self.token_manager = TokenManager(create_token_store(), self._fetch_access_token)
         
     def get_access_token(self):
-        """获取微信access_token"""
-        # 如果token还有效，直接返回
-        if self.access_token and datetime.now().timestamp() < self.token_expire_time:
-            return self.access_token
-            
-        url = f"https://api.weixin.qq.com/cgi-bin/token?grant_type=client_credential&appid={APPID}&secret={APPSECRET}"
+        """获取微信access_token，与 daily_message.py 共享同一个 token 存储"""
+        token = self.token_manager.get(APPID)
+        if token:
+            self.access_token = token
+            self.token_expire_time = self.token_manager.expire_at(APPID)
+        return token
+
+    def _fetch_access_token(self, appid):
+        """请求 /cgi-bin/token，返回 (access_token, expires_in)"""
+        url = f"https://api.weixin.qq.com/cgi-bin/token?grant_type=client_credential&appid={appid}&secret={APPSECRET}"
         try:
-            response = requests.get(url, timeout=10)
+            response = http_client.get(url)
             data = response.json()
             if 'access_token' in data:
-                self.access_token = data['access_token']
-                self.token_expire_time = datetime.now().timestamp() + data['expires_in'] - 300  # 提前5分钟过期
                 print("✅ 获取access_token成功")
-                return self.access_token
+                return data['access_token'], data['expires_in']
             else:
                 print(f"❌ 获取access_token失败: {data}")
                 return None
@@ -43,7 +61,7 @@ class WeChatMessage:
         """获取天气信息"""
         try:
             url = f"https://api.vvhan.com/api/weather?city={CITY}"
-            response = requests.get(url, timeout=10)
+            response = http_client.get(url)
             data = response.json()
             
             if data.get('success'):
@@ -77,13 +95,11 @@ class WeChatMessage:
         """获取星座运势"""
         try:
             url = "https://api.vvhan.com/api/horoscope?type=pisces&time=today"
-            response = requests.get(url, timeout=10)
+            response = http_client.get(url)
             data = response.json()
             
             if data.get('success'):
-                content = data['data'].get('content', '')
-                # 截取前50个字
-                return content[:50] + "..." if len(content) > 50 else content
+                return data['data'].get('content', '')
         except Exception as e:
             print(f"获取星座运势失败: {e}")
         return "今天会是美好的一天"
@@ -123,52 +139,21 @@ class WeChatMessage:
         sweet_words = self.get_sweet_words()
         
         weekdays = ["一", "二", "三", "四", "五", "六", "日"]
-        current_weekday = weekdays[datetime.now().weekday()]
-        
-        template_data = {
-            "touser": USER_ID,
-            "template_id": TEMPLATE_ID,
-            "url": "https://github.com",  # 可点击跳转的链接
-            "data": {
-                "first": {
-                    "value": f"🌞 早安{GF_NAME}！",
-                    "color": "#FF6699"
-                },
-                "date": {
-                    "value": datetime.now().strftime('%Y年%m月%d日'),
-                    "color": "#666666"
-                },
-                "week": {
-                    "value": f"星期{current_weekday}",
-                    "color": "#666666"
-                },
-                "birthday": {
-                    "value": birthday_countdown,
-                    "color": "#FF9900"
-                },
-                "weather": {
-                    "value": weather,
-                    "color": "#3399FF"
-                },
-                "horoscope": {
-                    "value": horoscope,
-                    "color": "#9933CC"
-                },
-                "sweetWords": {
-                    "value": sweet_words,
-                    "color": "#FF6666"
-                },
-                "remark": {
-                    "value": "💖 永远爱你的我",
-                    "color": "#999999"
-                }
-            }
-        }
+        now = datetime.now()
+        template_data = TEMPLATE_SPEC.compile(TEMPLATE_ID).render_many([(USER_ID, {
+            'name': GF_NAME,
+            'date': now.strftime('%Y年%m月%d日'),
+            'weekday': weekdays[now.weekday()],
+            'birthday': birthday_countdown,
+            'weather': weather,
+            'horoscope': horoscope,
+            'sweet_words': sweet_words,
+        })])[0]
         
         url = f"https://api.weixin.qq.com/cgi-bin/message/template/send?access_token={access_token}"
         
         try:
-            response = requests.post(url, json=template_data, timeout=10)
+            response = http_client.post(url, data=dumps(template_data), headers=JSON_HEADERS)
             result = response.json()
             
             print(f"微信API响应: {result}")